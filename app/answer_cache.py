@@ -0,0 +1,143 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from knowledge_index import terms
+from uz_text import normalize
+
+# LLM answers to FAQ-style questions, reused for the same question asked again
+# in other words. A question matches a cached one exactly after normalization
+# (case, Cyrillic, apostrophes, punctuation), or lexically: the Jaccard
+# similarity of their stemmed term sets reaches the threshold. Answers belong
+# to one version of the knowledge base and are all dropped when it changes.
+# Questions of fewer than min_terms terms ("nega?") depend on the dialog
+# around them and are neither served nor stored.
+
+WORD = re.compile(r"[\w']+")
+
+
+def question_key(question):
+    return ' '.join(WORD.findall(normalize(question)))
+
+
+class CachedAnswer:
+    __slots__ = ('answer', 'terms', 'seconds')
+
+    def __init__(self, answer, question_terms, seconds):
+        self.answer = answer
+        self.terms = question_terms
+        # How long the LLM took for it, i.e. what a hit saves
+        self.seconds = seconds
+
+
+# LRU of at most max_entries answers; max_entries=0 turns the cache off
+class AnswerCache:
+    def __init__(self, max_entries=1000, threshold=0.75, min_terms=2):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.min_terms = min_terms
+        self.version = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # question key -> CachedAnswer
+        self._by_term = {}              # term -> question keys whose question has it
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_term.clear()
+            self.version = version
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        for term in entry.terms:
+            keys = self._by_term[term]
+            keys.discard(key)
+            if not keys:
+                del self._by_term[term]
+
+    def _similar(self, question_terms):
+        overlaps = {}
+        for term in question_terms:
+            for key in self._by_term.get(term, ()):
+                overlaps[key] = overlaps.get(key, 0) + 1
+        best, best_score = None, self.threshold
+        for key, overlap in overlaps.items():
+            score = overlap / (len(question_terms) + len(self._entries[key].terms) - overlap)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    # Cached answer for a question under a knowledge-base version, or None
+    def get(self, question, version):
+        if not self.max_entries:
+            return None
+        key = question_key(question)
+        question_terms = frozenset(terms(question))
+        if len(question_terms) < self.min_terms:
+            return None
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.exact_hits += 1
+            else:
+                key = self._similar(question_terms)
+                if key is None:
+                    self.misses += 1
+                    return None
+                entry = self._entries[key]
+                self.similar_hits += 1
+            self._entries.move_to_end(key)
+            self.saved_seconds += entry.seconds
+            return entry.answer
+
+    def put(self, question, version, answer, seconds=0.0):
+        if not self.max_entries or not answer:
+            return
+        key = question_key(question)
+        question_terms = frozenset(terms(question))
+        if len(question_terms) < self.min_terms:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CachedAnswer(answer, question_terms, seconds)
+            for term in question_terms:
+                self._by_term.setdefault(term, set()).add(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'saved_seconds': round(self.saved_seconds, 3),
+            }
+
+
+def answer_cache_from_env():
+    return AnswerCache(max_entries=int(os.getenv('ANSWER_CACHE_SIZE', '1000')),
+                       threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.75')))
@@ -1,32 +1,51 @@
-import pandas as pd
-import joblib
-import requests
-import re
+import json
 import os
+import re
+import time
 import uuid
-from together import Together
-from flask import Flask, request, jsonify, send_file
+from concurrent.futures import wait
+from flask import Flask, request, jsonify, send_file, Response, g, stream_with_context
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from mutagen.oggvorbis import OggVorbis
-import os
-import uuid
-from flask import Flask, request, jsonify, send_file
-from werkzeug.utils import secure_filename
+import audio_http
+from answer_cache import answer_cache_from_env
+import http_client
+import inbound_audio
+import intents
+import metrics
+import resilience
+import structured_log
+from customer_index import CustomerIndex
+from customer_store import CustomerStore
+from knowledge_index import knowledge_index_from_env
+from session_store import new_session_id, session_store_from_env, valid_session_id
+from stt_providers import stt_router_from_env
+from tts_cache import TTSCache, make_key
+from uz_text import uzbek_text_to_number
+from utterances import (ASK_ID, ASK_VALID_ID, CREDIT_LIMIT, ID_NOT_FOUND, LLM_UNAVAILABLE, STT_FAILED,
+                        Mp3SegmentStream, assemble_speech, speech_segments, static_texts)
+from tts_pipeline import TTSPipeline
+from uploads_janitor import UploadsJanitor
+from warmup import Warmup
+from linear_scorer import predict_columns
 
 # Load environment variables from .env file
 load_dotenv()
 
+log = structured_log.get_logger('app')
+
 # Initialize Flask app
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.request_class = inbound_audio.SpooledRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize Together client
+# Initialize Together client on the shared connection pool
 TOGETHER_API_KEY = os.getenv('TOGETHER_API_KEY')
 if not TOGETHER_API_KEY:
     raise ValueError("TOGETHER_API_KEY not found in .env file")
-client = Together(api_key=TOGETHER_API_KEY)
+client = http_client.together_client(TOGETHER_API_KEY)
 
 # API keys for STT and TTS
 STT_API_KEY = os.getenv('STT_API_KEY')
@@ -36,83 +55,166 @@ if not STT_API_KEY:
 if not TTS_API_KEY:
     raise ValueError("TTS_API_KEY not found in .env file")
 
-# Load bank information
-def load_bank_info(file_path=r'uploads/general_info.txt'):
-    if not os.path.exists(file_path):
-        return "Bank haqida ma'lumot fayli topilmadi."
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+# Speech-to-text providers raced per recording, fastest first
+stt_router = stt_router_from_env(STT_API_KEY, os.getenv('GEMINI_API_KEY'))
 
-bank_info = load_bank_info()
+# Bank knowledge; a prompt gets the passages relevant to the question, not the whole file
+knowledge = knowledge_index_from_env(r'uploads/general_info.txt')
+# LLM answers to questions asked before, for the current version of that knowledge
+answer_cache = answer_cache_from_env()
 
-# Load model and test data
-model = joblib.load(r'uploads/linear_regression_model.pkl')
-test_data = pd.read_csv(r'uploads/test_data2.csv')
+# Load model and test data; every customer's limit is predicted once up front
 features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
+customer_store = CustomerStore(r'uploads/customers.db', features)
+customer_index = CustomerIndex(r'uploads/linear_regression_model.pkl', r'uploads/test_data2.csv', features, store=customer_store)
 
 # Predict credit limit
+@metrics.timed('credit_lookup')
 def predict_limit_by_id(input_id):
-    if input_id not in test_data['ID'].values:
-        return f"ID {input_id} topilmadi."
-    input_data = test_data[test_data['ID'] == input_id][features]
-    predicted_limit = model.predict(input_data)[0]
+    predicted_limit = customer_index.lookup(input_id)
+    if predicted_limit is None:
+        return ID_NOT_FOUND.format(customer_id=input_id)
     return predicted_limit
 
-# Detect credit query
-def is_credit_query(message):
-    credit_keywords = ['kredit', 'qarz', 'limit', 'pul olish', 'kredit olish', 'kredit limiti']
-    return any(keyword.lower() in message.lower() for keyword in credit_keywords)
+# Batch scoring: items are scored in chunks so large requests are never held in memory whole
+BATCH_CHUNK_SIZE = 10000
+
+# Classify one batch item as a customer ID or a raw feature row
+def parse_batch_item(item):
+    if isinstance(item, dict):
+        if all(feature in item for feature in features):
+            return 'row', item
+        if 'id' not in item and 'ID' not in item:
+            return 'invalid', item
+        item = item.get('id', item.get('ID'))
+    if isinstance(item, bool):
+        return 'invalid', item
+    if isinstance(item, int):
+        return 'id', item
+    if isinstance(item, float) and item.is_integer():
+        return 'id', int(item)
+    if isinstance(item, str) and item.strip().isdigit():
+        return 'id', int(item)
+    return 'invalid', item
+
+# Score one chunk of parsed items: one vectorized lookup for IDs, one model.predict for rows
+def score_batch_chunk(items):
+    results = [None] * len(items)
+    id_slots = [i for i, (kind, _) in enumerate(items) if kind == 'id']
+    if id_slots:
+        limits, found = customer_index.lookup_many([items[i][1] for i in id_slots])
+        for slot, limit, ok in zip(id_slots, limits.tolist(), found.tolist()):
+            results[slot] = {'id': items[slot][1], 'limit': limit} if ok else {'id': items[slot][1], 'error': 'not_found'}
+    row_slots = [i for i, (kind, _) in enumerate(items) if kind == 'row']
+    if row_slots:
+        rows = [items[i][1] for i in row_slots]
+        model = customer_index.model
+        try:
+            predictions = predict_columns(model, {name: [row[name] for row in rows] for name in features}, features).tolist()
+        except Exception:
+            # Isolate the bad rows instead of failing the whole chunk
+            predictions = []
+            for row in rows:
+                try:
+                    predictions.append(predict_columns(model, {name: [row[name]] for name in features}, features)[0].item())
+                except Exception as e:
+                    predictions.append(e)
+        for slot, row, prediction in zip(row_slots, rows, predictions):
+            result = {'error': str(prediction)} if isinstance(prediction, Exception) else {'limit': prediction}
+            if 'id' in row or 'ID' in row:
+                result = {'id': row.get('id', row.get('ID')), **result}
+            results[slot] = result
+    for slot, (kind, value) in enumerate(items):
+        if kind == 'invalid':
+            results[slot] = {'item': value, 'error': 'invalid_item'}
+    return results
+
+# Yield NDJSON result lines for a stream of batch items, plus a closing summary line
+def iter_batch_results(raw_items):
+    not_found = []
+    index = 0
+    chunk = []
+
+    def flush():
+        nonlocal index
+        lines = []
+        for result in score_batch_chunk(chunk):
+            if result.get('error') == 'not_found':
+                not_found.append(result['id'])
+            lines.append(json.dumps({'index': index, **result}))
+            index += 1
+        chunk.clear()
+        return '\n'.join(lines) + '\n'
+
+    for item in raw_items:
+        chunk.append(parse_batch_item(item))
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            yield flush()
+    if chunk:
+        yield flush()
+    yield json.dumps({'count': index, 'not_found': not_found}) + '\n'
+
+# Read NDJSON items line by line from the request body
+def iter_ndjson_items(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {'error': 'invalid_json'}
 
 # Generate response using Together API
+LLM_MODEL = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
+
+# Raises when the LLM is unavailable; callers answer with LLM_UNAVAILABLE instead
+@metrics.timed('llm')
 def generate_response(prompt, chat_history):
     messages = chat_history + [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-        messages=messages
-    )
-    return response.choices[0].message.content
-
-# Parse Uzbek number words
-def uzbek_text_to_number(text):
-    number_map = {
-        'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
-        'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
-        'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
-        'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
-        'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
-    }
-    text = text.lower().replace('va', '').strip()
-    numeric_match = re.search(r'\b\d+\b', text)
-    if numeric_match:
-        try:
-            return int(numeric_match.group())
-        except ValueError:
-            pass
-    words = text.split()
-    number_words = []
-    for word in words:
-        if word in number_map:
-            number_words.append(word)
-        elif re.match(r'[\d]', word):
-            continue
-        else:
-            if number_words:
-                break
-    if not number_words:
-        return None
-    total = 0
-    current = 0
-    for word in number_words:
-        num = number_map[word]
-        if num in [100, 1000, 1000000]:
-            if current == 0:
-                current = 1
-            total += current * num
-            current = 0
-        else:
-            current += num
-    total += current
-    return total if total > 0 else None
+
+    def attempt(seconds):
+        response = http_client.chat_completion(
+            client, seconds,
+            model=LLM_MODEL,
+            messages=messages
+        )
+        return response.choices[0].message.content
+
+    return resilience.llm.call(attempt)
+
+def chunk_text(chunk):
+    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+        return chunk.choices[0].delta.content
+    return None
+
+# Stream the Together response: yields text pieces as they arrive. Opening the
+# stream up to its first piece is retried under the deadline; after that the
+# stream runs to its end
+def stream_response(prompt, chat_history):
+    messages = chat_history + [{"role": "user", "content": prompt}]
+
+    def attempt(seconds):
+        stream = iter(http_client.chat_completion(
+            client, seconds,
+            model=LLM_MODEL,
+            messages=messages,
+            stream=True
+        ))
+        for chunk in stream:
+            piece = chunk_text(chunk)
+            if piece:
+                return piece, stream
+        return None, stream
+
+    with metrics.stage('llm_first_token'):
+        first, stream = resilience.llm.call(attempt, discard=lambda result: getattr(result[1], 'close', lambda: None)())
+    if first:
+        yield first
+    for chunk in stream:
+        piece = chunk_text(chunk)
+        if piece:
+            yield piece
 
 # Get OGG file metadata
 def get_ogg_metadata(audio_path):
@@ -123,122 +225,442 @@ def get_ogg_metadata(audio_path):
         channels = audio.info.channels
         return {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
     except Exception as e:
-        print(f"Metadata error for {audio_path}: {str(e)}")
+        log.warning('ogg_metadata_failed', path=audio_path, error=str(e))
         return None
 
-# STT function
-def speech_to_text(audio_path):
-    # Log MP3 file details
-    print(f"Sending MP3 file: {audio_path}, size: {os.path.getsize(audio_path)} bytes")
-    # Note: MP3 metadata extraction requires a library like mutagen.mp3
-    # Since you want to avoid pydub, we'll skip detailed metadata for now
-    # If metadata is critical, consider using mutagen.mp3 (not pydub) later
+# STT function: audio is an open binary file, either the upload itself or a saved recording.
+# Aisha and, when GEMINI_API_KEY is set, Gemini are raced (see stt_providers)
+def speech_to_text(audio, filename):
+    log.debug('stt_request', filename=filename, bytes=inbound_audio.upload_size(audio))
+    with metrics.stage('stt'):
+        data = audio.read()
+        metrics.bytes_total.labels('stt_sent').inc(len(data))
+        return stt_router.transcribe(data, filename, 'audio/mpeg')
 
-    url = "https://back.aisha.group/api/v1/stt/post/"
-    headers = {"x-api-key": STT_API_KEY}
-    data = {
-        "title": f"recording_{uuid.uuid4()}",
-        "has_diarization": "false",
-        "language": "uz"
-    }
-    files = {"audio": open(audio_path, "rb")}
-    try:
-        response = requests.post(url, headers=headers, data=data, files=files)
-        print(f"STT Response Status: {response.status_code}")
-        print(f"STT Response Content: {response.text}")
-        if response.status_code == 200:
-            result = response.json()
-            transcript = result.get("transcript", "")
-            if not transcript:
-                print(f"STT Warning: Empty transcript received")
-                return None, "No speech detected in audio"
-            return transcript, None
-        else:
-            error_msg = response.json().get("error", "Unknown STT error")
-            print(f"STT Error: Status {response.status_code}, Response: {response.text}")
-            return None, error_msg
-    except Exception as e:
-        print(f"STT Exception: {str(e)}")
-        return None, str(e)
-    finally:
-        files["audio"].close()
+# STT of an uploaded recording, sent from the request body; it is only written
+# to uploads/ in disk mode or when sampled for debugging (see inbound_audio)
+def transcribe_upload(audio_file):
+    filename = secure_filename(f"recording_{uuid.uuid4()}.mp3")
+    stream = audio_file.stream
+    inbound_audio.received(stream)
+    if inbound_audio.keep_recording():
+        audio_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        with metrics.stage('upload_save'):
+            size = inbound_audio.save_recording(stream, audio_path)
+        log.info('recording_saved', path=audio_path, bytes=size)
+        uploads_janitor.track(audio_path, size)
+        if inbound_audio.MODE == 'disk':
+            with open(audio_path, 'rb') as audio:
+                return speech_to_text(audio, filename)
+    return speech_to_text(stream, filename)
 
-# TTS function
-def text_to_speech(text):
-    url = "https://back.aisha.group/api/v1/tts/post/"
+# TTS voice settings; every one of them is part of the audio cache key
+TTS_VOICE = {'model': 'gulnoza', 'fmt': 'mp3', 'rate': '16000', 'quality': '64k', 'channels': 'stereo', 'language': 'uz'}
+tts_cache = TTSCache(os.path.join(app.config['UPLOAD_FOLDER'], 'tts_cache'))
+
+# Headers and form fields of a TTS API request
+def tts_request(text):
     headers = {
         "x-api-key": TTS_API_KEY,
-        "X-Channels": "stereo",
-        "X-Quality": "64k",
-        "X-Rate": "16000",
-        "X-Format": "mp3"
+        "X-Channels": TTS_VOICE['channels'],
+        "X-Quality": TTS_VOICE['quality'],
+        "X-Rate": TTS_VOICE['rate'],
+        "X-Format": TTS_VOICE['fmt']
     }
     data = {
         "transcript": text,
-        "language": "uz",
-        "model": "gulnoza"
+        "language": TTS_VOICE['language'],
+        "model": TTS_VOICE['model']
     }
+    return headers, data
+
+AUDIO_CHUNK_BYTES = 16384
+
+# Call the TTS API and download the generated audio; the download's chunks are also
+# written to download as they arrive, so the audio can be streamed before it is complete
+def synthesize_speech(text, download=None):
+    url = http_client.aisha_url("/api/v1/tts/post/")
+    headers, data = tts_request(text)
+
+    def attempt(seconds):
+        response = http_client.post(url, headers=headers, data=data, timeout=http_client.timeouts(seconds))
+        resilience.raise_for_retry('tts', response.status_code)
+        return response
+
+    # Only the response headers are awaited here; the body is streamed below and never retried
+    def open_audio(audio_url):
+        def attempt(seconds):
+            response = http_client.get(audio_url, stream=True, timeout=http_client.timeouts(seconds))
+            if response.status_code in resilience.RETRY_STATUSES:
+                response.close()
+                resilience.raise_for_retry('tts', response.status_code)
+            return response
+        return resilience.tts.call(attempt, discard=lambda response: response.close())
+
     try:
-        response = requests.post(url, headers=headers, data=data)
-        print(f"TTS Response Status: {response.status_code}, Content: {response.text}")
+        with metrics.stage('tts_post'):
+            response = resilience.tts.call(attempt)
+        log.payload('tts_response', response.text, status=response.status_code)
         if response.status_code in (200, 201):
             response_data = response.json()
             audio_url = response_data.get("audio_path")
             if not audio_url:
-                print("TTS Error: No audio_path in response")
-                return None
-            audio_response = requests.get(audio_url)
-            if audio_response.status_code == 200:
-                output_file = os.path.join(app.config['UPLOAD_FOLDER'], f"output_{uuid.uuid4()}.mp3")
-                with open(output_file, "wb") as f:
-                    f.write(audio_response.content)
-                print(f"TTS Output saved: {output_file}")
-                return output_file
-            else:
-                print(f"TTS Audio Fetch Error: Status {audio_response.status_code}")
+                log.error('tts_failed', reason='no audio_path in response')
                 return None
+            with metrics.stage('tts_download'), open_audio(audio_url) as audio_response:
+                if audio_response.status_code != 200:
+                    log.error('tts_audio_fetch_failed', status=audio_response.status_code)
+                    return None
+                chunks = []
+                for chunk in audio_response.iter_content(AUDIO_CHUNK_BYTES):
+                    chunks.append(chunk)
+                    if download is not None:
+                        download.write(chunk)
+                audio = b''.join(chunks)
+                metrics.bytes_total.labels('tts_downloaded').inc(len(audio))
+                return audio
         else:
-            print(f"TTS Error: Status {response.status_code}, Response: {response.text}")
+            log.error('tts_failed', status=response.status_code, body=response.text)
             return None
     except Exception as e:
-        print(f"TTS Exception: {str(e)}")
+        log.error('tts_failed', error=str(e))
         return None
 
-# Chatbot class
+# Templated replies are assembled from pre-rendered segments when they are all cached;
+# anything else is synthesized while readers of the key can follow the download
+def render_speech(text, key):
+    audio = assemble_speech(text, lambda segment: tts_cache.get(make_key(segment, **TTS_VOICE)))
+    if audio:
+        return audio
+    download = tts_cache.start_download(key)
+    try:
+        audio = synthesize_speech(text, download)
+    finally:
+        tts_cache.end_download(key, download, bool(audio))
+    return audio
+
+# TTS function: returns the cache key of the audio, served from /tts/<key>.mp3
+def text_to_speech(text):
+    key = make_key(text, **TTS_VOICE)
+    audio = tts_cache.get_or_create(key, lambda: render_speech(text, key))
+    return key if audio else None
+
+# Longer replies are synthesized sentence by sentence so playback can start after the first one;
+# replies that are cached or assembled from templates are played whole
+def speak_whole(text):
+    return make_key(text, **TTS_VOICE) in tts_cache or speech_segments(text) is not None
+
+TTS_SEGMENT_TIMEOUT = float(os.getenv('TTS_SEGMENT_TIMEOUT', '30'))
+# Segments synthesized at once across all requests
+TTS_PIPELINE_WORKERS = int(os.getenv('TTS_PIPELINE_WORKERS', '32'))
+tts_pipeline = TTSPipeline(text_to_speech, lambda text: make_key(text, **TTS_VOICE), keep_whole=speak_whole,
+                           workers=TTS_PIPELINE_WORKERS)
+# Most segments named in one /tts/speech URL; a longer reply is streamed by its job id
+MAX_SPEECH_SEGMENTS = 24
+SPEECH_KEYS = re.compile(r'^[0-9a-f]{64}(-[0-9a-f]{64}){0,%d}$' % (MAX_SPEECH_SEGMENTS - 1))
+
+# Audio fields of a reply once its first segment is ready, or None when TTS failed. A single
+# segment is served as one file; otherwise audio_url streams all segments in order and
+# audio_segments lists them for clients that play a playlist. Once the reply's text is complete
+# the stream is named by its segments' cache keys, which any worker sharing the TTS cache
+# directory can serve; only the job of a turn still being generated (the SSE `audio` event)
+# is known to the worker running it alone
+def speech_fields(job, stream=False):
+    try:
+        with metrics.stage('tts_wait'):
+            first = job.first(resilience.remaining(TTS_SEGMENT_TIMEOUT))
+    except TimeoutError:
+        first = None
+    return job_speech(job, stream) if first else None
+
+def job_speech(job, stream=False):
+    segments = [f"/tts/{key}.mp3" for key in job.keys]
+    if len(segments) == 1 and not stream:
+        audio_url = segments[0]
+    elif job.closed and len(job.keys) <= MAX_SPEECH_SEGMENTS:
+        audio_url = f"/tts/speech/{'-'.join(job.keys)}.mp3"
+    else:
+        audio_url = f"/tts/stream/{job.id}.mp3"
+    return {'audio_url': audio_url, 'audio_segments': segments}
+
+# Cached audio of key or its download still in progress, as (audio, download); (None, None)
+# when there is no audio. A segment that is queued but not downloading yet is waited for; with
+# shared, so is one this worker is not synthesizing, until another worker stores it
+def find_audio(key, future=None, timeout=TTS_SEGMENT_TIMEOUT, shared=False):
+    deadline = time.monotonic() + timeout
+    future = future or tts_pipeline.pending(key)
+    while True:
+        download = tts_cache.download(key)
+        if download is not None:
+            return None, download
+        done = future.done() if future is not None else not shared
+        if key in tts_cache or done or time.monotonic() > deadline:
+            return tts_cache.get(key), None
+        if future is None:
+            time.sleep(0.05)
+        else:
+            wait([future], timeout=0.01)
+
+# One segment of a joined MP3 stream, sent as it downloads
+def iter_segment_audio(audio, download, first):
+    segment = Mp3SegmentStream(first=first)
+    for chunk in [audio] if download is None else download.iter_chunks(TTS_SEGMENT_TIMEOUT):
+        data = segment.feed(chunk)
+        if data:
+            yield data
+    data = segment.end()
+    if data:
+        yield data
+
+# Audio of a job's segments in order, as one MP3 byte stream
+def iter_job_audio(job):
+    yield from iter_segments_audio(job.queued(TTS_SEGMENT_TIMEOUT), job=job.id)
+
+# Audio of segments named by their keys, as one MP3 byte stream; segments may be synthesized by other workers
+def iter_keys_audio(keys):
+    yield from iter_segments_audio(((key, None) for key in keys), shared=True)
+
+def iter_segments_audio(segments, shared=False, **context):
+    try:
+        for i, (key, future) in enumerate(segments):
+            audio, download = find_audio(key, future, shared=shared)
+            if audio is None and download is None:
+                log.warning('tts_stream_failed', segment=i, **context)
+                return
+            yield from iter_segment_audio(audio, download, first=i == 0)
+    except (TimeoutError, IOError) as e:
+        log.warning('tts_stream_failed', error=str(e), **context)
+
+# Audio still downloading from the TTS API, passed through as it arrives
+def iter_download(download):
+    try:
+        yield from download.iter_chunks(TTS_SEGMENT_TIMEOUT)
+    except (TimeoutError, IOError) as e:
+        log.warning('tts_stream_failed', error=str(e))
+
+# Pre-synthesize every canned reply in the background; /ready reports when they are cached
+warmup = Warmup(static_texts(), lambda text: text_to_speech(text) is not None)
+if os.getenv('TTS_WARMUP', '1') != '0':
+    warmup.start()
+else:
+    warmup.skip()
+
+# Old recordings and TTS outputs in uploads/ are removed in the background; models and data are never touched
+uploads_janitor = UploadsJanitor(app.config['UPLOAD_FOLDER'],
+                                 max_age=float(os.getenv('UPLOADS_MAX_AGE', str(7 * 24 * 3600))),
+                                 max_files=int(os.getenv('UPLOADS_MAX_FILES', '2000')),
+                                 max_bytes=int(os.getenv('UPLOADS_MAX_BYTES', str(512 * 2**20))))
+if os.getenv('UPLOADS_JANITOR', '1') != '0':
+    uploads_janitor.start()
+
+# Conversation state per browser session, keyed by the session cookie
+SESSION_COOKIE = 'sid'
+session_store = session_store_from_env(os.path.join(app.config['UPLOAD_FOLDER'], 'sessions.db'))
+
+# Counters the caches, uploads and upstream policies keep, read by /metrics when scraped
+metrics.stats_collector('voice_tts_cache', 'TTS audio cache', tts_cache.stats,
+                        counters=('memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions',
+                                  'expired', 'stores', 'adopted'),
+                        gauges=('memory_entries', 'memory_bytes', 'disk_entries', 'disk_bytes'))
+metrics.stats_collector('voice_answer_cache', 'LLM answer cache', answer_cache.stats,
+                        counters=('exact_hits', 'similar_hits', 'misses', 'stores', 'evictions', 'invalidations'),
+                        gauges=('entries',))
+metrics.stats_collector('voice_sessions', 'Session store', session_store.stats,
+                        counters=('loads', 'hits', 'saves', 'expired', 'evicted'), gauges=('sessions', 'bytes'))
+metrics.stats_collector('voice_uploads', 'Uploaded recordings', inbound_audio.stats,
+                        counters=('uploads', 'upload_bytes', 'spooled', 'saved', 'saved_bytes'))
+metrics.stats_collector('voice_upstream', 'Upstream calls', resilience.stats, label='upstream',
+                        counters=('calls', 'attempts', 'retries', 'hedged', 'hedge_wins', 'failures',
+                                  'short_circuits', 'deadline_exceeded', 'circuit_opens'))
+metrics.stats_collector('voice_stt', 'Speech-to-text providers', stt_router.stats, label='provider',
+                        counters=('transcripts', 'started', 'wins', 'empty', 'failures', 'cancelled'),
+                        gauges=('success_rate',))
+metrics.stats_collector('voice_log', 'Log records', structured_log.stats,
+                        counters=('logged', 'dropped', 'sampled_out'), gauges=('queued',))
+
+# Chatbot class: one short-lived instance per request around the caller's stored session
 class BankChatbot:
-    def __init__(self):
-        self.chat_history = []
-        self.waiting_for_id = False
+    def __init__(self, session, store):
+        self.session = session
+        self.store = store
+        # The question sent to the LLM this turn, if any
+        self.question = None
 
-    def process_message(self, user_input):
-        self.chat_history.append({"role": "user", "content": user_input})
-        if self.waiting_for_id:
+    @property
+    def chat_history(self):
+        return self.session.messages()
+
+    # Routing step: returns (response, None) when the dialog answers locally,
+    # or (None, prompt) when the LLM has to answer
+    @metrics.timed('intent')
+    def route_message(self, user_input):
+        session = self.session
+        session.add('user', user_input)
+        if session.waiting_for_id:
             parsed_id = uzbek_text_to_number(user_input)
             if parsed_id is not None:
                 prediction = predict_limit_by_id(parsed_id)
                 if isinstance(prediction, str):
                     response = prediction
                 else:
-                    response = f"ID {parsed_id} uchun taxminiy kredit limiti: {prediction:.2f} dollar. Sizga bir yil muddatga ushbu miqdorda kredit berishimiz mumkin."
-                self.waiting_for_id = False
+                    response = CREDIT_LIMIT.format(customer_id=parsed_id, limit=prediction)
+                session.waiting_for_id = False
             else:
-                response = "Iltimos, to'g'ri ID raqamini kiriting (raqamlar yoki so'zlar bilan, masalan, '127' yoki 'bir yuz yigirma yetti')."
+                response = ASK_VALID_ID
         else:
-            if is_credit_query(user_input):
-                self.waiting_for_id = True
-                response = "Kredit limiti haqida ma'lumot olish uchun ID raqamingizni kiriting (raqamlar yoki so'zlar bilan, masalan, '127' yoki 'bir yuz yigirma yetti')."
+            if intents.scan(user_input) & intents.CREDIT:
+                session.waiting_for_id = True
+                response = ASK_ID
             else:
-                prompt = f"Quyidagi ma'lumot asosida savolga javob bering:\n{bank_info}\n\nSavol: {user_input}"
-                response = generate_response(prompt, self.chat_history)
-        self.chat_history.append({"role": "assistant", "content": response})
-        if len(self.chat_history) > 10:
-            self.chat_history = self.chat_history[-10:]
+                # An edited knowledge file must change the version before cached answers are served
+                knowledge.refresh_if_changed()
+                response = answer_cache.get(user_input, knowledge.version)
+                if response is None:
+                    # Cached answers are served to every session, so only one generated without
+                    # earlier turns is kept; later ones may repeat this caller's credit limit
+                    if len(session.turns) == 1:
+                        self.question = user_input
+                    prompt = f"Quyidagi ma'lumot asosida savolga javob bering:\n{knowledge.context(user_input)}\n\nSavol: {user_input}"
+                    return None, prompt
+        return response, None
+
+    # Keep a complete LLM answer for the next time the question is asked
+    def remember_answer(self, response, seconds):
+        if self.question:
+            answer_cache.put(self.question, knowledge.version, response, seconds)
+
+    def finish_message(self, response):
+        if response:
+            self.session.add('assistant', response)
+        self.store.save(self.session)
         return response
 
-# Initialize chatbot
-chatbot = BankChatbot()
+    def process_message(self, user_input):
+        response, prompt = self.route_message(user_input)
+        if prompt is not None:
+            started = time.monotonic()
+            try:
+                response = generate_response(prompt, self.chat_history)
+            except Exception as e:
+                log.error('llm_failed', error=str(e))
+                response = LLM_UNAVAILABLE
+            else:
+                self.remember_answer(response, time.monotonic() - started)
+        return self.finish_message(response)
+
+    # Same turn as process_message, yielding the response as it streams in; whatever
+    # was generated is written to the history even if the client goes away mid-answer
+    def stream_message(self, user_input):
+        response, prompt = self.route_message(user_input)
+        if prompt is None:
+            try:
+                yield response
+            finally:
+                self.finish_message(response)
+            return
+        pieces = []
+        started = time.monotonic()
+        try:
+            for piece in stream_response(prompt, self.chat_history):
+                pieces.append(piece)
+                yield piece
+            self.remember_answer(''.join(pieces), time.monotonic() - started)
+        except Exception as e:
+            # Nothing was said yet: answer with the canned reply instead
+            if pieces:
+                raise
+            log.error('llm_failed', error=str(e))
+            pieces.append(LLM_UNAVAILABLE)
+            yield LLM_UNAVAILABLE
+        finally:
+            self.finish_message(''.join(pieces))
+
+# Chatbot over the stored session of a session id; unknown ids start an empty session
+def load_chatbot(sid):
+    return BankChatbot(session_store.load(sid), session_store)
+
+# Session id from the request cookie, or a new one that after_request sends back
+def request_session_id():
+    sid = request.cookies.get(SESSION_COOKIE)
+    if not valid_session_id(sid):
+        sid = g.new_session_id = new_session_id()
+    return sid
+
+# One deadline per request for STT, the LLM and the first TTS segment together, and the
+# id its log lines are grouped by
+@app.before_request
+def start_deadline():
+    resilience.start_deadline()
+    g.started = metrics.start_request()
+    g.request_id = structured_log.start_request(request.headers.get(structured_log.REQUEST_ID_HEADER))
+
+@app.teardown_request
+def end_deadline(error=None):
+    resilience.end_deadline()
+    metrics.end_request()
+    structured_log.end_request()
+
+# Stages of this request so far; a streamed response only has those before its body
+@app.after_request
+def add_server_timing(response):
+    response.headers['Server-Timing'] = metrics.server_timing(g.started)
+    response.headers[structured_log.REQUEST_ID_HEADER] = g.request_id
+    metrics.observe_request(request.url_rule.rule if request.url_rule else 'unmatched', response.status_code, g.started)
+    return response
+
+@app.after_request
+def set_session_cookie(response):
+    sid = g.get('new_session_id')
+    if sid:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite='Lax')
+    return response
+
+# Server-Sent Events
+def sse_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Events of one streamed turn: the transcript, each response piece as it arrives, the audio
+# stream URL as soon as the first sentence is queued for TTS, then the same payload
+# /process_text returns plus timings measured from the request start
+def iter_turn_events(transcript, response_pieces, started):
+    yield sse_event('transcript', {'transcript': transcript})
+    job = tts_pipeline.start()
+    pieces = []
+    first_token = None
+    try:
+        for piece in response_pieces:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            pieces.append(piece)
+            yield sse_event('token', {'text': piece})
+            queued = len(job.keys)
+            job.feed(piece)
+            if not queued and job.keys:
+                yield sse_event('audio', {'audio_url': f"/tts/stream/{job.id}.mp3"})
+    except Exception as e:
+        log.error('llm_stream_failed', error=str(e), generated_chars=sum(map(len, pieces)))
+        yield sse_event('error', {'transcript': transcript, 'response': ''.join(pieces), 'error': str(e)})
+        return
+    finally:
+        job.close()
+    response_text = ''.join(pieces)
+    generated = time.perf_counter() - started
+    yield done_event(transcript, response_text, speech_fields(job, stream=True), started, first_token, generated)
+
+# Final event of a streamed turn; first_token is None when nothing was generated
+def done_event(transcript, response_text, speech, started, first_token, generated):
+    if first_token is None:
+        first_token = generated
+    result = {'transcript': transcript, 'response': response_text, **(speech or {'audio_url': None})}
+    if not speech:
+        result['error'] = 'TTS failed to generate audio'
+    result['timing'] = {'first_token': first_token, 'response': generated, 'total': time.perf_counter() - started}
+    log.info('stream_timing', first_token_ms=round(first_token * 1000), response_ms=round(generated * 1000),
+             total_ms=round(result['timing']['total'] * 1000))
+    return sse_event('done', result)
 
-# Flask routes
 @app.route('/')
 def index():
     return send_file('templates/index.html')
@@ -247,18 +669,12 @@ def index():
 def process_audio():
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file provided'}), 400
-    audio_file = request.files['audio']
-    filename = secure_filename(f"recording_{uuid.uuid4()}.mp3")  # Changed to .mp3
-    audio_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    audio_file.save(audio_path)
-    print(f"Saved MP3 file: {audio_path}, size: {os.path.getsize(audio_path)} bytes")
-
     # STT
-    transcript, error = speech_to_text(audio_path)
+    transcript, error = transcribe_upload(request.files['audio'])
     if not transcript:
-        response_text = error or "Ovozni aniqlashda xatolik yuz berdi. Iltimos, aniq va baland ovozda gapiring."
-        tts_path = text_to_speech(response_text)
-        if not tts_path:
+        response_text = error or STT_FAILED
+        speech = speech_fields(tts_pipeline.submit(response_text))
+        if not speech:
             return jsonify({
                 'transcript': transcript,
                 'response': response_text,
@@ -268,13 +684,13 @@ def process_audio():
         return jsonify({
             'transcript': transcript,
             'response': response_text,
-            'audio_url': f"/uploads/{os.path.basename(tts_path)}"
+            **speech
         })
 
     # Process with chatbot
-    response_text = chatbot.process_message(transcript)
-    tts_path = text_to_speech(response_text)
-    if not tts_path:
+    response_text = load_chatbot(request_session_id()).process_message(transcript)
+    speech = speech_fields(tts_pipeline.submit(response_text))
+    if not speech:
         return jsonify({
             'transcript': transcript,
             'response': response_text,
@@ -285,7 +701,7 @@ def process_audio():
     return jsonify({
         'transcript': transcript,
         'response': response_text,
-        'audio_url': f"/uploads/{os.path.basename(tts_path)}"
+        **speech
     })
 
 @app.route('/process_text', methods=['POST'])
@@ -294,9 +710,9 @@ def process_text():
     if not data or 'text' not in data:
         return jsonify({'error': 'No text provided'}), 400
     text_input = data['text']
-    response_text = chatbot.process_message(text_input)
-    tts_path = text_to_speech(response_text)
-    if not tts_path:
+    response_text = load_chatbot(request_session_id()).process_message(text_input)
+    speech = speech_fields(tts_pipeline.submit(response_text))
+    if not speech:
         return jsonify({
             'transcript': text_input,
             'response': response_text,
@@ -306,9 +722,134 @@ def process_text():
     return jsonify({
         'transcript': text_input,
         'response': response_text,
-        'audio_url': f"/uploads/{os.path.basename(tts_path)}"
+        **speech
     })
 
+@app.route('/process_text_stream', methods=['POST'])
+def process_text_stream():
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not data or 'text' not in data:
+        return jsonify({'error': 'No text provided'}), 400
+    text_input = data['text']
+    chatbot = load_chatbot(request_session_id())
+    events = iter_turn_events(text_input, chatbot.stream_message(text_input), started)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/process_audio_stream', methods=['POST'])
+def process_audio_stream():
+    started = time.perf_counter()
+    if 'audio' not in request.files:
+        return jsonify({'error': 'No audio file provided'}), 400
+    transcript, error = transcribe_upload(request.files['audio'])
+    if not transcript:
+        events = iter_turn_events(transcript, [error or STT_FAILED], started)
+    else:
+        chatbot = load_chatbot(request_session_id())
+        events = iter_turn_events(transcript, chatbot.stream_message(transcript), started)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    # NDJSON bodies are streamed; a JSON object with "ids" and/or "rows" lists is also accepted
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        raw_items = iter_ndjson_items(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not ('ids' in data or 'rows' in data):
+            return jsonify({'error': 'Provide NDJSON lines or a JSON object with "ids" or "rows"'}), 400
+        raw_items = list(data.get('ids') or []) + list(data.get('rows') or [])
+    return Response(stream_with_context(iter_batch_results(raw_items)), mimetype='application/x-ndjson')
+
+@app.route('/customers', methods=['POST'])
+def upsert_customers():
+    # One customer object or a list of them; running workers pick the change up on their next lookup
+    data = request.get_json(silent=True)
+    rows = data if isinstance(data, list) else [data]
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        return jsonify({'error': 'Provide a customer object or a list of customer objects'}), 400
+    try:
+        # Score first so rows the model cannot handle never reach the store
+        predict_columns(customer_index.model, {name: [row[name] for row in rows] for name in features}, features)
+        version = customer_store.upsert_many(rows)
+    except KeyError as e:
+        return jsonify({'error': f"Missing field: {e.args[0]}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'upserted': len(rows), 'version': version})
+
+@app.route('/tts/<key>.mp3')
+def serve_tts(key):
+    # Playlist entries can be requested before their segment is synthesized
+    audio, download = find_audio(key)
+    if download is not None:
+        if 'Range' not in request.headers:
+            return Response(stream_with_context(iter_download(download)), headers=audio_http.STREAMING_HEADERS)
+        # A range needs the complete file
+        try:
+            audio = b''.join(download.iter_chunks(TTS_SEGMENT_TIMEOUT))
+        except (TimeoutError, IOError):
+            audio = None
+    if audio is None:
+        return jsonify({'error': 'Audio not found'}), 404
+    status, headers, start, end = audio_http.audio_response(audio, request.headers)
+    return Response(audio[start:end], status=status, headers=headers)
+
+# Jobs live in the worker that ran the turn: under several workers, a request that reaches
+# another one gets 404 and the client plays the reply's /tts/speech URL instead
+@app.route('/tts/stream/<job_id>.mp3')
+def serve_tts_stream(job_id):
+    job = tts_pipeline.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Audio not found'}), 404
+    return Response(stream_with_context(iter_job_audio(job)), headers=audio_http.STREAMING_HEADERS)
+
+# A complete reply's segments in order, by their cache keys; served by any worker
+@app.route('/tts/speech/<keys>.mp3')
+def serve_tts_speech(keys):
+    if not SPEECH_KEYS.match(keys):
+        return jsonify({'error': 'Audio not found'}), 404
+    return Response(stream_with_context(iter_keys_audio(keys.split('-'))), headers=audio_http.STREAMING_HEADERS)
+
+@app.route('/ready')
+def ready():
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/tts/stats')
+def tts_stats():
+    return jsonify(tts_cache.stats())
+
+@app.route('/sessions/stats')
+def session_stats():
+    return jsonify(session_store.stats())
+
+@app.route('/uploads/stats')
+def uploads_stats():
+    return jsonify(uploads_janitor.stats())
+
+@app.route('/knowledge/stats')
+def knowledge_stats():
+    return jsonify(knowledge.stats())
+
+@app.route('/answers/stats')
+def answer_stats():
+    return jsonify(answer_cache.stats())
+
+# Prometheus scrape of the stage histograms, request and byte counters, and the counters
+# the caches and upstream policies keep (registered above, after the session store)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/upstreams/stats')
+def upstream_stats():
+    return jsonify(resilience.stats())
+
+@app.route('/stt/stats')
+def stt_stats():
+    return jsonify(stt_router.stats())
+
 @app.route('/uploads/<filename>')
 def serve_audio(filename):
     return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename))
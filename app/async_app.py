@@ -0,0 +1,661 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+import app as sync_app
+import audio_http
+import http_client
+import inbound_audio
+import metrics
+import resilience
+import structured_log
+from tts_cache import make_key
+from session_store import new_session_id, valid_session_id
+from tts_pipeline import TTSPipeline
+from utterances import LLM_UNAVAILABLE, STT_FAILED, Mp3SegmentStream, assemble_speech
+
+# asyncio version of the voice endpoints. /process_audio, /process_text and
+# their SSE variants keep the Flask request/response contract, but the STT,
+# LLM, TTS and audio-download calls are awaited on one aiohttp session, so a
+# waiting request holds no thread. The session store, the customer index, the
+# TTS cache and the warm-up are shared with app.py.
+#
+#   python async_app.py --port 5000
+
+HTTP_SESSION = web.AppKey('http_session', aiohttp.ClientSession)
+TTS_PIPELINE = web.AppKey('tts_pipeline', TTSPipeline)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(32 * 2**20)))
+# Segments synthesized at once; coroutines rather than threads, so far more than app.py allows
+TTS_PIPELINE_WORKERS = int(os.getenv('ASYNC_TTS_PIPELINE_WORKERS', '128'))
+LLM_TIMEOUT = aiohttp.ClientTimeout(sock_connect=http_client.CONNECT_TIMEOUT, sock_read=http_client.LLM_READ_TIMEOUT)
+
+log = structured_log.get_logger('async_app')
+
+# TTS requests being synthesized right now, so concurrent callers share one upstream call
+tts_inflight = {}
+
+
+# STT from in-memory audio bytes, raced across providers like app.speech_to_text
+async def speech_to_text(http, audio, filename):
+    log.debug('stt_request', filename=filename, bytes=len(audio))
+    metrics.bytes_total.labels('stt_sent').inc(len(audio))
+    with metrics.stage('stt'):
+        return await sync_app.stt_router.transcribe_async(http, audio, filename, 'audio/mpeg')
+
+
+# Generate response using the Together chat completions API
+async def generate_response(http, prompt, chat_history):
+    messages = chat_history + [{"role": "user", "content": prompt}]
+
+    async def attempt(seconds):
+        async with http.post(http_client.together_url('/chat/completions'),
+                             headers={"Authorization": f"Bearer {sync_app.TOGETHER_API_KEY}"},
+                             json={"model": sync_app.LLM_MODEL, "messages": messages},
+                             timeout=LLM_TIMEOUT) as response:
+            resilience.raise_for_retry('llm', response.status)
+            response.raise_for_status()
+            result = await response.json()
+        return result['choices'][0]['message']['content']
+
+    with metrics.stage('llm'):
+        return await resilience.llm.async_call(attempt)
+
+
+# Text pieces of a streamed chat completion
+async def chat_pieces(response):
+    async for line in response.content:
+        line = line.strip()
+        if not line.startswith(b'data:'):
+            continue
+        data = line[5:].strip()
+        if data == b'[DONE]':
+            break
+        choices = json.loads(data).get('choices') or [{}]
+        content = (choices[0].get('delta') or {}).get('content')
+        if content:
+            yield content
+
+
+# Stream the Together response: yields text pieces as they arrive. Opening the
+# stream up to its first piece is retried under the deadline, see app.stream_response
+async def stream_response(http, prompt, chat_history):
+    messages = chat_history + [{"role": "user", "content": prompt}]
+
+    async def attempt(seconds):
+        response = await http.post(http_client.together_url('/chat/completions'),
+                                   headers={"Authorization": f"Bearer {sync_app.TOGETHER_API_KEY}"},
+                                   json={"model": sync_app.LLM_MODEL, "messages": messages, "stream": True},
+                                   timeout=LLM_TIMEOUT)
+        try:
+            resilience.raise_for_retry('llm', response.status)
+            response.raise_for_status()
+            pieces = chat_pieces(response)
+            return await anext(pieces, None), pieces, response
+        except BaseException:
+            response.release()
+            raise
+
+    with metrics.stage('llm_first_token'):
+        first, pieces, response = await resilience.llm.async_call(attempt)
+    try:
+        if first:
+            yield first
+        async for piece in pieces:
+            yield piece
+    finally:
+        response.release()
+
+
+# Call the TTS API and download the generated audio, see app.synthesize_speech
+async def synthesize_speech(http, text, download=None):
+    headers, data = sync_app.tts_request(text)
+
+    async def attempt(seconds):
+        async with http.post(http_client.aisha_url("/api/v1/tts/post/"), headers=headers, data=data) as response:
+            body = await response.text()
+            resilience.raise_for_retry('tts', response.status)
+            return response.status, body
+
+    # Only the response headers are awaited here; the body is streamed below and never retried
+    async def open_audio(seconds):
+        response = await http.get(audio_url)
+        if response.status in resilience.RETRY_STATUSES:
+            response.release()
+            resilience.raise_for_retry('tts', response.status)
+        return response
+
+    try:
+        with metrics.stage('tts_post'):
+            status, body = await resilience.tts.async_call(attempt)
+        log.payload('tts_response', body, status=status)
+        if status not in (200, 201):
+            log.error('tts_failed', status=status, body=body)
+            return None
+        audio_url = json.loads(body).get("audio_path")
+        if not audio_url:
+            log.error('tts_failed', reason='no audio_path in response')
+            return None
+        with metrics.stage('tts_download'):
+            async with await resilience.tts.async_call(open_audio) as audio_response:
+                if audio_response.status != 200:
+                    log.error('tts_audio_fetch_failed', status=audio_response.status)
+                    return None
+                chunks = []
+                async for chunk in audio_response.content.iter_any():
+                    chunks.append(chunk)
+                    if download is not None:
+                        download.write(chunk)
+                audio = b''.join(chunks)
+        metrics.bytes_total.labels('tts_downloaded').inc(len(audio))
+        return audio
+    except Exception as e:
+        log.error('tts_failed', error=str(e))
+        return None
+
+
+async def render_speech(http, key, text):
+    audio = await asyncio.to_thread(
+        assemble_speech, text, lambda segment: sync_app.tts_cache.get(make_key(segment, **sync_app.TTS_VOICE)))
+    if audio is not None:
+        await asyncio.to_thread(sync_app.tts_cache.put, key, audio)
+        return audio
+    # Readers of the key follow the download until the audio is stored
+    download = sync_app.tts_cache.start_download(key)
+    try:
+        audio = await synthesize_speech(http, text, download)
+        if audio:
+            await asyncio.to_thread(sync_app.tts_cache.put, key, audio)
+    finally:
+        sync_app.tts_cache.end_download(key, download, bool(audio))
+    return audio
+
+
+# TTS function: returns the cache key of the audio, served from /tts/<key>.mp3
+async def text_to_speech(http, text):
+    key = make_key(text, **sync_app.TTS_VOICE)
+    if await asyncio.to_thread(sync_app.tts_cache.get, key) is not None:
+        return key
+    task = tts_inflight.get(key)
+    if task is None:
+        task = tts_inflight[key] = asyncio.ensure_future(render_speech(http, key, text))
+        task.add_done_callback(lambda _: tts_inflight.pop(key, None))
+    # A caller that disconnects must not cancel the synthesis others are waiting on
+    audio = await asyncio.shield(task)
+    return key if audio else None
+
+
+# Dialog turn: loading the session and routing run off the loop (either may touch
+# SQLite or reload the customer index), the LLM call is awaited
+async def process_message(http, sid, user_input):
+    chatbot = await asyncio.to_thread(sync_app.load_chatbot, sid)
+    response, prompt = await asyncio.to_thread(chatbot.route_message, user_input)
+    if prompt is not None:
+        started = time.monotonic()
+        try:
+            response = await generate_response(http, prompt, chatbot.chat_history)
+        except Exception as e:
+            log.error('llm_failed', error=str(e))
+            response = LLM_UNAVAILABLE
+        else:
+            chatbot.remember_answer(response, time.monotonic() - started)
+    return await asyncio.to_thread(chatbot.finish_message, response)
+
+
+# Streamed dialog turn, see BankChatbot.stream_message
+async def stream_message(http, sid, user_input):
+    chatbot = await asyncio.to_thread(sync_app.load_chatbot, sid)
+    response, prompt = await asyncio.to_thread(chatbot.route_message, user_input)
+    if prompt is None:
+        try:
+            yield response
+        finally:
+            await asyncio.to_thread(chatbot.finish_message, response)
+        return
+    pieces = []
+    started = time.monotonic()
+    try:
+        async for piece in stream_response(http, prompt, chatbot.chat_history):
+            pieces.append(piece)
+            yield piece
+        chatbot.remember_answer(''.join(pieces), time.monotonic() - started)
+    except Exception as e:
+        if pieces:
+            raise
+        log.error('llm_failed', error=str(e))
+        pieces.append(LLM_UNAVAILABLE)
+        yield LLM_UNAVAILABLE
+    finally:
+        await asyncio.to_thread(chatbot.finish_message, ''.join(pieces))
+
+
+# Session id from the request cookie, or a new one that set_session_cookie sends back
+def request_session_id(request):
+    sid = request.cookies.get(sync_app.SESSION_COOKIE)
+    if not valid_session_id(sid):
+        sid = request['new_session_id'] = new_session_id()
+    return sid
+
+
+# Runs for JSON and streamed responses alike, before their headers are sent; the header is
+# added directly because response.cookies are already serialized at this point
+async def set_session_cookie(request, response):
+    sid = request.get('new_session_id')
+    if sid:
+        response.headers.add('Set-Cookie', f"{sync_app.SESSION_COOKIE}={sid}; HttpOnly; Path=/; SameSite=Lax")
+
+
+# Each request handler runs in its own task, so the deadline, stage timings and log
+# request id set here are that request's alone
+@web.middleware
+async def request_deadline(request, handler):
+    resilience.start_deadline()
+    request['started'] = metrics.start_request()
+    request['request_id'] = structured_log.start_request(request.headers.get(structured_log.REQUEST_ID_HEADER))
+    return await handler(request)
+
+
+# Stages of this request until its headers are sent, see app.add_server_timing; runs in
+# the handler's task, so the timings are the ones request_deadline started
+async def add_server_timing(request, response):
+    started = request.get('started')
+    if started is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(started)
+        response.headers[structured_log.REQUEST_ID_HEADER] = request['request_id']
+        resource = request.match_info.route.resource
+        metrics.observe_request(resource.canonical if resource else 'unmatched', response.status, started)
+
+
+async def single_piece(text):
+    yield text
+
+
+# Write the events of one streamed turn, see app.iter_turn_events
+async def stream_turn(request, transcript, response_pieces, started):
+    job = request.app[TTS_PIPELINE].start()
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', **sync_app.SSE_HEADERS})
+    await response.prepare(request)
+    await response.write(sync_app.sse_event('transcript', {'transcript': transcript}).encode('utf-8'))
+    pieces = []
+    first_token = None
+    try:
+        async for piece in response_pieces:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            pieces.append(piece)
+            await response.write(sync_app.sse_event('token', {'text': piece}).encode('utf-8'))
+            queued = len(job.keys)
+            job.feed(piece)
+            if not queued and job.keys:
+                event = sync_app.sse_event('audio', {'audio_url': f"/tts/stream/{job.id}.mp3"})
+                await response.write(event.encode('utf-8'))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        log.error('llm_stream_failed', error=str(e), generated_chars=sum(map(len, pieces)))
+        event = sync_app.sse_event('error', {'transcript': transcript, 'response': ''.join(pieces), 'error': str(e)})
+        await response.write(event.encode('utf-8'))
+        return response
+    finally:
+        job.close()
+    response_text = ''.join(pieces)
+    generated = time.perf_counter() - started
+    speech = await speech_fields(job, stream=True)
+    event = sync_app.done_event(transcript, response_text, speech, started, first_token, generated)
+    await response.write(event.encode('utf-8'))
+    return response
+
+
+# (key, future) per segment of a job in order as it is queued, see SpeechJob.queued. Streamed
+# jobs are fed on this loop, so a segment that is not queued yet is polled for
+async def job_segments(job, timeout=sync_app.TTS_SEGMENT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    i = 0
+    while True:
+        segment = job.segment(i)
+        if segment is None:
+            if job.closed:
+                return
+            if loop.time() > deadline:
+                raise TimeoutError(f"TTS segment {i} of job {job.id} not queued in time")
+            await asyncio.sleep(0.02)
+            continue
+        yield segment
+        deadline = loop.time() + timeout
+        i += 1
+
+
+# (key, result) per segment of a job in order, see SpeechJob.results. Segment futures are
+# awaited directly, so waiting holds no thread
+async def job_results(job, timeout=sync_app.TTS_SEGMENT_TIMEOUT):
+    async for key, future in job_segments(job, timeout):
+        # Shielded: a timeout here must not cancel a segment other jobs share
+        yield key, await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+
+
+# Cached audio of key or its download in progress, see app.find_audio
+async def find_audio(pipeline, key, future=None, timeout=sync_app.TTS_SEGMENT_TIMEOUT, shared=False):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    future = future or pipeline.pending(key)
+    while True:
+        download = sync_app.tts_cache.download(key)
+        if download is not None:
+            return None, download
+        done = future.done() if future is not None else not shared
+        if key in sync_app.tts_cache or done or loop.time() > deadline:
+            return await asyncio.to_thread(sync_app.tts_cache.get, key), None
+        await asyncio.sleep(0.02 if future is not None else 0.05)
+
+
+# Chunks of a download as they arrive, see Download.iter_chunks; polled, so waiting holds no thread
+async def download_chunks(download, timeout=sync_app.TTS_SEGMENT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    i = 0
+    while True:
+        chunks, done, ok = download.read(i)
+        for chunk in chunks:
+            yield chunk
+        i += len(chunks)
+        if done:
+            if not ok:
+                raise IOError("TTS audio download failed")
+            return
+        if chunks:
+            deadline = loop.time() + timeout
+        elif loop.time() > deadline:
+            raise TimeoutError("TTS audio download stalled")
+        await asyncio.sleep(0.02)
+
+
+# Audio fields of a reply once its first segment is ready, see app.speech_fields
+async def speech_fields(job, stream=False):
+    first = None
+    try:
+        with metrics.stage('tts_wait'):
+            async for _, first in job_results(job, resilience.remaining(sync_app.TTS_SEGMENT_TIMEOUT)):
+                break
+    except TimeoutError:
+        first = None
+    return sync_app.job_speech(job, stream) if first else None
+
+
+async def reply(application, transcript, response_text):
+    job = application[TTS_PIPELINE].submit(response_text)
+    speech = await speech_fields(job)
+    if not speech:
+        return web.json_response({
+            'transcript': transcript,
+            'response': response_text,
+            'audio_url': None,
+            'error': 'TTS failed to generate audio'
+        })
+    return web.json_response({
+        'transcript': transcript,
+        'response': response_text,
+        **speech
+    })
+
+
+def read_recording(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# STT of an uploaded recording, see app.transcribe_upload. request.post() keeps file
+# fields in memory up to aiohttp's own 1 MiB spool limit
+async def transcribe_upload(http, audio_field):
+    filename = f"recording_{uuid.uuid4()}.mp3"
+    stream = audio_field.file
+    inbound_audio.received(stream)
+    if inbound_audio.keep_recording():
+        audio_path = os.path.join(sync_app.app.config['UPLOAD_FOLDER'], filename)
+        with metrics.stage('upload_save'):
+            size = await asyncio.to_thread(inbound_audio.save_recording, stream, audio_path)
+        log.info('recording_saved', path=audio_path, bytes=size)
+        sync_app.uploads_janitor.track(audio_path, size)
+        if inbound_audio.MODE == 'disk':
+            return await speech_to_text(http, await asyncio.to_thread(read_recording, audio_path), filename)
+    return await speech_to_text(http, stream.read(), filename)
+
+
+async def index(request):
+    return web.FileResponse('templates/index.html')
+
+
+async def process_audio(request):
+    http = request.app[HTTP_SESSION]
+    form = await request.post()
+    audio_field = form.get('audio')
+    if not isinstance(audio_field, web.FileField):
+        return web.json_response({'error': 'No audio file provided'}, status=400)
+
+    # STT
+    transcript, error = await transcribe_upload(http, audio_field)
+    if not transcript:
+        return await reply(request.app, transcript, error or STT_FAILED)
+
+    # Process with chatbot
+    response_text = await process_message(http, request_session_id(request), transcript)
+    return await reply(request.app, transcript, response_text)
+
+
+async def process_text(request):
+    try:
+        data = json.loads(await request.text())
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'text' not in data:
+        return web.json_response({'error': 'No text provided'}, status=400)
+    text_input = data['text']
+    response_text = await process_message(request.app[HTTP_SESSION], request_session_id(request), text_input)
+    return await reply(request.app, text_input, response_text)
+
+
+async def process_text_stream(request):
+    started = time.perf_counter()
+    try:
+        data = json.loads(await request.text())
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'text' not in data:
+        return web.json_response({'error': 'No text provided'}, status=400)
+    text_input = data['text']
+    pieces = stream_message(request.app[HTTP_SESSION], request_session_id(request), text_input)
+    return await stream_turn(request, text_input, pieces, started)
+
+
+async def process_audio_stream(request):
+    started = time.perf_counter()
+    http = request.app[HTTP_SESSION]
+    form = await request.post()
+    audio_field = form.get('audio')
+    if not isinstance(audio_field, web.FileField):
+        return web.json_response({'error': 'No audio file provided'}, status=400)
+
+    transcript, error = await transcribe_upload(http, audio_field)
+    if not transcript:
+        return await stream_turn(request, transcript, single_piece(error or STT_FAILED), started)
+    pieces = stream_message(http, request_session_id(request), transcript)
+    return await stream_turn(request, transcript, pieces, started)
+
+
+async def serve_tts(request):
+    key = request.match_info['key']
+    # Playlist entries can be requested before their segment is synthesized
+    audio, download = await find_audio(request.app[TTS_PIPELINE], key)
+    if download is not None:
+        if 'Range' not in request.headers:
+            response = web.StreamResponse(headers=audio_http.STREAMING_HEADERS)
+            await response.prepare(request)
+            try:
+                async for chunk in download_chunks(download):
+                    await response.write(chunk)
+            except (TimeoutError, IOError) as e:
+                log.warning('tts_stream_failed', key=key, error=str(e))
+            return response
+        # A range needs the complete file
+        try:
+            audio = b''.join([chunk async for chunk in download_chunks(download)])
+        except (TimeoutError, IOError):
+            audio = None
+    if audio is None:
+        return web.json_response({'error': 'Audio not found'}, status=404)
+    status, headers, start, end = audio_http.audio_response(audio, request.headers)
+    return web.Response(body=audio[start:end], status=status, headers=headers)
+
+
+# A job's segments in order as one MP3 stream, see app.serve_tts_stream
+async def serve_tts_stream(request):
+    job = request.app[TTS_PIPELINE].get(request.match_info['job_id'])
+    if job is None:
+        return web.json_response({'error': 'Audio not found'}, status=404)
+    return await stream_segments(request, job_segments(job), job=job.id)
+
+
+# A complete reply's segments by their cache keys, see app.serve_tts_speech
+async def serve_tts_speech(request):
+    keys = request.match_info['keys']
+    if not sync_app.SPEECH_KEYS.match(keys):
+        return web.json_response({'error': 'Audio not found'}, status=404)
+
+    async def segments():
+        for key in keys.split('-'):
+            yield key, None
+
+    return await stream_segments(request, segments(), shared=True)
+
+
+# (key, future) segments in order as one MP3 stream, see app.iter_segments_audio
+async def stream_segments(request, segments, shared=False, **context):
+    pipeline = request.app[TTS_PIPELINE]
+    response = web.StreamResponse(headers=audio_http.STREAMING_HEADERS)
+    await response.prepare(request)
+    try:
+        i = 0
+        async for key, future in segments:
+            audio, download = await find_audio(pipeline, key, future, shared=shared)
+            if audio is None and download is None:
+                log.warning('tts_stream_failed', segment=i, **context)
+                break
+            segment = Mp3SegmentStream(first=i == 0)
+            async for chunk in single_piece(audio) if download is None else download_chunks(download):
+                data = segment.feed(chunk)
+                if data:
+                    await response.write(data)
+            data = segment.end()
+            if data:
+                await response.write(data)
+            i += 1
+    except (TimeoutError, IOError) as e:
+        log.warning('tts_stream_failed', error=str(e), **context)
+    return response
+
+
+async def ready(request):
+    status = sync_app.warmup.status()
+    return web.json_response(status, status=200 if status['ready'] else 503)
+
+
+async def tts_stats(request):
+    return web.json_response(sync_app.tts_cache.stats())
+
+
+async def session_stats(request):
+    return web.json_response(await asyncio.to_thread(sync_app.session_store.stats))
+
+
+async def uploads_stats(request):
+    return web.json_response(sync_app.uploads_janitor.stats())
+
+
+async def knowledge_stats(request):
+    return web.json_response(sync_app.knowledge.stats())
+
+
+async def answer_stats(request):
+    return web.json_response(sync_app.answer_cache.stats())
+
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def upstream_stats(request):
+    return web.json_response(resilience.stats())
+
+
+async def stt_stats(request):
+    return web.json_response(sync_app.stt_router.stats())
+
+
+async def serve_audio(request):
+    path = os.path.join(sync_app.app.config['UPLOAD_FOLDER'], os.path.basename(request.match_info['filename']))
+    if not os.path.isfile(path):
+        return web.json_response({'error': 'File not found'}, status=404)
+    return web.FileResponse(path)
+
+
+# One pooled upstream session per server, opened and closed with the event loop
+async def upstream_session(application):
+    http = application[HTTP_SESSION] = http_client.make_async_session()
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(TTS_PIPELINE_WORKERS)
+
+    # Segments are synthesized as coroutines on this loop, bounded by the semaphore
+    async def synthesize(text):
+        async with slots:
+            try:
+                return await text_to_speech(http, text)
+            except Exception as e:
+                log.error('tts_pipeline_failed', error=str(e))
+                return None
+
+    application[TTS_PIPELINE] = TTSPipeline(
+        None, sync_app.tts_pipeline.key_for, keep_whole=sync_app.speak_whole,
+        submit=lambda text: asyncio.run_coroutine_threadsafe(synthesize(text), loop))
+    yield
+    await application[HTTP_SESSION].close()
+
+
+def create_app():
+    application = web.Application(client_max_size=MAX_UPLOAD_BYTES, middlewares=[request_deadline])
+    application.cleanup_ctx.append(upstream_session)
+    application.on_response_prepare.append(set_session_cookie)
+    application.on_response_prepare.append(add_server_timing)
+    application.add_routes([
+        web.get('/', index),
+        web.post('/process_audio', process_audio),
+        web.post('/process_text', process_text),
+        web.post('/process_text_stream', process_text_stream),
+        web.post('/process_audio_stream', process_audio_stream),
+        web.get('/tts/stats', tts_stats),
+        web.get('/sessions/stats', session_stats),
+        web.get('/tts/{key}.mp3', serve_tts),
+        web.get('/tts/stream/{job_id}.mp3', serve_tts_stream),
+        web.get('/tts/speech/{keys}.mp3', serve_tts_speech),
+        web.get('/ready', ready),
+        web.get('/uploads/stats', uploads_stats),
+        web.get('/knowledge/stats', knowledge_stats),
+        web.get('/answers/stats', answer_stats),
+        web.get('/metrics', metrics_endpoint),
+        web.get('/upstreams/stats', upstream_stats),
+        web.get('/stt/stats', stt_stats),
+        web.get('/uploads/{filename}', serve_audio),
+        web.static('/static', 'static'),
+    ])
+    return application
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the voice endpoints on asyncio.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
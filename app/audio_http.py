@@ -0,0 +1,65 @@
+import hashlib
+
+# HTTP caching for TTS audio. /tts/<key>.mp3 is addressed by the cache key,
+# which covers the text and every voice setting, so a URL always names the
+# same speech: complete responses may be cached for a year as immutable and
+# serve single byte ranges for seeking. The bytes behind a key are not fixed,
+# though (audio assembled from sentence segments differs from audio synthesized
+# whole), so the strong ETag is a digest of the bytes served, not the key.
+# Audio passed through while it still downloads is sent without these.
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STREAMING_HEADERS = {'Content-Type': 'audio/mpeg', 'Cache-Control': 'no-cache'}
+
+
+def etag(audio):
+    return f'"{hashlib.blake2b(audio, digest_size=16).hexdigest()}"'
+
+
+# (start, end) of a single "bytes=" range, end exclusive; None when the header is
+# malformed or asks for several ranges (the whole file is sent then), False when
+# the range lies outside the file
+def parse_range(header, size):
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition('-'))
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(0, size - length), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last) + 1 if last else size, size)
+
+
+def _matches(header, tag):
+    return any(value.strip() in ('*', tag, 'W/' + tag) for value in header.split(','))
+
+
+# Status, headers and the byte span [start, end) to send for cached audio
+def audio_response(audio, request_headers):
+    size = len(audio)
+    tag = etag(audio)
+    headers = {'Content-Type': 'audio/mpeg', 'ETag': tag, 'Cache-Control': CACHE_CONTROL, 'Accept-Ranges': 'bytes'}
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match and _matches(if_none_match, tag):
+        return 304, headers, 0, 0
+    range_header = request_headers.get('Range')
+    if_range = request_headers.get('If-Range')
+    if range_header and (not if_range or if_range.strip() == tag):
+        span = parse_range(range_header, size)
+        if span is False:
+            headers['Content-Range'] = f"bytes */{size}"
+            return 416, headers, 0, 0
+        if span:
+            start, end = span
+            headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+            return 206, headers, start, end
+    return 200, headers, 0, size
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import structured_log
+from feature_store import open_store, store_path
+from linear_scorer import compiled_path, load_model, predict_columns
+
+log = structured_log.get_logger('customer_index')
+
+# IDs are stored in a dense position array when they are small non-negative
+# integers that fill at least this share of the 0..max(ID) range; otherwise a
+# dict is used. Both give O(1) lookups, the array just costs far less memory.
+DENSE_FILL_RATIO = 0.25
+
+
+# Build the ID -> row position map and the precomputed limits for a dataset
+def build_limit_table(model, data, features):
+    limits = np.asarray(predict_columns(model, data, features, getattr(data, 'encoded', None)), dtype=np.float64)
+    ids = np.asarray(data['ID'])
+    if len(ids) and np.issubdtype(ids.dtype, np.integer) and ids.min() >= 0:
+        max_id = int(ids.max())
+        if len(ids) >= DENSE_FILL_RATIO * (max_id + 1):
+            positions = np.full(max_id + 1, -1, dtype=np.int64)
+            # Assign in reverse so the first row wins for duplicated IDs,
+            # matching the old boolean-mask filter followed by [0]
+            positions[ids[::-1]] = np.arange(len(ids) - 1, -1, -1, dtype=np.int64)
+            return positions, limits
+    positions = {}
+    for position, customer_id in enumerate(ids.tolist()):
+        positions.setdefault(customer_id, position)
+    return positions, limits
+
+
+# Look up a row position in either kind of position table
+def find_position(positions, customer_id):
+    if isinstance(positions, dict):
+        return positions.get(customer_id)
+    try:
+        key = int(customer_id)
+    except (TypeError, ValueError):
+        return None
+    if key != customer_id or key < 0 or key >= len(positions):
+        return None
+    position = int(positions[key])
+    return position if position >= 0 else None
+
+
+# Precomputed credit limits for every customer in the dataset, keyed by ID.
+# Customers are read from the memory-mapped columnar copy of the CSV. The
+# table is rebuilt when the model pickle or the customer CSV is replaced.
+# Rows upserted into an optional CustomerStore override the CSV; only the
+# changed rows are rescored when the store moves on.
+class CustomerIndex:
+    def __init__(self, model_path, data_path, features, check_interval=1.0, store=None):
+        self.model_path = model_path
+        self.data_path = data_path
+        self.features = list(features)
+        self.check_interval = check_interval
+        self.store = store
+        self._lock = threading.Lock()
+        self._store_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = None
+        self._state = None
+        self._overrides = {}
+        self._store_version = 0
+        self.reload()
+
+    @property
+    def model(self):
+        return self._state[0]
+
+    @property
+    def data(self):
+        return self._state[1]
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.model_path, compiled_path(self.model_path), self.data_path, store_path(self.data_path)):
+            if not os.path.exists(path):
+                signature.append(None)
+                continue
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def reload(self):
+        model = load_model(self.model_path)
+        data = open_store(self.data_path)
+        positions, limits = build_limit_table(model, data, self.features)
+        # Taken after open_store, which may have just written the columnar copy
+        signature = self._file_signature()
+        with self._store_lock:
+            # A new model invalidates every stored override, so rescore them all
+            overrides, version = {}, 0
+            if self.store is not None:
+                try:
+                    overrides, version = self._score_changes(model, 0)
+                except Exception as e:
+                    log.error('customer_store_sync_failed', error=str(e))
+            with self._lock:
+                self._state = (model, data, positions, limits)
+                self._overrides = {customer_id: limit for customer_id, limit in overrides.items() if limit is not None}
+                self._store_version = version
+                self._signature = signature
+                self._checked_at = time.monotonic()
+
+    def refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = now
+        try:
+            if self._file_signature() == self._signature:
+                return False
+            self.reload()
+            log.info('customer_index_reloaded', rows=len(self._state[3]))
+            return True
+        except Exception as e:
+            # A half-written replacement keeps serving the previous table
+            log.error('customer_index_reload_failed', error=str(e))
+            return False
+
+    # Score the store rows changed after `version`; unscorable rows map to None
+    def _score_changes(self, model, version):
+        ids, columns, latest = self.store.changes_since(version)
+        if not ids:
+            return {}, latest
+        try:
+            limits = predict_columns(model, columns, self.features).tolist()
+        except Exception:
+            limits = []
+            for i in range(len(ids)):
+                try:
+                    row = {name: values[i:i + 1] for name, values in columns.items()}
+                    limits.append(float(predict_columns(model, row, self.features)[0]))
+                except Exception as e:
+                    log.warning('customer_store_row_skipped', customer_id=ids[i], error=str(e))
+                    limits.append(None)
+        return dict(zip(ids, limits)), latest
+
+    # Rescore only the rows upserted since the last sync
+    def sync_store(self):
+        if self.store is None:
+            return 0
+        try:
+            if self.store.version() == self._store_version:
+                return 0
+            with self._store_lock:
+                changes, latest = self._score_changes(self._state[0], self._store_version)
+                for customer_id, limit in changes.items():
+                    if limit is None:
+                        self._overrides.pop(customer_id, None)
+                    else:
+                        self._overrides[customer_id] = limit
+                self._store_version = latest
+                return len(changes)
+        except Exception as e:
+            log.error('customer_store_sync_failed', error=str(e))
+            return 0
+
+    def lookup(self, customer_id):
+        self.refresh_if_changed()
+        self.sync_store()
+        override = self._overrides.get(customer_id)
+        if override is not None:
+            return override
+        _, _, positions, limits = self._state
+        position = find_position(positions, customer_id)
+        if position is None:
+            return None
+        return float(limits[position])
+
+    # Vectorized lookup for integer IDs: returns (limits, found) arrays with
+    # NaN limits where the ID is unknown
+    def lookup_many(self, customer_ids):
+        self.refresh_if_changed()
+        self.sync_store()
+        _, _, positions, limits = self._state
+        if isinstance(positions, dict):
+            rows = np.fromiter((positions.get(customer_id, -1) for customer_id in customer_ids),
+                               dtype=np.int64, count=len(customer_ids))
+        else:
+            try:
+                ids = np.asarray(customer_ids, dtype=np.int64)
+            except OverflowError:
+                # An ID beyond int64 is beyond the table too; -1 is never a position
+                size = len(positions)
+                ids = np.fromiter((customer_id if 0 <= customer_id < size else -1 for customer_id in customer_ids),
+                                  dtype=np.int64, count=len(customer_ids))
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            in_range = (ids >= 0) & (ids < len(positions))
+            rows[in_range] = positions[ids[in_range]]
+        found = rows >= 0
+        result = np.full(len(rows), np.nan)
+        result[found] = limits[rows[found]]
+        overrides = self._overrides
+        if overrides:
+            for i, customer_id in enumerate(customer_ids):
+                override = overrides.get(customer_id)
+                if override is not None:
+                    result[i] = override
+                    found[i] = True
+        return result, found
+
+    def __contains__(self, customer_id):
+        return self.lookup(customer_id) is not None
+
+    def __len__(self):
+        return len(self._state[3])
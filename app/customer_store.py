@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+
+# Customer rows that change during the day. Rows live in SQLite in WAL mode so
+# readers in every worker see committed upserts without blocking the writer.
+# Each upsert batch stamps its rows with a new version number; readers fetch
+# only the rows newer than the last version they have seen.
+
+CATEGORICAL_FEATURES = ('Gender', 'Student', 'Married', 'Ethnicity')
+
+
+class CustomerStore:
+    def __init__(self, path, features, timeout=5.0):
+        self.path = path
+        self.features = list(features)
+        self.timeout = timeout
+        self._local = threading.local()
+        columns = ', '.join(f'"{name}" {"TEXT" if name in CATEGORICAL_FEATURES else "REAL"} NOT NULL'
+                            for name in self.features)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS customers (ID INTEGER PRIMARY KEY, {columns}, '
+                               'version INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS customers_version ON customers (version)')
+
+    # sqlite3 connections are per thread
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    # Check one row and return it as a tuple in column order
+    def _validate(self, row):
+        missing = [name for name in ['ID'] + self.features if name not in row]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        values = [int(row['ID'])]
+        for name in self.features:
+            values.append(str(row[name]) if name in CATEGORICAL_FEATURES else float(row[name]))
+        return values
+
+    def upsert(self, row):
+        return self.upsert_many([row])
+
+    # Insert or replace rows in one transaction; returns the new version
+    def upsert_many(self, rows):
+        values = [self._validate(row) for row in rows]
+        if not values:
+            return self.version()
+        names = ', '.join(f'"{name}"' for name in ['ID'] + self.features)
+        placeholders = ', '.join('?' * (len(self.features) + 2))
+        updates = ', '.join(f'"{name}" = excluded."{name}"' for name in self.features + ['version'])
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            (version,) = connection.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM customers').fetchone()
+            connection.executemany(
+                f'INSERT INTO customers ({names}, version) VALUES ({placeholders}) '
+                f'ON CONFLICT(ID) DO UPDATE SET {updates}',
+                [value + [version] for value in values])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return version
+
+    # Latest version stamp; MAX over the version index is a single B-tree seek
+    def version(self):
+        (version,) = self._connection().execute('SELECT COALESCE(MAX(version), 0) FROM customers').fetchone()
+        return version
+
+    # Rows stamped after `version`, as (ids, columns, latest version)
+    def changes_since(self, version):
+        cursor = self._connection().execute(
+            'SELECT ID, {}, version FROM customers WHERE version > ? ORDER BY ID'.format(
+                ', '.join(f'"{name}"' for name in self.features)), (version,))
+        rows = cursor.fetchall()
+        ids = [row[0] for row in rows]
+        columns = {name: [row[i + 1] for row in rows] for i, name in enumerate(self.features)}
+        latest = max((row[-1] for row in rows), default=version)
+        return ids, columns, latest
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM customers').fetchone()[0]
+
+
+if __name__ == '__main__':
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(description='Bulk upsert customer rows from a CSV into the customer store.')
+    parser.add_argument('csv', help='CSV with an ID column and the model feature columns')
+    parser.add_argument('--db', default='uploads/customers.db')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
+    store = CustomerStore(args.db, features)
+    total = 0
+    with open(args.csv, newline='', encoding='utf-8') as f:
+        batch = []
+        for row in csv.DictReader(f):
+            batch.append(row)
+            if len(batch) >= args.batch_size:
+                store.upsert_many(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            store.upsert_many(batch)
+            total += len(batch)
+    print(f"Upserted {total} rows into {args.db} (version {store.version()})")
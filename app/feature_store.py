@@ -0,0 +1,160 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Columnar customer file: parsed and encoded once from the CSV, then opened
+# with mmap so every worker reads the same page-cache copy without parsing.
+#
+# Layout: MAGIC, uint32 header length, JSON header, then one 64-byte aligned
+# array per column. Numeric columns keep their int64/float64 dtype,
+# categorical columns are stored as integer codes into a dictionary of
+# values kept in the header.
+
+MAGIC = b'CFS1'
+ALIGNMENT = 64
+
+
+# Path of the columnar copy that belongs to a CSV file
+def store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.cols'
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _code_dtype(size):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Encode a CSV into the columnar format; the file is swapped in atomically
+def convert_csv(csv_path, out_path=None):
+    import pandas as pd
+
+    out_path = out_path or store_path(csv_path)
+    signature = _source_signature(csv_path)
+    frame = pd.read_csv(csv_path)
+    arrays = []
+    columns = []
+    for name in frame.columns:
+        series = frame[name]
+        if series.dtype.kind in 'biuf':
+            array = series.to_numpy(dtype=np.int64 if series.dtype.kind in 'biu' else np.float64)
+            columns.append({'name': name, 'kind': 'numeric', 'dtype': array.dtype.str})
+        else:
+            codes, dictionary = pd.factorize(series.astype(str), sort=True)
+            array = codes.astype(_code_dtype(len(dictionary)))
+            columns.append({'name': name, 'kind': 'categorical', 'dtype': array.dtype.str,
+                            'dictionary': dictionary.tolist()})
+        arrays.append(np.ascontiguousarray(array))
+
+    # Offsets depend on the header size, so settle the header length first
+    header = {'rows': len(frame), 'source': signature, 'columns': columns}
+    while True:
+        encoded = json.dumps(header).encode('utf-8')
+        offset = _aligned(len(MAGIC) + 4 + len(encoded))
+        for column, array in zip(columns, arrays):
+            column['offset'] = offset
+            offset = _aligned(offset + array.nbytes)
+        if len(json.dumps(header).encode('utf-8')) == len(encoded):
+            break
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for column, array in zip(columns, arrays):
+            f.write(b'\0' * (column['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+# Read-only, memory-mapped view of a columnar customer file
+class FeatureStore:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a columnar customer file")
+        (length,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + length].decode('utf-8'))
+        self.rows = self.header['rows']
+        self._arrays = {}
+        self.dictionaries = {}
+        for column in self.header['columns']:
+            self._arrays[column['name']] = np.frombuffer(self._mmap, dtype=np.dtype(column['dtype']),
+                                                         count=self.rows, offset=column['offset'])
+            if column['kind'] == 'categorical':
+                self.dictionaries[column['name']] = column['dictionary']
+
+    @property
+    def names(self):
+        return [column['name'] for column in self.header['columns']]
+
+    @property
+    def source(self):
+        return self.header.get('source')
+
+    # (codes, dictionary) pairs for the categorical columns, as LinearScorer takes them
+    @property
+    def encoded(self):
+        return {name: (self._arrays[name], dictionary) for name, dictionary in self.dictionaries.items()}
+
+    # Numeric columns are zero-copy views; categorical columns are decoded on access
+    def __getitem__(self, name):
+        array = self._arrays[name]
+        if name in self.dictionaries:
+            return np.asarray(self.dictionaries[name], dtype=object)[array]
+        return array
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def __len__(self):
+        return self.rows
+
+    # Decoded pandas DataFrame for a row range, for code that needs one
+    def to_frame(self, start=0, stop=None, columns=None):
+        import pandas as pd
+
+        columns = columns or self.names
+        return pd.DataFrame({name: self[name][start:stop] for name in columns})
+
+
+# Open the columnar copy of a CSV, converting it first when it is missing or
+# older than the CSV. Paths that already point at a .cols file open directly.
+def open_store(path):
+    if path.endswith('.cols'):
+        return FeatureStore(path)
+    cols_path = store_path(path)
+    if os.path.exists(cols_path):
+        store = FeatureStore(cols_path)
+        if store.source == _source_signature(path):
+            return store
+    convert_csv(path, cols_path)
+    return FeatureStore(cols_path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert a customer CSV into the columnar mmap format.')
+    parser.add_argument('csv', nargs='?', default='uploads/test_data2.csv')
+    parser.add_argument('--out', help='output path (default: next to the CSV, .cols)')
+    args = parser.parse_args()
+    path = convert_csv(args.csv, args.out)
+    store = FeatureStore(path)
+    print(f"Wrote {path}: {len(store)} rows, {os.path.getsize(path)} bytes")
@@ -0,0 +1,107 @@
+import os
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# Shared outbound HTTP transport for the Aisha STT/TTS calls, the audio
+# downloads, Gemini STT and the Together client. One Session keeps a keep-alive
+# connection pool per host, so repeated calls reuse TCP+TLS connections
+# instead of handshaking every time, and every call gets a timeout.
+
+# Settings are read at import time, before the entry points call load_dotenv()
+load_dotenv()
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '60'))
+# Number of per-host pools kept, and idle connections kept per host
+POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '8'))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '32'))
+# Upstream connections the async server may have open at once, across all hosts
+ASYNC_POOL_LIMIT = int(os.getenv('HTTP_ASYNC_POOL_LIMIT', '256'))
+
+AISHA_BASE_URL = os.getenv('AISHA_BASE_URL', 'https://back.aisha.group').rstrip('/')
+TOGETHER_BASE_URL = os.getenv('TOGETHER_BASE_URL', 'https://api.together.xyz/v1')
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com').rstrip('/')
+
+
+# The together SDK closes its session every few minutes; the shared one is
+# only closed explicitly through shutdown()
+class SharedSession(requests.Session):
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+def make_session(pool_hosts=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE):
+    session = SharedSession()
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = make_session()
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return session.request(method, url, **kwargs)
+
+
+# requests timeouts for an attempt that may take at most `seconds`
+def timeouts(seconds):
+    return (min(CONNECT_TIMEOUT, seconds), seconds)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def aisha_url(path):
+    return f"{AISHA_BASE_URL}{path}"
+
+
+def gemini_url(path):
+    return f"{GEMINI_BASE_URL}{path}"
+
+
+# Together client that sends its requests through the shared session. Its own retries
+# are off: resilience.llm retries within the request deadline instead
+def together_client(api_key):
+    import together
+
+    together.requestssession = session
+    return together.Together(api_key=api_key, base_url=TOGETHER_BASE_URL,
+                             timeout=(CONNECT_TIMEOUT, LLM_READ_TIMEOUT), max_retries=0)
+
+
+# A chat completion that gives up after `seconds`, like the other upstream attempts.
+# The Together client takes its timeout from its config only, so the call goes
+# through a copy of that config with the attempt's budget as the timeout
+def chat_completion(client, seconds, **params):
+    import dataclasses
+    from together.resources.chat.completions import ChatCompletions
+
+    config = dataclasses.replace(client.client, timeout=timeouts(seconds))
+    return ChatCompletions(config).create(**params)
+
+
+# aiohttp session for the async server; must be created inside its event loop
+def make_async_session():
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=ASYNC_POOL_LIMIT, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def together_url(path):
+    return f"{TOGETHER_BASE_URL.rstrip('/')}{path}"
@@ -0,0 +1,70 @@
+import os
+import random
+import shutil
+import threading
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+# Inbound recordings. An upload is sent to STT straight from the request
+# body: it stays in memory up to UPLOAD_SPOOL_BYTES and only larger ones are
+# spooled to a temporary file, so a normal recording never touches the disk.
+# UPLOAD_SAVE_SAMPLE keeps that fraction of recordings in uploads/ for
+# debugging; UPLOAD_MODE=disk restores saving every upload and reading it
+# back for STT.
+
+MODE = os.getenv('UPLOAD_MODE', 'memory')
+if MODE not in ('memory', 'disk'):
+    raise ValueError(f"Unknown UPLOAD_MODE: {MODE}")
+SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(2**20)))
+SAVE_SAMPLE = float(os.getenv('UPLOAD_SAVE_SAMPLE', '0'))
+
+_lock = threading.Lock()
+counters = {'uploads': 0, 'upload_bytes': 0, 'spooled': 0, 'saved': 0, 'saved_bytes': 0}
+
+
+# Flask request whose file uploads spool to disk only above UPLOAD_SPOOL_BYTES
+class SpooledRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='rb+')
+
+
+def _count(**amounts):
+    with _lock:
+        for name, amount in amounts.items():
+            counters[name] += amount
+
+
+# Size of an upload stream, leaving it positioned at the start
+def upload_size(stream):
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+# Record one upload; returns its size
+def received(stream):
+    size = upload_size(stream)
+    _count(uploads=1, upload_bytes=size, spooled=int(bool(getattr(stream, '_rolled', False))))
+    return size
+
+
+# Whether this upload is written to uploads/: every one in disk mode, a sample otherwise
+def keep_recording():
+    return MODE == 'disk' or (SAVE_SAMPLE > 0 and random.random() < SAVE_SAMPLE)
+
+
+def save_recording(stream, path):
+    stream.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f)
+        size = f.tell()
+    stream.seek(0)
+    _count(saved=1, saved_bytes=size)
+    return size
+
+
+def stats():
+    with _lock:
+        return dict(counters, mode=MODE, spool_bytes=SPOOL_BYTES, save_sample=SAVE_SAMPLE)
@@ -0,0 +1,83 @@
+import re
+from collections import deque
+
+# Keyword intents of the dialog, shared by app.py and terminal.py. Every
+# keyword set is compiled into one regex; a message is lowercased once and
+# scanned once, and the result is a bitmask of the intents found. Keywords
+# match anywhere in the message, as plain substrings.
+#
+# The alternation sits inside a lookahead, so the scan tries every position
+# and finds keywords that overlap. Alternatives are ordered longest first, so
+# at each position the longest keyword wins; its flags include those of every
+# shorter keyword it starts with ("kredit limiti" also carries "kredit"), so
+# nothing that matches at that position is lost.
+
+CREDIT = 1 << 0          # credit or limit question
+GREETING = 1 << 1
+THANKS = 1 << 2
+REASON = 1 << 3          # asks why or how
+BOT_INFO = 1 << 4        # asks about the bot itself
+BOT_NAME = 1 << 5
+BOT_DEVELOPER = 1 << 6
+KREDIT = 1 << 7          # the word "kredit" itself
+NOT_FOUND = 1 << 8       # an ID lookup failed
+
+KEYWORDS = {
+    CREDIT: ['kredit', 'qarz', 'limit', 'pul olish', 'kredit olish', 'kredit limiti'],
+    GREETING: ['salom', 'assalom', 'assalomu alaykum', 'assalomu aleykum'],
+    THANKS: ['rahmat', 'tashakkur'],
+    REASON: ['nima uchun', 'negadir', 'nima sababdan', 'qanday qilib', 'why', 'how'],
+    BOT_INFO: ['isming', 'kim', 'nomi', 'quruvchi', 'ishlab chiqaruvchi', 'developer'],
+    BOT_NAME: ['ism', 'nomi'],
+    BOT_DEVELOPER: ['quruvchi', 'ishlab chiqaruvchi', 'developer'],
+    KREDIT: ['kredit'],
+    NOT_FOUND: ['topilmadi'],
+}
+
+
+class IntentScanner:
+    def __init__(self, keywords=KEYWORDS):
+        literals = {}
+        for flag, words in keywords.items():
+            for word in words:
+                literals[word.lower()] = literals.get(word.lower(), 0) | flag
+        # A literal also carries the flags of every keyword it starts with
+        self.flags = {literal: 0 for literal in literals}
+        for literal in self.flags:
+            for word, flag in literals.items():
+                if literal.startswith(word):
+                    self.flags[literal] |= flag
+        ordered = sorted(self.flags, key=lambda literal: (-len(literal), literal))
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(literal) for literal in ordered) + '))')
+
+    # Bitmask of every intent whose keyword occurs in message
+    def scan(self, message):
+        flags = 0
+        table = self.flags
+        for match in self.pattern.finditer(message.lower()):
+            flags |= table[match.group(1)]
+        return flags
+
+
+# Whether the last few messages of a dialog were about credit, kept up to date
+# message by message instead of re-scanning the history every turn
+class DialogContext:
+    def __init__(self, window=4, flags=CREDIT | NOT_FOUND):
+        self.window = deque(maxlen=window)
+        self.flags = flags
+        self._hits = 0
+
+    def add(self, message_flags):
+        if len(self.window) == self.window.maxlen:
+            self._hits -= self.window[0]
+        hit = 1 if message_flags & self.flags else 0
+        self.window.append(hit)
+        self._hits += hit
+
+    @property
+    def active(self):
+        return self._hits > 0
+
+
+scanner = IntentScanner()
+scan = scanner.scan
@@ -0,0 +1,253 @@
+import hashlib
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import structured_log
+from uz_text import normalize
+
+log = structured_log.get_logger('knowledge_index')
+
+# Lexical retrieval over the bank knowledge files, so a prompt carries the few
+# passages relevant to the question instead of the whole knowledge base. Files
+# are split into passages at blank lines and ranked with BM25. When a file
+# changes only that file is re-split, and passages whose text is unchanged keep
+# their postings; only new passages are tokenized.
+
+MISSING = "Bank haqida ma'lumot fayli topilmadi."
+KNOWLEDGE_SUFFIXES = ('.txt', '.md')
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Uzbek is agglutinative ("filial", "filiallar", "filialda"); terms are cut to
+# this many characters so the forms of a word share a posting list
+STEM_CHARS = 6
+
+TOKEN = re.compile(r"[\w']+")
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+# Index terms of a text: normalized words of two or more characters, stemmed by truncation
+def terms(text):
+    return [word[:STEM_CHARS] for word in TOKEN.findall(normalize(text)) if len(word) > 1]
+
+
+# Pieces of at most max_chars, cut at sentence ends and, failing that, between words
+def _split_long(paragraph, max_chars):
+    pieces, current = [], ''
+    for sentence in SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+# Passages of a knowledge file: one per paragraph, headings and other short
+# paragraphs joined to the paragraph after them, long ones split. A change to
+# one paragraph only changes the passages around it.
+def split_passages(text, max_chars=800, min_chars=80):
+    passages, pending = [], ''
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        if pending:
+            paragraph = f"{pending}\n{paragraph}"
+            pending = ''
+        if len(paragraph) < min_chars:
+            pending = paragraph
+            continue
+        passages.extend(_split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph])
+    if pending:
+        passages.append(pending)
+    return passages
+
+
+def passage_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:20]
+
+
+# One indexed passage; identical passages in several places are indexed once
+class Passage:
+    __slots__ = ('text', 'counts', 'length', 'refs')
+
+    def __init__(self, text):
+        self.text = text
+        self.counts = Counter(terms(text))
+        self.length = sum(self.counts.values())
+        self.refs = 0
+
+
+# BM25 index over knowledge files and directories of .txt/.md files. Files are
+# checked for changes at most every check_interval seconds, on search.
+class KnowledgeIndex:
+    def __init__(self, paths, top_k=4, max_chars=800, check_interval=1.0):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.top_k = top_k
+        self.max_chars = max_chars
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._checked_at = 0.0
+        self._files = {}           # path -> (signature, [passage keys in file order])
+        self._passages = {}        # passage key -> Passage
+        self._postings = {}        # term -> {passage key: term count}
+        self._total_length = 0
+        self._norms = {}           # passage key -> BM25 length normalization
+        self.version = passage_key('')
+        self.rebuilds = 0
+        self.tokenized = 0
+        self.reused = 0
+        self.last_rebuild_ms = 0.0
+        self.refresh()
+
+    def _knowledge_files(self):
+        files = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                             if name.endswith(KNOWLEDGE_SUFFIXES))
+            elif os.path.exists(path):
+                files.append(path)
+        return files
+
+    def _add(self, key, text):
+        passage = self._passages.get(key)
+        if passage is None:
+            passage = self._passages[key] = Passage(text)
+            for term, count in passage.counts.items():
+                self._postings.setdefault(term, {})[key] = count
+            self._total_length += passage.length
+            self.tokenized += 1
+        else:
+            self.reused += 1
+        passage.refs += 1
+
+    def _remove(self, key):
+        passage = self._passages[key]
+        passage.refs -= 1
+        if passage.refs:
+            return
+        del self._passages[key]
+        for term in passage.counts:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= passage.length
+
+    # Re-read the files that changed since the last check; returns whether any did
+    def refresh(self):
+        start = time.perf_counter()
+        changed = False
+        with self._lock:
+            self._checked_at = time.monotonic()
+            files = self._knowledge_files()
+            for path in set(self._files) - set(files):
+                for key in self._files.pop(path)[1]:
+                    self._remove(key)
+                changed = True
+            for path in files:
+                try:
+                    stat = os.stat(path)
+                    signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                    if path in self._files and self._files[path][0] == signature:
+                        continue
+                    with open(path, 'r', encoding='utf-8') as file:
+                        passages = split_passages(file.read(), self.max_chars)
+                except (OSError, UnicodeDecodeError) as e:
+                    # A file being replaced keeps its previous passages
+                    log.warning('knowledge_file_skipped', path=path, error=str(e))
+                    continue
+                keys = [passage_key(text) for text in passages]
+                # Add before removing so passages that stayed are reused, not re-tokenized
+                for key, text in zip(keys, passages):
+                    self._add(key, text)
+                if path in self._files:
+                    for key in self._files[path][1]:
+                        self._remove(key)
+                self._files[path] = (signature, keys)
+                changed = True
+            if changed:
+                average_length = self._total_length / len(self._passages) if self._passages else 1
+                self._norms = {key: K1 * (1 - B + B * passage.length / average_length)
+                               for key, passage in self._passages.items()}
+                self.version = passage_key(' '.join(key for _, keys in self._files.values() for key in keys))
+                self.rebuilds += 1
+                self.last_rebuild_ms = (time.perf_counter() - start) * 1000
+        return changed
+
+    def refresh_if_changed(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        try:
+            return self.refresh()
+        except Exception as e:
+            log.error('knowledge_refresh_failed', error=str(e))
+            return False
+
+    # The top_k passages for a query as (score, text), best first
+    def search(self, query, top_k=None):
+        self.refresh_if_changed()
+        query_terms = set(terms(query))
+        with self._lock:
+            count = len(self._passages)
+            if not count or not query_terms:
+                return []
+            norms = self._norms
+            scores = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                weight = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)) * (K1 + 1)
+                for key, term_count in postings.items():
+                    scores[key] = scores.get(key, 0.0) + weight * term_count / (term_count + norms[key])
+            best = heapq.nlargest(top_k or self.top_k, scores.items(), key=lambda item: item[1])
+            return [(score, self._passages[key].text) for key, score in best]
+
+    # Knowledge for a prompt: the relevant passages, or the start of the
+    # knowledge base when nothing in it matches the question
+    def context(self, query):
+        passages = [text for _, text in self.search(query)]
+        if not passages:
+            with self._lock:
+                keys = [key for _, keys in self._files.values() for key in keys][:self.top_k]
+                passages = [self._passages[key].text for key in dict.fromkeys(keys)]
+        return '\n\n'.join(passages) if passages else MISSING
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'passages': len(self._passages),
+                'terms': len(self._postings),
+                'chars': sum(len(passage.text) for passage in self._passages.values()),
+                'version': self.version,
+                'rebuilds': self.rebuilds,
+                'tokenized_passages': self.tokenized,
+                'reused_passages': self.reused,
+                'last_rebuild_ms': round(self.last_rebuild_ms, 2),
+            }
+
+
+def knowledge_index_from_env(default_path):
+    paths = os.getenv('KNOWLEDGE_PATHS', default_path).split(os.pathsep)
+    return KnowledgeIndex(paths, top_k=int(os.getenv('KNOWLEDGE_TOP_K', '4')),
+                          max_chars=int(os.getenv('KNOWLEDGE_PASSAGE_CHARS', '800')))
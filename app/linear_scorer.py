@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import structured_log
+
+log = structured_log.get_logger('linear_scorer')
+
+# The credit model is a StandardScaler + OneHotEncoder(drop='first') +
+# LinearRegression pipeline. Exporting its fitted parameters to a small .npz
+# lets workers score customers with NumPy alone, without importing
+# scikit-learn or unpickling the pipeline.
+
+ARTIFACT_VERSION = 1
+
+
+# Path of the compiled artifact that belongs to a model pickle
+def compiled_path(model_path):
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Scores rows with the exported coefficients. Input is any mapping of column
+# name -> values (a dict of lists, a pandas DataFrame, ...).
+class LinearScorer:
+    def __init__(self, numeric, means, scales, categorical, categories, dropped, coef, intercept, features, source_sha256=None):
+        self.numeric = list(numeric)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.categorical = list(categorical)
+        self.categories = [list(values) for values in categories]
+        self.dropped = list(dropped)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.features = list(features)
+        self.source_sha256 = source_sha256
+        # One-hot row for every known category value, with the dropped column removed
+        self._onehot = []
+        for values, drop in zip(self.categories, self.dropped):
+            width = len(values) - (drop is not None)
+            rows = {}
+            column = 0
+            for i, value in enumerate(values):
+                row = np.zeros(width, dtype=np.float64)
+                if i != drop:
+                    row[column] = 1.0
+                    column += 1
+                rows[value] = row
+            self._onehot.append(rows)
+        self.width = len(self.numeric) + sum(len(values) - (drop is not None) for values, drop in zip(self.categories, self.dropped))
+
+    @classmethod
+    def from_pipeline(cls, pipeline, source_sha256=None):
+        preprocessor = pipeline.named_steps['preprocessor']
+        regression = pipeline.named_steps['model']
+        scaler = preprocessor.named_transformers_['num']
+        encoder = preprocessor.named_transformers_['cat']
+        columns = dict((name, cols) for name, _, cols in preprocessor.transformers_)
+        dropped = encoder.drop_idx_ if encoder.drop_idx_ is not None else [None] * len(encoder.categories_)
+        return cls(
+            numeric=columns['num'],
+            means=scaler.mean_,
+            scales=scaler.scale_,
+            categorical=columns['cat'],
+            categories=[values.tolist() for values in encoder.categories_],
+            dropped=[None if drop is None else int(drop) for drop in dropped],
+            coef=regression.coef_,
+            intercept=regression.intercept_,
+            features=preprocessor.feature_names_in_.tolist(),
+            source_sha256=source_sha256,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as artifact:
+            meta = json.loads(str(artifact['meta']))
+            if meta['version'] != ARTIFACT_VERSION:
+                raise ValueError(f"Unsupported scorer artifact version {meta['version']}")
+            return cls(
+                numeric=meta['numeric'],
+                means=artifact['means'],
+                scales=artifact['scales'],
+                categorical=meta['categorical'],
+                categories=meta['categories'],
+                dropped=meta['dropped'],
+                coef=artifact['coef'],
+                intercept=float(artifact['intercept']),
+                features=meta['features'],
+                source_sha256=meta.get('source_sha256'),
+            )
+
+    def save(self, path):
+        meta = {
+            'version': ARTIFACT_VERSION,
+            'numeric': self.numeric,
+            'categorical': self.categorical,
+            'categories': self.categories,
+            'dropped': self.dropped,
+            'features': self.features,
+            'source_sha256': self.source_sha256,
+        }
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), means=self.means, scales=self.scales,
+                     coef=self.coef, intercept=np.array(self.intercept))
+
+    # Fill the one-hot block for one categorical column from raw values
+    def _encode(self, block, index, values):
+        rows = self._onehot[index]
+        values = np.asarray(values, dtype=object)
+        unique, inverse = np.unique(values, return_inverse=True)
+        unknown = [value for value in unique.tolist() if value not in rows]
+        if unknown:
+            raise ValueError(f"Found unknown categories {unknown} in column {index} during transform")
+        block[:] = np.stack([rows[value] for value in unique.tolist()])[inverse.reshape(-1)]
+
+    # Same design matrix as the fitted ColumnTransformer: scaled numeric
+    # columns followed by the one-hot blocks, in C order
+    def transform(self, columns, encoded=None):
+        n = len(columns[self.numeric[0]])
+        X = np.empty((n, self.width), dtype=np.float64)
+        for j, name in enumerate(self.numeric):
+            X[:, j] = np.asarray(columns[name], dtype=np.float64)
+        X[:, :len(self.numeric)] -= self.means
+        X[:, :len(self.numeric)] /= self.scales
+        start = len(self.numeric)
+        for index, name in enumerate(self.categorical):
+            width = len(self.categories[index]) - (self.dropped[index] is not None)
+            block = X[:, start:start + width]
+            if encoded is not None and name in encoded:
+                # Pre-encoded column: (codes, dictionary) pair
+                codes, dictionary = encoded[name]
+                table = self.onehot_table(name, dictionary)
+                block[:] = table[codes]
+                if np.isnan(block).any():
+                    raise ValueError(f"Found unknown categories in column {index} during transform")
+            else:
+                self._encode(block, index, columns[name])
+            start += width
+        return X
+
+    # One-hot rows for every entry of an external category dictionary
+    def onehot_table(self, name, dictionary):
+        index = self.categorical.index(name)
+        rows = self._onehot[index]
+        width = len(self.categories[index]) - (self.dropped[index] is not None)
+        table = np.full((len(dictionary), width), np.nan)
+        for code, value in enumerate(dictionary):
+            if value in rows:
+                table[code] = rows[value]
+        return table
+
+    def predict(self, columns, encoded=None):
+        return self.transform(columns, encoded) @ self.coef + self.intercept
+
+    def predict_row(self, row):
+        return float(self.predict({name: [row[name]] for name in self.features})[0])
+
+
+# Load a model for scoring: the compiled artifact when it matches the pickle,
+# otherwise the pickle itself through joblib
+def load_model(model_path):
+    artifact = compiled_path(model_path)
+    if os.path.exists(artifact):
+        scorer = LinearScorer.load(artifact)
+        if not os.path.exists(model_path) or scorer.source_sha256 == file_sha256(model_path):
+            return scorer
+        log.warning('compiled_scorer_stale', artifact=artifact, model=model_path)
+    import joblib
+    return joblib.load(model_path)
+
+
+# Score a mapping of columns with whichever model load_model returned;
+# scikit-learn pipelines get a DataFrame with categoricals decoded
+def predict_columns(model, columns, features, encoded=None):
+    if isinstance(model, LinearScorer):
+        return model.predict(columns, encoded)
+    import pandas as pd
+
+    return np.asarray(model.predict(pd.DataFrame({name: columns[name] for name in features})))
+
+
+# Compile a model pickle and check it against the pipeline bit for bit
+def export_model(model_path, out_path=None, check_data=None):
+    import joblib
+    import pandas as pd
+
+    pipeline = joblib.load(model_path)
+    scorer = LinearScorer.from_pipeline(pipeline, source_sha256=file_sha256(model_path))
+    if check_data is not None:
+        data = pd.read_csv(check_data)
+        for rows in (data, data.iloc[:1]):
+            expected = pipeline.predict(rows[scorer.features])
+            actual = scorer.predict(rows)
+            if not np.array_equal(expected, actual):
+                mismatches = int(np.sum(expected != actual))
+                raise ValueError(f"Compiled scorer differs from the pipeline on {mismatches} rows")
+    out_path = out_path or compiled_path(model_path)
+    scorer.save(out_path)
+    return out_path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile the credit model pickle into a NumPy scorer artifact.')
+    parser.add_argument('model', nargs='?', default='uploads/linear_regression_model.pkl')
+    parser.add_argument('--out', help='artifact path (default: next to the pickle, .npz)')
+    parser.add_argument('--check', default='uploads/test_data2.csv', help='CSV to verify predictions on')
+    args = parser.parse_args()
+    path = export_model(args.model, args.out, args.check)
+    print(f"Compiled scorer written to {path} ({os.path.getsize(path)} bytes)")
@@ -0,0 +1,235 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+
+# Counters and latency histograms in the Prometheus text format, and the
+# per-request stage timings sent back in a Server-Timing header.
+#
+# A stage is timed with `with metrics.stage('stt'):`. It is observed in the
+# voice_stage_seconds histogram and, when the code runs for a request (see
+# start_request), added to that request's timings. Stages that run outside
+# the request's context, such as TTS synthesis on the Flask app's pipeline
+# threads, only reach the histogram.
+#
+# Counters the caches and upstream policies already keep are not duplicated
+# on the hot path: stats_collector reads their stats() when /metrics is scraped.
+
+# Upper bounds, in seconds; covers a cache lookup up to a stalled upstream
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', 'buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        # One count per bucket plus +Inf; cumulated when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    # The child for one set of label values, created on first use
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        self._render_samples(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_samples(self, lines):
+        for values, child in self._items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}")
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, description, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, seconds):
+        self.labels().observe(seconds)
+
+    def _render_samples(self, lines):
+        names = self.labelnames + ('le',)
+        for values, child in self._items():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(names, values + (_number(bound),))} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+# Expose the numbers in a stats() dict when scraped: each key in `counters`
+# becomes {prefix}_{key}_total, each in `gauges` {prefix}_{key}. With `label`,
+# stats() returns {label value: stats dict}, as resilience.stats() does.
+def stats_collector(prefix, description, stats, counters=(), gauges=(), label=None):
+    def collect(lines):
+        snapshot = stats()
+        rows = snapshot.items() if label else [(None, snapshot)]
+        for keys, kind, suffix in ((counters, 'counter', '_total'), (gauges, 'gauge', '')):
+            for key in keys:
+                name = f"{prefix}_{key}{suffix}"
+                lines.append(f"# HELP {name} {description}: {key.replace('_', ' ')}")
+                lines.append(f"# TYPE {name} {kind}")
+                for value, row in rows:
+                    if isinstance(row, dict) and isinstance(row.get(key), (int, float)):
+                        labels = _label_text((label,), (value,)) if label else ''
+                        lines.append(f"{name}{labels} {_number(row[key])}")
+
+    _collectors.append(collect)
+
+
+# The Prometheus text exposition of every metric
+def render():
+    lines = []
+    for metric in list(_metrics):
+        metric.render(lines)
+    for collect in list(_collectors):
+        collect(lines)
+    return '\n'.join(lines) + '\n'
+
+
+stage_seconds = Histogram('voice_stage_seconds', 'Seconds spent in each stage of a voice turn', ('stage',))
+request_seconds = Histogram('voice_request_seconds', 'Seconds to handle a request, until its response starts',
+                            ('endpoint',))
+requests_total = Counter('voice_requests_total', 'Requests handled', ('endpoint', 'status'))
+bytes_total = Counter('voice_bytes_total', 'Audio bytes transferred', ('direction',))
+
+_timings = contextvars.ContextVar('stage_timings', default=None)
+
+
+# Start collecting stage timings for the current request; returns its start time
+def start_request():
+    _timings.set({})
+    return time.perf_counter()
+
+
+def end_request():
+    _timings.set(None)
+
+
+def record(name, seconds):
+    stage_seconds.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class stage:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+
+
+# Time every call of a function as one stage
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Server-Timing value for the current request: its stages in the order they ended, then the total
+def server_timing(started=None):
+    timings = _timings.get() or {}
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    if started is not None:
+        parts.append(f"total;dur={(time.perf_counter() - started) * 1000:.2f}")
+    return ', '.join(parts)
+
+
+# Count and time a finished request
+def observe_request(endpoint, status, started):
+    request_seconds.labels(endpoint).observe(time.perf_counter() - started)
+    requests_total.labels(endpoint, str(status)).inc()
@@ -0,0 +1,391 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Deadlines, retries, hedging and circuit breakers for the calls to Aisha STT,
+# Aisha TTS, Gemini STT and Together.
+#
+# A request gets one deadline (REQUEST_DEADLINE seconds) that STT, the LLM and
+# the wait for the first TTS segment all draw from, so a slow STT leaves less
+# time for the LLM instead of adding to it. Each upstream call is made of
+# attempts: an attempt that fails or runs out of time is retried after a
+# jittered backoff while budget is left. An attempt still running after the
+# upstream's recent p95 latency gets a hedged duplicate, and whichever answers
+# first wins. After `failure_threshold` failures in a row an upstream's circuit
+# opens: calls fail at once (and the caller falls back to a canned reply)
+# until one probe call is let through after `reset_timeout` seconds.
+#
+# Attempts are functions of the seconds they may take. They raise for
+# transport errors and for retryable statuses (raise_for_retry); any other
+# response is returned to the caller as is.
+
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '30'))
+# No attempt is started with less budget than this
+MIN_ATTEMPT = 0.05
+RETRY_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+# Threads that run sync attempts; an abandoned attempt keeps one until its socket timeouts end it
+WORKERS = int(os.getenv('RESILIENCE_WORKERS', '64'))
+
+
+class UpstreamError(Exception):
+    def __init__(self, name, status):
+        super().__init__(f"{name} returned {status}")
+        self.status = status
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def raise_for_retry(name, status):
+    if status in RETRY_STATUSES:
+        raise UpstreamError(name, status)
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+# Start the current request's budget; context-local, so it follows the request
+# into asyncio.to_thread and coroutines but not into pool threads
+def start_deadline(seconds=None):
+    _deadline.set(time.monotonic() + (REQUEST_DEADLINE if seconds is None else seconds))
+
+
+def end_deadline():
+    _deadline.set(None)
+
+
+# Seconds an operation may take: `limit`, cut to what is left of the request's budget
+def remaining(limit):
+    expires = _deadline.get()
+    if expires is None:
+        return limit
+    return max(0.0, min(limit, expires - time.monotonic()))
+
+
+# Closed -> open after failure_threshold consecutive failures; open -> half-open
+# after reset_timeout, when one probe is let through; the probe's outcome closes
+# or re-opens the circuit. allow() returns PROBE for that call, which must
+# release() the probe if it ends without an outcome (deadline, cancellation)
+PROBE = 'probe'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return PROBE
+            return False
+
+    # Let the next call probe again; a no-op once the probe recorded an outcome
+    def release(self):
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = 'closed'
+                self.failures = 0
+                self._probing = False
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+# One external API: its breaker, its recent attempt latencies and its call policy
+class Upstream:
+    def __init__(self, name, timeout, retries=2, hedge=False, hedge_after=1.0, backoff=0.1,
+                 failure_threshold=5, reset_timeout=10.0, window=256):
+        self.name = name
+        # Longest single attempt
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        # Hedge delay until there are enough latencies for a p95
+        self.hedge_after = hedge_after
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.short_circuits = 0
+        self.deadline_exceeded = 0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def hedge_delay(self):
+        if len(self._latencies) < 20:
+            return self.hedge_after
+        return max(MIN_ATTEMPT, self.percentile(0.95))
+
+    def _succeeded(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+        self.breaker.record(True)
+
+    def _failed(self):
+        self._count('failures')
+        self.breaker.record(False)
+
+    # The budget is checked before the breaker, so a call that has no time left never takes the probe
+    def _admit(self):
+        self._count('calls')
+        self._budget()
+        allowed = self.breaker.allow()
+        if not allowed:
+            self._count('short_circuits')
+            raise CircuitOpen(f"{self.name} circuit is open")
+        return allowed == PROBE
+
+    def _budget(self):
+        budget = remaining(self.timeout)
+        if budget < MIN_ATTEMPT:
+            self._count('deadline_exceeded')
+            raise DeadlineExceeded(f"{self.name}: request deadline reached")
+        return budget
+
+    def _backoff(self, attempt):
+        # Full jitter, so callers that failed together do not retry together
+        time.sleep(min(random.uniform(0, self.backoff * 2 ** attempt), remaining(self.timeout)))
+
+    # Run attempt(seconds) under the policy and return its result. discard(result)
+    # is called with the results of hedged attempts that lost.
+    def call(self, attempt, idempotent=True, discard=None):
+        probe = self._admit()
+        tries = 1 + (self.retries if idempotent else 0)
+        try:
+            for n in range(tries):
+                if n:
+                    self._count('retried')
+                    self._backoff(n - 1)
+                    allowed = self.breaker.allow()
+                    if not allowed:
+                        self._count('short_circuits')
+                        raise CircuitOpen(f"{self.name} circuit is open")
+                    probe = probe or allowed == PROBE
+                budget = self._budget()
+                try:
+                    return self._attempt(attempt, budget, idempotent and self.hedge, discard)
+                except Exception as e:
+                    self._failed()
+                    error = e
+            raise error
+        finally:
+            if probe:
+                self.breaker.release()
+
+    def _timed(self, attempt, seconds):
+        started = time.monotonic()
+        result = attempt(seconds)
+        return result, time.monotonic() - started
+
+    def _attempt(self, attempt, budget, hedge, discard):
+        started = time.monotonic()
+        deadline = started + budget
+        self._count('attempts')
+        pending = {_executor().submit(self._timed, attempt, budget): False}
+        hedge_at = started + self.hedge_delay() if hedge else None
+        error = None
+        while pending:
+            wake = min(deadline, hedge_at) if hedge_at else deadline
+            done, _ = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                hedged = pending.pop(future)
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self._succeeded(seconds)
+                if hedged:
+                    self._count('hedge_wins')
+                _abandon(pending, discard)
+                return result
+            now = time.monotonic()
+            if hedge_at and now >= hedge_at and pending:
+                hedge_at = None
+                if deadline - now >= MIN_ATTEMPT:
+                    self._count('hedged')
+                    pending[_executor().submit(self._timed, attempt, deadline - now)] = True
+            elif now >= deadline and pending:
+                _abandon(pending, discard)
+                raise DeadlineExceeded(f"{self.name} took longer than {budget:.2f}s")
+        raise error
+
+    # asyncio version of call: attempt(seconds) returns a coroutine; losing and
+    # timed-out attempts are cancelled rather than abandoned
+    async def async_call(self, attempt, idempotent=True):
+        probe = self._admit()
+        tries = 1 + (self.retries if idempotent else 0)
+        try:
+            for n in range(tries):
+                if n:
+                    self._count('retried')
+                    await asyncio.sleep(min(random.uniform(0, self.backoff * 2 ** (n - 1)), remaining(self.timeout)))
+                    allowed = self.breaker.allow()
+                    if not allowed:
+                        self._count('short_circuits')
+                        raise CircuitOpen(f"{self.name} circuit is open")
+                    probe = probe or allowed == PROBE
+                budget = self._budget()
+                try:
+                    return await self._async_attempt(attempt, budget, idempotent and self.hedge)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._failed()
+                    error = e
+            raise error
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def _async_attempt(self, attempt, budget, hedge):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + budget
+        self._count('attempts')
+
+        async def timed(seconds):
+            begin = loop.time()
+            return await attempt(seconds), loop.time() - begin
+
+        pending = {asyncio.ensure_future(timed(budget)): False}
+        hedge_at = started + self.hedge_delay() if hedge else None
+        error = None
+        try:
+            while pending:
+                wake = min(deadline, hedge_at) if hedge_at else deadline
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    hedged = pending.pop(task)
+                    try:
+                        result, seconds = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    self._succeeded(seconds)
+                    if hedged:
+                        self._count('hedge_wins')
+                    return result
+                now = loop.time()
+                if hedge_at and now >= hedge_at and pending:
+                    hedge_at = None
+                    if deadline - now >= MIN_ATTEMPT:
+                        self._count('hedged')
+                        pending[asyncio.ensure_future(timed(deadline - now))] = True
+                elif now >= deadline and pending:
+                    raise DeadlineExceeded(f"{self.name} took longer than {budget:.2f}s")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            return {
+                'state': self.breaker.state,
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.retried,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'failures': self.failures,
+                'short_circuits': self.short_circuits,
+                'deadline_exceeded': self.deadline_exceeded,
+                'circuit_opens': self.breaker.opens,
+                'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+                'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            }
+
+
+# Leave the losing attempts running; their results are handed to discard when they arrive
+def _abandon(pending, discard):
+    for future in pending:
+        if not future.cancel() and discard is not None:
+            future.add_done_callback(lambda f: discard(f.result()[0]) if f.exception() is None else None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='upstream')
+    return _pool
+
+
+def _upstream_from_env(name, timeout, hedge, hedge_after):
+    prefix = name.upper()
+    return Upstream(name, timeout=float(os.getenv(f'{prefix}_TIMEOUT', str(timeout))),
+                    retries=int(os.getenv(f'{prefix}_RETRIES', '2')),
+                    hedge=os.getenv(f'{prefix}_HEDGE', '1' if hedge else '0') == '1',
+                    hedge_after=hedge_after,
+                    failure_threshold=int(os.getenv('BREAKER_FAILURES', '5')),
+                    reset_timeout=float(os.getenv('BREAKER_RESET', '10')))
+
+
+# Hedging doubles the upstream work of the slowest 5% of calls; it is off for the
+# LLM, where that would spend free-tier quota
+stt = _upstream_from_env('stt', timeout=15.0, hedge=True, hedge_after=2.0)
+llm = _upstream_from_env('llm', timeout=25.0, hedge=False, hedge_after=5.0)
+tts = _upstream_from_env('tts', timeout=15.0, hedge=True, hedge_after=2.0)
+# The second STT provider; stt_providers races it against Aisha instead of hedging it
+gemini = _upstream_from_env('gemini', timeout=15.0, hedge=False, hedge_after=2.0)
+UPSTREAMS = (stt, llm, tts, gemini)
+
+
+def stats():
+    return {upstream.name: upstream.stats() for upstream in UPSTREAMS}
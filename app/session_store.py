@@ -0,0 +1,222 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Per-browser conversation state. A session is a compact record: the last
+# few turns as (role, text) pairs plus the dialog flags, stored serialized.
+# Sessions idle for longer than the TTL expire, and the least recently used
+# ones are evicted once the stored bytes exceed the budget. The in-process
+# store serves a single worker; the SQLite store is shared by every worker
+# process on the host.
+
+MAX_TURNS = 10
+ROLES = {'u': 'user', 'a': 'assistant'}
+ROLE_CODES = {role: code for code, role in ROLES.items()}
+
+
+def new_session_id():
+    return secrets.token_urlsafe(18)
+
+
+# Session ids come from cookies, so anything else is treated as no session
+def valid_session_id(sid):
+    return isinstance(sid, str) and 16 <= len(sid) <= 64 and all(c.isalnum() or c in '-_' for c in sid)
+
+
+class Session:
+    def __init__(self, sid, turns=(), waiting_for_id=False):
+        self.sid = sid
+        self.turns = deque(turns, maxlen=MAX_TURNS)
+        self.waiting_for_id = waiting_for_id
+
+    def add(self, role, content):
+        self.turns.append((role, content))
+
+    # Turns in the chat-completions message format
+    def messages(self):
+        return [{"role": role, "content": content} for role, content in self.turns]
+
+    def encode(self):
+        record = {'t': [[ROLE_CODES[role], content] for role, content in self.turns]}
+        if self.waiting_for_id:
+            record['w'] = 1
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def decode(cls, sid, data):
+        record = json.loads(data)
+        return cls(sid, [(ROLES[code], content) for code, content in record.get('t', [])], bool(record.get('w')))
+
+
+class MemorySessionStore:
+    # Bytes charged per session on top of its record: key, tuple and dict slot
+    OVERHEAD = 160
+
+    def __init__(self, ttl=1800.0, max_bytes=16 * 2**20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # sid -> (last_seen, record), least recently used first
+        self._bytes = 0
+        self.counters = {'loads': 0, 'hits': 0, 'saves': 0, 'expired': 0, 'evicted': 0}
+
+    def _drop(self, sid):
+        _, data = self._sessions.pop(sid)
+        self._bytes -= len(data) + self.OVERHEAD
+
+    # Unknown or expired ids get a fresh, empty session under the same id
+    def load(self, sid):
+        now = time.time()
+        with self._lock:
+            self.counters['loads'] += 1
+            entry = self._sessions.get(sid)
+            if entry is not None and now - entry[0] > self.ttl:
+                self._drop(sid)
+                self.counters['expired'] += 1
+                entry = None
+            if entry is None:
+                return Session(sid)
+            self._sessions[sid] = (now, entry[1])
+            self._sessions.move_to_end(sid)
+            self.counters['hits'] += 1
+            data = entry[1]
+        return Session.decode(sid, data)
+
+    def save(self, session):
+        data = session.encode()
+        now = time.time()
+        with self._lock:
+            if session.sid in self._sessions:
+                self._drop(session.sid)
+            self._sessions[session.sid] = (now, data)
+            self._bytes += len(data) + self.OVERHEAD
+            self.counters['saves'] += 1
+            # Least recently used first, so expired sessions are at the front
+            while self._sessions:
+                sid, (last_seen, _) = next(iter(self._sessions.items()))
+                if now - last_seen > self.ttl:
+                    self.counters['expired'] += 1
+                elif self._bytes > self.max_bytes and sid != session.sid:
+                    self.counters['evicted'] += 1
+                else:
+                    break
+                self._drop(sid)
+
+    def delete(self, sid):
+        with self._lock:
+            if sid in self._sessions:
+                self._drop(sid)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, backend='memory', sessions=len(self._sessions), bytes=self._bytes,
+                        max_bytes=self.max_bytes)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path, ttl=1800.0, max_bytes=256 * 2**20, sweep_every=100, timeout=5.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_every = sweep_every
+        self.timeout = timeout
+        self._local = threading.local()
+        self._saves = 0
+        self._lock = threading.Lock()
+        self.counters = {'loads': 0, 'hits': 0, 'saves': 0, 'expired': 0, 'evicted': 0}
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, '
+                               'last_seen REAL NOT NULL, data BLOB NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)')
+
+    # sqlite3 connections are per thread
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def load(self, sid):
+        now = time.time()
+        connection = self._connection()
+        self._count('loads')
+        row = connection.execute('SELECT last_seen, data FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None:
+            return Session(sid)
+        if now - row[0] > self.ttl:
+            connection.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            self._count('expired')
+            return Session(sid)
+        connection.execute('UPDATE sessions SET last_seen = ? WHERE sid = ?', (now, sid))
+        self._count('hits')
+        return Session.decode(sid, row[1])
+
+    def save(self, session):
+        connection = self._connection()
+        connection.execute('INSERT INTO sessions (sid, last_seen, data) VALUES (?, ?, ?) '
+                           'ON CONFLICT(sid) DO UPDATE SET last_seen = excluded.last_seen, data = excluded.data',
+                           (session.sid, time.time(), session.encode()))
+        self._count('saves')
+        with self._lock:
+            self._saves += 1
+            sweep = self._saves % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    # Drop expired sessions, then the least recently used ones until the budget fits
+    def sweep(self):
+        connection = self._connection()
+        expired = connection.execute('DELETE FROM sessions WHERE last_seen < ?', (time.time() - self.ttl,)).rowcount
+        self._count('expired', expired)
+        (total,) = connection.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sessions').fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute('SELECT sid, LENGTH(data) FROM sessions ORDER BY last_seen').fetchall()
+        victims = []
+        for sid, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((sid,))
+            total -= size
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('DELETE FROM sessions WHERE sid = ?', victims)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self._count('evicted', len(victims))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def stats(self):
+        sessions, total = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions').fetchone()
+        with self._lock:
+            return dict(self.counters, backend='sqlite', sessions=sessions, bytes=total, max_bytes=self.max_bytes)
+
+
+# Store chosen by SESSION_BACKEND: "memory" (default) for one worker process,
+# "sqlite" when several workers must see the same sessions
+def session_store_from_env(default_path):
+    ttl = float(os.getenv('SESSION_TTL', '1800'))
+    backend = os.getenv('SESSION_BACKEND', 'memory')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(os.getenv('SESSION_DB', default_path), ttl=ttl,
+                                  max_bytes=int(os.getenv('SESSION_MAX_BYTES', str(256 * 2**20))))
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return MemorySessionStore(ttl=ttl, max_bytes=int(os.getenv('SESSION_MAX_BYTES', str(16 * 2**20))))
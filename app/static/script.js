@@ -55,6 +55,111 @@ function addToChatHistory(role, message) {
     chatHistory.scrollTop = chatHistory.scrollHeight;
 }
 
+// Bot message whose text is filled in as tokens arrive
+function startBotMessage() {
+    const div = document.createElement('div');
+    div.className = 'p-2 text-green-600';
+    div.innerHTML = '<strong>Bot:</strong> ';
+    const text = document.createElement('span');
+    div.appendChild(text);
+    chatHistory.appendChild(div);
+    return text;
+}
+
+// Read a Server-Sent Events response body, calling onEvent(name, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let name = 'message';
+            const data = [];
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) {
+                    name = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data.push(line.slice(5).trim());
+                }
+            }
+            if (data.length) {
+                onEvent(name, JSON.parse(data.join('\n')));
+            }
+        }
+    }
+}
+
+// Post one turn to a streaming endpoint and render the reply as it is generated.
+// Audio starts as soon as the server has queued the first sentence for speech.
+// Returns the final payload (same fields as /process_text) or null on a request error.
+async function streamTurn(url, options, errorHint) {
+    const started = performance.now();
+    let firstToken = null;
+    let botText = null;
+    let audioStarted = false;
+    let result = null;
+    const response = await fetch(url, options);
+    if (!response.ok) {
+        const failure = await response.json();
+        status.textContent = `Error: ${failure.error}. ${errorHint}`;
+        return null;
+    }
+    await readEventStream(response, (name, data) => {
+        if (name === 'transcript') {
+            addToChatHistory('user', data.transcript || 'No transcript');
+        } else if (name === 'token') {
+            if (!botText) {
+                firstToken = performance.now() - started;
+                botText = startBotMessage();
+            }
+            botText.textContent += data.text;
+            chatHistory.scrollTop = chatHistory.scrollHeight;
+        } else if (name === 'audio') {
+            audioStarted = true;
+            playTtsAudio(data.audio_url, errorHint);
+        } else if (name === 'done' || name === 'error') {
+            result = data;
+        }
+    });
+    if (result) {
+        // The early stream is served only by the worker that ran the turn; when it could not
+        // be loaded, the final audio_url (served by any worker) is played instead
+        result.audioStarted = audioStarted && !ttsPlayer.error;
+    }
+    const total = performance.now() - started;
+    console.info(`First visible token: ${firstToken === null ? '-' : firstToken.toFixed(0)} ms, total: ${total.toFixed(0)} ms`,
+        result && result.timing);
+    return result;
+}
+
+// The player element itself feeds the waveform, so each reply is fetched once. It goes to
+// the speakers directly: the analyser also receives the microphone and must stay silent.
+let playerSource;
+
+function playTtsAudio(audioUrl, errorHint) {
+    if (!playerSource) {
+        playerSource = audioContext.createMediaElementSource(ttsPlayer);
+        playerSource.connect(analyser);
+        playerSource.connect(audioContext.destination);
+    }
+    if (audioContext.state === 'suspended') {
+        audioContext.resume();
+    }
+    ttsPlayer.src = audioUrl.toLowerCase(); // Ensure lowercase URL
+    ttsPlayer.play().catch(err => {
+        status.textContent = `Error playing audio. ${errorHint}`;
+        console.error('TTS playback error:', err);
+    });
+}
+
 function getMediaRecorder(stream) {
     const mimeTypes = ['audio/ogg', 'audio/webm', ''];
     for (let mimeType of mimeTypes) {
@@ -96,36 +201,24 @@ recordBtn.addEventListener('click', async () => {
 
             status.textContent = 'Processing audio...';
             try {
-                const response = await fetch('/process_audio', {
+                const result = await streamTurn('/process_audio_stream', {
                     method: 'POST',
                     body: formData
-                });
-                const result = await response.json();
+                }, 'Try speaking clearly or use text input.');
+                if (!result) {
+                    return;
+                }
 
                 if (result.error) {
                     status.textContent = `Error: ${result.error}. Try speaking clearly or use text input.`;
                     return;
                 }
-
-                addToChatHistory('user', result.transcript || 'No transcript');
-                addToChatHistory('assistant', result.response);
                 status.textContent = '';
 
-                if (result.audio_url) {
-                    ttsPlayer.src = result.audio_url.toLowerCase(); // Ensure lowercase URL
-                    ttsPlayer.play().catch(err => {
-                        status.textContent = 'Error playing audio. Check TTS API key or try text input.';
-                        console.error('TTS playback error:', err);
-                    });
-
-                    // Waveform for playback
-                    const audio = new Audio(result.audio_url.toLowerCase());
-                    const source = audioContext.createMediaElementSource(audio);
-                    source.connect(analyser);
-                    analyser.connect(audioContext.destination);
-                    audio.play().catch(err => console.error('Waveform audio error:', err));
-                } else {
+                if (!result.audio_url) {
                     status.textContent = 'No audio response received. TTS may have failed.';
+                } else if (!result.audioStarted) {
+                    playTtsAudio(result.audio_url, 'Check TTS API key or try text input.');
                 }
             } catch (err) {
                 status.textContent = 'Error processing audio. Try typing your query.';
@@ -175,38 +268,26 @@ sendBtn.addEventListener('click', async () => {
     }
     status.textContent = 'Processing text...';
     try {
-        const response = await fetch('/process_text', {
+        const result = await streamTurn('/process_text_stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ text })
-        });
-        const result = await response.json();
+        }, 'Check TTS API key or try again.');
+        if (!result) {
+            return;
+        }
+        textInput.value = '';
 
         if (result.error) {
             status.textContent = `Error: ${result.error}. Check TTS API key or try again.`;
             return;
         }
-
-        addToChatHistory('user', result.transcript);
-        addToChatHistory('assistant', result.response);
         status.textContent = '';
-        textInput.value = '';
 
-        if (result.audio_url) {
-            ttsPlayer.src = result.audio_url.toLowerCase(); // Ensure lowercase URL
-            ttsPlayer.play().catch(err => {
-                status.textContent = 'Error playing audio. Check TTS API key or try again.';
-                console.error('TTS playback error:', err);
-            });
-
-            // Waveform for playback
-            const audio = new Audio(result.audio_url.toLowerCase());
-            const source = audioContext.createMediaElementSource(audio);
-            source.connect(analyser);
-            analyser.connect(audioContext.destination);
-            audio.play().catch(err => console.error('Waveform audio error:', err));
-        } else {
+        if (!result.audio_url) {
             status.textContent = 'No audio response received. TTS may have failed.';
+        } else if (!result.audioStarted) {
+            playTtsAudio(result.audio_url, 'Check TTS API key or try again.');
         }
     } catch (err) {
         status.textContent = 'Error processing text. Check server or API keys.';
@@ -0,0 +1,221 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+# Structured, non-blocking logging for the request path.
+#
+# A log line is an event name with fields: log.info('tts_response', status=200).
+# Records are put on a bounded queue and written as one JSON object per line by
+# a background thread, so a request never waits on stdout; when the writer falls
+# behind, records are dropped and counted rather than blocking. String fields
+# are cut to LOG_FIELD_CHARS. Upstream response bodies are verbose: payload()
+# keeps them on only a LOG_PAYLOAD_SAMPLE share of calls. Every line written
+# for a request carries its request_id (see start_request), also sent back in
+# the X-Request-ID response header, so a turn's lines can be grouped.
+#
+#   LOG_LEVEL           DEBUG, INFO (default), WARNING, ERROR or OFF
+#   LOG_FORMAT          json (default) or text
+#   LOG_PAYLOAD_SAMPLE  share of payload() calls that include the body, default 0.01
+#   LOG_FIELD_CHARS     longest string field kept, default 300
+#   LOG_QUEUE_SIZE      records waiting for the writer before new ones are dropped, default 10000
+
+LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+FORMAT = os.getenv('LOG_FORMAT', 'json')
+PAYLOAD_SAMPLE = float(os.getenv('LOG_PAYLOAD_SAMPLE', '0.01'))
+FIELD_CHARS = int(os.getenv('LOG_FIELD_CHARS', '300'))
+QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Ids accepted from a client or proxy; anything else is replaced
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_counters = {'logged': 0, 'dropped': 0, 'sampled_out': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+# Correlation id for the current request: the caller's X-Request-ID when it is
+# usable, else a new one. Threads and tasks started from the request inherit it
+def start_request(incoming=None):
+    request_id = incoming if incoming and REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    return request_id
+
+
+def end_request():
+    _request_id.set(None)
+
+
+def request_id():
+    return _request_id.get()
+
+
+# function, run later on another thread, logging under the current request id; unlike
+# copying the whole context this leaves the request's other state behind
+def with_request_id(function):
+    current = _request_id.get()
+
+    def run(*args, **kwargs):
+        token = _request_id.set(current)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _request_id.reset(token)
+    return run
+
+
+def bound(value, limit=None):
+    limit = limit or FIELD_CHARS
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    elif not isinstance(value, (str, int, float, bool, type(None))):
+        value = str(value)
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}...(+{len(value) - limit} chars)"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        line = {'ts': round(record.created, 3), 'level': record.levelname.lower(), 'logger': record.name,
+                'event': record.getMessage()}
+        if getattr(record, 'request_id', None):
+            line['request_id'] = record.request_id
+        line.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            line['exception'] = bound(self.formatException(record.exc_info), FIELD_CHARS * 4)
+        return json.dumps(line, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f"{key}={value}" for key, value in (getattr(record, 'fields', None) or {}).items())
+        request = f" [{record.request_id}]" if getattr(record, 'request_id', None) else ''
+        text = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname} {record.name}" \
+               f"{request} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+# Writes to whatever sys.stdout is when the record is written, as print() did
+class StdoutHandler(logging.StreamHandler):
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+# The writer thread: turns the queued entries into log records for the handlers
+class Listener(logging.handlers.QueueListener):
+    def prepare(self, entry):
+        created, name, level, event, request_id, fields, exc_info = entry
+        record = logging.LogRecord(name, level, '', 0, event, None, exc_info)
+        record.created = created
+        record.request_id = request_id
+        record.fields = fields
+        return record
+
+
+# Entries waiting for the writer. The caller only puts a tuple on a SimpleQueue, much
+# cheaper than building a LogRecord and passing it through a QueueHandler; the queue's
+# size is checked first and an entry that finds it full is dropped
+_queue = queue.SimpleQueue()
+
+
+class Logger:
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"voice.{name}")
+
+    def _log(self, level, event, fields, exc_info=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if _queue.qsize() >= QUEUE_SIZE:
+            _count('dropped')
+            return
+        _count('logged')
+        _queue.put((time.time(), self._logger.name, level, event, _request_id.get(),
+                    {key: bound(value) for key, value in fields.items()}, sys.exc_info() if exc_info else None))
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+    # An upstream payload at debug level, with its body on a sampled share of calls only
+    def payload(self, event, body, **fields):
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return
+        if PAYLOAD_SAMPLE >= 1 or random.random() < PAYLOAD_SAMPLE:
+            fields['body'] = body
+        else:
+            _count('sampled_out')
+        self._log(logging.DEBUG, event, fields)
+
+
+def get_logger(name):
+    return Logger(name)
+
+
+_listener = None
+_level = None
+
+
+# Set the level of the voice.* loggers and start the writer; called once on import
+def configure(level=None, fmt=None, stream=None):
+    global _listener, _level
+    stop()
+    level = _level = (level or LEVEL).upper()
+    root = logging.getLogger('voice')
+    if level == 'OFF':
+        root.setLevel(logging.CRITICAL + 1)
+        return
+    root.setLevel(getattr(logging, level))
+    writer = logging.StreamHandler(stream) if stream else StdoutHandler()
+    writer.setFormatter(JsonFormatter() if (fmt or FORMAT) == 'json' else TextFormatter())
+    _listener = Listener(_queue, writer)
+    _listener.start()
+
+
+# Write out what is queued and stop the writer thread
+def stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {**counters, 'level': _level,
+            'queued': _queue.qsize(),
+            'payload_sample': PAYLOAD_SAMPLE, 'field_chars': FIELD_CHARS}
+
+
+configure()
+atexit.register(stop)
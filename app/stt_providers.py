@@ -0,0 +1,415 @@
+import asyncio
+import base64
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import http_client
+import resilience
+import structured_log
+from utterances import NO_SPEECH, STT_UNAVAILABLE
+from uz_text import clean_transcription
+
+log = structured_log.get_logger('stt')
+
+# Speech-to-text providers behind one interface, and a router that races them.
+#
+# A provider turns audio bytes into a transcript: '' when it heard no speech,
+# STTRejected when the service refused the audio with a message for the user,
+# any other exception when it could not be reached. Each provider goes through
+# its own resilience.Upstream, so it has its own retries and circuit breaker.
+#
+# The router starts the provider expected to be fastest, and starts the next
+# one if no acceptable transcript (non-empty and passing clean_transcription)
+# has arrived after the leader's recent p90 latency, or at once when the
+# leader fails. The first acceptable transcript wins and the others are
+# cancelled. Per-provider latency histograms decide the order: the leader is
+# the provider with the lowest median latency divided by its success rate.
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, float('inf'))
+# Race delay until the leader has this many latencies
+MIN_SAMPLES = 20
+GEMINI_PROMPT = ("Transcribe the audio to Uzbek (Latin or Cyrillic) text only. "
+                 "Do not include explanations, metadata, or commentary.")
+
+
+class STTRejected(Exception):
+    pass
+
+
+# Fixed-bucket latency histogram of recent calls: the counts are halved every
+# `window` samples, so the routing order follows a provider that slows down.
+# Outcomes also feed a success rate that decays the same way.
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS, window=100, decay=0.9):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        # Samples ever observed
+        self.count = 0
+        self.window = window
+        self.decay = decay
+        self.success_rate = 1.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += 1
+        self.count += 1
+        if self.total >= self.window:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+        self.success_rate = self.success_rate * self.decay + (1 - self.decay)
+
+    def failed(self):
+        self.success_rate *= self.decay
+
+    # Upper bound of the bucket holding the q-quantile
+    def quantile(self, q):
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {'+Inf' if bound == float('inf') else str(bound): count
+                for bound, count in zip(self.buckets, self.counts) if count}
+
+
+def stt_fields():
+    return {
+        "title": f"recording_{uuid.uuid4()}",
+        "has_diarization": "false",
+        "language": "uz"
+    }
+
+
+class AishaSTT:
+    name = 'aisha'
+
+    def __init__(self, api_key, upstream=None):
+        self.api_key = api_key
+        self._upstream = upstream
+
+    # Looked up on every call, so a policy swapped in resilience after start-up is used
+    @property
+    def upstream(self):
+        return self._upstream or resilience.stt
+
+    def _transcript(self, status, body):
+        log.payload('stt_response', body, provider=self.name, status=status)
+        if status == 200:
+            return json.loads(body).get("transcript", "")
+        log.warning('stt_rejected', provider=self.name, status=status, body=body)
+        raise STTRejected(json.loads(body).get("error", "Unknown STT error"))
+
+    def transcribe(self, audio, filename, mime_type):
+        url = http_client.aisha_url("/api/v1/stt/post/")
+
+        def attempt(seconds):
+            response = http_client.post(url, headers={"x-api-key": self.api_key}, data=stt_fields(),
+                                        files={"audio": (filename, audio)}, timeout=http_client.timeouts(seconds))
+            resilience.raise_for_retry('stt', response.status_code)
+            return response.status_code, response.text
+
+        return self._transcript(*self.upstream.call(attempt))
+
+    async def transcribe_async(self, http, audio, filename, mime_type):
+        import aiohttp
+
+        # A form is consumed when sent, so every attempt builds its own
+        async def attempt(seconds):
+            form = aiohttp.FormData(stt_fields())
+            form.add_field('audio', audio, filename=filename)
+            async with http.post(http_client.aisha_url("/api/v1/stt/post/"),
+                                 headers={"x-api-key": self.api_key}, data=form) as response:
+                body = await response.text()
+                resilience.raise_for_retry('stt', response.status)
+                return response.status, body
+
+        return self._transcript(*await self.upstream.async_call(attempt))
+
+
+# Gemini through its REST API: the audio goes inline with a transcription prompt
+class GeminiSTT:
+    name = 'gemini'
+
+    def __init__(self, api_key, model=None, upstream=None):
+        self.api_key = api_key
+        self.model = model or os.getenv('GEMINI_STT_MODEL', 'gemini-2.0-flash')
+        self._upstream = upstream
+
+    @property
+    def upstream(self):
+        return self._upstream or resilience.gemini
+
+    def _request(self, audio, mime_type):
+        url = http_client.gemini_url(f"/v1beta/models/{self.model}:generateContent")
+        body = {
+            "contents": [{"role": "user", "parts": [
+                {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(audio).decode("ascii")}},
+                {"text": GEMINI_PROMPT},
+            ]}],
+            "generationConfig": {"temperature": 0},
+        }
+        return url, {"x-goog-api-key": self.api_key}, body
+
+    # LLM transcripts can come wrapped in commentary; what clean_transcription rejects is no speech.
+    # Gemini's errors are not worded for customers, so a refusal is only a failure
+    def _transcript(self, status, result):
+        if status != 200:
+            log.warning('stt_failed', provider=self.name, status=status, body=result)
+            raise resilience.UpstreamError('gemini', status)
+        parts = [part.get("text", "") for candidate in result.get("candidates") or []
+                 for part in (candidate.get("content") or {}).get("parts") or []]
+        return clean_transcription(' '.join(parts)) or ''
+
+    def transcribe(self, audio, filename, mime_type):
+        url, headers, body = self._request(audio, mime_type)
+
+        def attempt(seconds):
+            response = http_client.post(url, headers=headers, json=body, timeout=http_client.timeouts(seconds))
+            resilience.raise_for_retry('gemini', response.status_code)
+            return response.status_code, response.json()
+
+        return self._transcript(*self.upstream.call(attempt))
+
+    async def transcribe_async(self, http, audio, filename, mime_type):
+        url, headers, body = self._request(audio, mime_type)
+
+        async def attempt(seconds):
+            async with http.post(url, headers=headers, json=body) as response:
+                resilience.raise_for_retry('gemini', response.status)
+                return response.status, await response.json(content_type=None)
+
+        return self._transcript(*await self.upstream.async_call(attempt))
+
+
+class ProviderStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.started = 0
+        self.wins = 0
+        self.empty = 0
+        self.failures = 0
+        self.cancelled = 0
+
+
+class STTRouter:
+    def __init__(self, providers, race_after=None, default_race_after=1.0, timeout=15.0, workers=64):
+        self.providers = list(providers)
+        # Seconds before the next provider joins; None adapts to the leader's p90
+        self.race_after = race_after
+        self.default_race_after = default_race_after
+        self.timeout = timeout
+        self._stats = {provider.name: ProviderStats() for provider in self.providers}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stt')
+
+    def _score(self, provider):
+        stats = self._stats[provider.name]
+        if provider.upstream.breaker.state == 'open':
+            return float('inf')
+        with self._lock:
+            if stats.latency.count < MIN_SAMPLES:
+                return 0.0
+            return stats.latency.quantile(0.5) / max(stats.latency.success_rate, 0.05)
+
+    # Providers in the order they are started; ties keep the configured order
+    def order(self):
+        return sorted(self.providers, key=self._score)
+
+    def race_delay(self, leader):
+        if self.race_after is not None:
+            return self.race_after
+        stats = self._stats[leader.name]
+        with self._lock:
+            if stats.latency.count < MIN_SAMPLES:
+                return self.default_race_after
+            return stats.latency.quantile(0.9)
+
+    def _count(self, provider, name):
+        with self._lock:
+            stats = self._stats[provider.name]
+            setattr(stats, name, getattr(stats, name) + 1)
+
+    def _observe(self, provider, seconds, ok):
+        with self._lock:
+            if ok:
+                self._stats[provider.name].latency.observe(seconds)
+            else:
+                self._stats[provider.name].latency.failed()
+
+    # One provider's outcome: ('ok', transcript) or ('error', exception)
+    def _run(self, provider, audio, filename, mime_type):
+        started = time.monotonic()
+        try:
+            transcript = provider.transcribe(audio, filename, mime_type)
+        except Exception as e:
+            self._observe(provider, 0.0, False)
+            return 'error', e
+        self._observe(provider, time.monotonic() - started, True)
+        return 'ok', transcript
+
+    def _accept(self, provider, outcome, outcomes):
+        kind, value = outcome
+        if kind == 'ok' and value and clean_transcription(value):
+            self._count(provider, 'wins')
+            log.debug('stt_won', provider=provider.name)
+            return value.strip()
+        if kind == 'ok':
+            self._count(provider, 'empty')
+        else:
+            self._count(provider, 'failures')
+            log.warning('stt_failed', provider=provider.name, error=str(value))
+        outcomes.append(outcome)
+        return None
+
+    # (transcript, None) from the first provider with an acceptable one, else (None, message)
+    def transcribe(self, audio, filename, mime_type='audio/mpeg'):
+        queue = self.order()
+        if not queue:
+            return None, STT_UNAVAILABLE
+        deadline = time.monotonic() + resilience.remaining(self.timeout)
+        pending = {}
+        outcomes = []
+        next_at = None
+
+        def launch():
+            provider = queue.pop(0)
+            self._count(provider, 'started')
+            # The request's deadline follows the provider into its thread
+            future = self._pool.submit(contextvars.copy_context().run, self._run, provider, audio, filename,
+                                       mime_type)
+            pending[future] = provider
+            return time.monotonic() + self.race_delay(provider) if queue else None
+
+        try:
+            next_at = launch()
+            while pending or queue:
+                now = time.monotonic()
+                if queue and (not pending or now >= next_at):
+                    next_at = launch()
+                    continue
+                if now >= deadline:
+                    break
+                wake = min(deadline, next_at) if queue else deadline
+                done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = pending.pop(future)
+                    transcript = self._accept(provider, future.result(), outcomes)
+                    if transcript:
+                        return transcript, None
+            return None, self._no_transcript(outcomes)
+        finally:
+            # A started request cannot be stopped; it ends at its own timeout and its result is dropped
+            for future, provider in pending.items():
+                future.cancel()
+                self._count(provider, 'cancelled')
+
+    async def _run_async(self, provider, http, audio, filename, mime_type):
+        started = time.monotonic()
+        try:
+            transcript = await provider.transcribe_async(http, audio, filename, mime_type)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._observe(provider, 0.0, False)
+            return 'error', e
+        self._observe(provider, time.monotonic() - started, True)
+        return 'ok', transcript
+
+    # asyncio version of transcribe; the losers' requests are cancelled
+    async def transcribe_async(self, http, audio, filename, mime_type='audio/mpeg'):
+        queue = self.order()
+        if not queue:
+            return None, STT_UNAVAILABLE
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + resilience.remaining(self.timeout)
+        pending = {}
+        outcomes = []
+
+        def launch():
+            provider = queue.pop(0)
+            self._count(provider, 'started')
+            pending[asyncio.ensure_future(self._run_async(provider, http, audio, filename, mime_type))] = provider
+            return loop.time() + self.race_delay(provider) if queue else None
+
+        try:
+            next_at = launch()
+            while pending or queue:
+                now = loop.time()
+                if queue and (not pending or now >= next_at):
+                    next_at = launch()
+                    continue
+                if now >= deadline:
+                    break
+                wake = min(deadline, next_at) if queue else deadline
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    transcript = self._accept(provider, task.result(), outcomes)
+                    if transcript:
+                        return transcript, None
+            return None, self._no_transcript(outcomes)
+        finally:
+            for task, provider in pending.items():
+                task.cancel()
+                self._count(provider, 'cancelled')
+
+    # What to tell the user when no provider produced a transcript
+    def _no_transcript(self, outcomes):
+        if any(kind == 'ok' for kind, _ in outcomes):
+            return NO_SPEECH
+        for kind, error in outcomes:
+            if isinstance(error, STTRejected):
+                return str(error)
+        return STT_UNAVAILABLE
+
+    def stats(self):
+        result = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                # A quantile past the last finite bucket is reported as None
+                p50, p90, p99 = (stats.latency.quantile(q) for q in (0.5, 0.9, 0.99))
+                p50, p90, p99 = (None if p == float('inf') else p for p in (p50, p90, p99))
+                result[name] = {
+                    'transcripts': stats.latency.count,
+                    'started': stats.started,
+                    'wins': stats.wins,
+                    'empty': stats.empty,
+                    'failures': stats.failures,
+                    'cancelled': stats.cancelled,
+                    'success_rate': round(stats.latency.success_rate, 3),
+                    'p50_s': p50,
+                    'p90_s': p90,
+                    'p99_s': p99,
+                    'latency_histogram': stats.latency.snapshot(),
+                }
+        result['order'] = [provider.name for provider in self.order()]
+        return result
+
+
+# Providers whose keys are set, in STT_PROVIDERS order (default "aisha,gemini")
+def stt_router_from_env(aisha_key=None, gemini_key=None):
+    available = {}
+    if aisha_key:
+        available['aisha'] = AishaSTT(aisha_key)
+    if gemini_key:
+        available['gemini'] = GeminiSTT(gemini_key)
+    names = [name.strip() for name in os.getenv('STT_PROVIDERS', 'aisha,gemini').split(',')]
+    race_after = os.getenv('STT_RACE_AFTER')
+    return STTRouter([available[name] for name in names if name in available],
+                     race_after=float(race_after) if race_after else None,
+                     timeout=float(os.getenv('STT_TIMEOUT', '15')))
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import structured_log
+
+log = structured_log.get_logger('tts_cache')
+
+# Synthesized audio keyed by everything that changes the output: text, voice
+# model, format, rate, quality, channels and language. A small in-memory LRU
+# sits in front of a byte-budgeted directory; both tiers evict least recently
+# used entries first and drop entries older than the TTL. The directory may be
+# shared by several workers: a file another worker stored after this one started
+# is indexed when it is first asked for. Audio that is still downloading from
+# the TTS API can be read while it arrives.
+
+
+def make_key(text, model, fmt, rate, quality, channels='stereo', language='uz'):
+    raw = '\x1f'.join(str(part) for part in (text, model, fmt, rate, quality, channels, language))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Audio being downloaded into the cache; readers get the bytes as they arrive,
+# before the finished file is stored
+class Download:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.ok = False
+        self._changed = threading.Condition()
+
+    def write(self, chunk):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    def finish(self, ok):
+        with self._changed:
+            self.done = True
+            self.ok = ok
+            self._changed.notify_all()
+
+    # Chunks from index start on, without waiting: (chunks, done, ok)
+    def read(self, start=0):
+        with self._changed:
+            return self.chunks[start:], self.done, self.ok
+
+    # Every chunk in order as it arrives; raises IOError when the download fails and
+    # TimeoutError when no chunk arrives within timeout
+    def iter_chunks(self, timeout=None):
+        i = 0
+        while True:
+            with self._changed:
+                if not self._changed.wait_for(lambda: i < len(self.chunks) or self.done, timeout):
+                    raise TimeoutError("TTS audio download stalled")
+                chunks, done, ok = self.chunks[i:], self.done, self.ok
+            yield from chunks
+            i += len(chunks)
+            if done:
+                if not ok:
+                    raise IOError("TTS audio download failed")
+                return
+
+
+class TTSCache:
+    def __init__(self, directory, memory_bytes=32 * 2**20, disk_bytes=512 * 2**20, ttl=7 * 24 * 3600, suffix='.mp3'):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created, data)
+        self._memory_size = 0
+        self._disk = OrderedDict()    # key -> (created, size)
+        self._disk_size = 0
+        self._inflight = {}
+        self._downloads = {}
+        self.counters = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'memory_evictions': 0, 'disk_evictions': 0, 'expired': 0, 'stores': 0, 'adopted': 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+        self._load_disk_index()
+
+    # Rebuild the disk index once at startup, oldest first
+    def _load_disk_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(self.suffix)], stat.st_size))
+        for created, key, size in sorted(entries):
+            self._disk[key] = (created, size)
+            self._disk_size += size
+        with self._lock:
+            self._evict_disk()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _remember(self, key, created, data):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[1])
+        self._memory[key] = (created, data)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.counters['memory_evictions'] += 1
+
+    def _forget_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_size -= entry[1]
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key = next(iter(self._disk))
+            self._forget_disk(key)
+            self.counters['disk_evictions'] += 1
+
+    # Index a file another worker wrote after this one started; returns its entry or None
+    def _adopt(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except OSError:
+            return None
+        if self._expired(stat.st_mtime):
+            return None
+        with self._lock:
+            entry = self._disk.get(key)
+            if entry is None:
+                entry = self._disk[key] = (stat.st_mtime, stat.st_size)
+                self._disk_size += stat.st_size
+                self.counters['adopted'] += 1
+                self._evict_disk()
+            return entry if key in self._disk else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    self._memory_size -= len(entry[1])
+                    del self._memory[key]
+                    self._forget_disk(key)
+                    self.counters['expired'] += 1
+                    self.counters['misses'] += 1
+                    return None
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return entry[1]
+            disk_entry = self._disk.get(key)
+            indexed = disk_entry is not None
+            if indexed and self._expired(disk_entry[0]):
+                self._forget_disk(key)
+                self.counters['expired'] += 1
+                disk_entry = None
+        if not indexed:
+            disk_entry = self._adopt(key)
+        if disk_entry is not None:
+            try:
+                with open(self.path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                # Another worker evicted it
+                data = None
+            with self._lock:
+                if data is None:
+                    entry = self._disk.pop(key, None)
+                    if entry is not None:
+                        self._disk_size -= entry[1]
+                else:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._remember(key, disk_entry[0], data)
+                    self.counters['disk_hits'] += 1
+                    return data
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, key, data):
+        created = time.time()
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+            on_disk = True
+        except OSError as e:
+            log.error('tts_cache_write_failed', key=key, error=str(e))
+            on_disk = False
+        with self._lock:
+            self._remember(key, created, data)
+            if on_disk:
+                old = self._disk.pop(key, None)
+                if old is not None:
+                    self._disk_size -= old[1]
+                self._disk[key] = (created, len(data))
+                self._disk_size += len(data)
+                self._evict_disk()
+            self.counters['stores'] += 1
+
+    # Return cached audio or produce it once, even when several threads ask
+    # for the same key at the same time. produce() returns bytes or None.
+    def get_or_create(self, key, produce):
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait()
+            return self.get(key)
+        try:
+            data = produce()
+            if data:
+                self.put(key, data)
+            return data
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    # Register audio of key that is being downloaded; finish it with end_download()
+    def start_download(self, key):
+        download = Download()
+        with self._lock:
+            self._downloads[key] = download
+        return download
+
+    def end_download(self, key, download, ok):
+        with self._lock:
+            if self._downloads.get(key) is download:
+                del self._downloads[key]
+        download.finish(ok)
+
+    # Download of key in progress, or None
+    def download(self, key):
+        with self._lock:
+            return self._downloads.get(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._memory or key in self._disk:
+                return True
+        return self._adopt(key) is not None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters,
+                        memory_entries=len(self._memory), memory_bytes=self._memory_size,
+                        disk_entries=len(self._disk), disk_bytes=self._disk_size)
@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import structured_log
+
+log = structured_log.get_logger('tts_pipeline')
+
+# Sentence-pipelined TTS. A reply is cut at sentence boundaries (and long
+# sentences at clause boundaries) and the segments are synthesized
+# concurrently on one bounded pool, so the first sentence can play while
+# the rest is still being synthesized. Text streamed from the LLM can be fed
+# in as it arrives; every completed sentence is queued right away. Jobs stay
+# registered for a while so their audio can be fetched by id, from this process
+# only; a finished reply's audio is also served by its segments' cache keys.
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?…])\s+')
+CLAUSE_BREAK = re.compile(r'(?<=[,;:])\s+')
+
+
+# Split text into speakable segments; short pieces are kept with their
+# neighbour because they sound clipped on their own
+def split_segments(text, max_chars=160, min_chars=24):
+    segments = []
+    for sentence in SENTENCE_BREAK.split(text.strip()):
+        pieces = [sentence] if len(sentence) <= max_chars else CLAUSE_BREAK.split(sentence)
+        for piece in pieces:
+            piece = piece.strip()
+            if not piece:
+                continue
+            if (segments and (len(piece) < min_chars or len(segments[-1]) < min_chars)
+                    and len(segments[-1]) + len(piece) < max_chars):
+                segments[-1] += ' ' + piece
+            else:
+                segments.append(piece)
+    return segments
+
+
+# End of the last complete sentence in text, or 0
+def last_sentence_end(text):
+    end = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        end = match.end()
+    return end
+
+
+class SpeechJob:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.id = uuid.uuid4().hex
+        self.created = time.monotonic()
+        self.segments = []
+        self.keys = []
+        self._futures = []
+        self._buffer = ''
+        self._closed = False
+        self._changed = threading.Condition()
+
+    # Add streamed text; complete sentences are queued for synthesis at once
+    def feed(self, text):
+        self._buffer += text
+        end = last_sentence_end(self._buffer)
+        if end and not self.pipeline.keep_whole(self._buffer):
+            complete, self._buffer = self._buffer[:end], self._buffer[end:]
+            for segment in split_segments(complete):
+                self._add(segment)
+
+    # No more text: queue whatever is left, plus text if given
+    def close(self, text=''):
+        rest, self._buffer = (self._buffer + text).strip(), ''
+        if rest:
+            for segment in [rest] if self.pipeline.keep_whole(rest) else split_segments(rest):
+                self._add(segment)
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def _add(self, segment):
+        key, future = self.pipeline.schedule(segment)
+        with self._changed:
+            self.segments.append(segment)
+            self.keys.append(key)
+            self._futures.append(future)
+            self._changed.notify_all()
+
+    # (key, future) of segment i, or None while it has not been queued yet
+    def segment(self, i):
+        with self._changed:
+            if i < len(self._futures):
+                return self.keys[i], self._futures[i]
+        return None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    # (key, future) per segment in order as it is queued, waiting while text is still being
+    # fed; raises TimeoutError when no segment is queued within timeout
+    def queued(self, timeout=None):
+        i = 0
+        while True:
+            with self._changed:
+                if not self._changed.wait_for(lambda: i < len(self._futures) or self._closed, timeout):
+                    raise TimeoutError(f"TTS segment {i} of job {self.id} not queued in time")
+                if i >= len(self._futures):
+                    return
+                key, future = self.keys[i], self._futures[i]
+            yield key, future
+            i += 1
+
+    # (key, result) per segment in order, waiting for segments still being fed or synthesized;
+    # raises TimeoutError when a segment takes longer than timeout
+    def results(self, timeout=None):
+        for key, future in self.queued(timeout):
+            yield key, future.result(timeout)
+
+    # Result of the first segment, or None when it failed or there is no text
+    def first(self, timeout=None):
+        for _, result in self.results(timeout):
+            return result
+        return None
+
+
+class TTSPipeline:
+    # synthesize(text) runs on a pool of `workers` threads; alternatively submit(text) can
+    # start the synthesis itself (e.g. on an event loop) and return a concurrent.futures.Future
+    def __init__(self, synthesize, key_for, keep_whole=None, workers=4, max_jobs=1024, job_ttl=600.0, submit=None):
+        self.synthesize = synthesize
+        self.key_for = key_for
+        # Texts that must not be split, e.g. ones already cached or assembled whole
+        self.keep_whole = keep_whole or (lambda text: False)
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        if submit is None:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts-pipeline')
+            # Log lines of the synthesis carry the id of the request that queued the segment
+            submit = lambda segment: pool.submit(structured_log.with_request_id(self._run), segment)  # noqa: E731
+        self._submit = submit
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pending = {}
+
+    def _run(self, segment):
+        try:
+            return self.synthesize(segment)
+        except Exception as e:
+            log.error('tts_pipeline_failed', error=str(e))
+            return None
+
+    # Queue one segment; segments already queued by another job share its future
+    def schedule(self, segment):
+        key = self.key_for(segment)
+        with self._lock:
+            future = self._pending.get(key)
+            queued = future is None
+            if queued:
+                future = self._pending[key] = self._submit(segment)
+        # Outside the lock: the callback runs at once if the future is already done
+        if queued:
+            future.add_done_callback(lambda _: self._done(key, future))
+        return key, future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    # Future of a segment that is queued or being synthesized, or None
+    def pending(self, key):
+        with self._lock:
+            return self._pending.get(key)
+
+    # Wait for a segment that is queued or being synthesized; False if it is not pending
+    def wait(self, key, timeout=None):
+        future = self.pending(key)
+        if future is None:
+            return False
+        future.result(timeout)
+        return True
+
+    # New job for streamed text; call feed() and close() on it
+    def start(self):
+        job = SpeechJob(self)
+        now = time.monotonic()
+        with self._lock:
+            while self._jobs and (len(self._jobs) >= self.max_jobs
+                                  or now - next(iter(self._jobs.values())).created > self.job_ttl):
+                self._jobs.popitem(last=False)
+            self._jobs[job.id] = job
+        return job
+
+    # Job for a complete text
+    def submit(self, text):
+        job = self.start()
+        job.close(text)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import structured_log
+
+log = structured_log.get_logger('uploads_janitor')
+
+# Retention for the audio files that pile up in uploads/: recordings kept for
+# debugging and TTS outputs of older versions. The directory also holds the
+# model, customer data and databases, so only file names matching
+# JANITOR_FILE are ever considered. Files are tracked in an index ordered by
+# age, built by one scan at start and then fed by the code that saves them;
+# a pass only walks the old end of the index. A full rescan now and then picks
+# up files written by other worker processes. Nothing in the repository
+# matches: sample audio lives in loadtest/audio.
+
+JANITOR_FILE = re.compile(r'(recording|output)_[0-9a-fA-F-]{8,64}\.(mp3|ogg|wav|webm)')
+
+
+class UploadsJanitor:
+    def __init__(self, directory, max_age=7 * 24 * 3600, max_files=2000, max_bytes=512 * 2**20,
+                 interval=60.0, rescan_interval=3600.0):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> (mtime, size), oldest first
+        self._bytes = 0
+        self._scanned = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {'passes': 0, 'scans': 0, 'removed': 0, 'reclaimed_bytes': 0, 'vanished': 0, 'errors': 0}
+        self.last_pass_seconds = None
+
+    @staticmethod
+    def eligible(name):
+        return JANITOR_FILE.fullmatch(name) is not None
+
+    # Rebuild the index from the directory; files the janitor must not touch are skipped
+    def scan(self):
+        entries = []
+        with os.scandir(self.directory) as listing:
+            for entry in listing:
+                if not self.eligible(entry.name) or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        with self._lock:
+            self._files = OrderedDict((name, (mtime, size)) for mtime, name, size in entries)
+            self._bytes = sum(size for _, _, size in entries)
+            self._scanned = time.monotonic()
+            self.counters['scans'] += 1
+
+    # A file just written to the directory; ignored unless the janitor may remove it
+    def track(self, path, size=None):
+        name = os.path.basename(path)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory) or not self.eligible(name):
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+        with self._lock:
+            old = self._files.pop(name, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._files[name] = (time.time(), size)
+            self._bytes += size
+
+    # One pass: remove the oldest files until every limit holds
+    def sweep(self, now=None):
+        started = time.perf_counter()
+        if self._scanned is None or time.monotonic() - self._scanned > self.rescan_interval:
+            self.scan()
+        now = time.time() if now is None else now
+        while True:
+            with self._lock:
+                if not self._files:
+                    break
+                name, (mtime, size) = next(iter(self._files.items()))
+                if (now - mtime <= self.max_age and len(self._files) <= self.max_files
+                        and self._bytes <= self.max_bytes):
+                    break
+                del self._files[name]
+                self._bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self._count(removed=1, reclaimed_bytes=size)
+            except FileNotFoundError:
+                self._count(vanished=1)
+            except OSError as e:
+                log.error('janitor_remove_failed', file=name, error=str(e))
+                self._count(errors=1)
+        self.last_pass_seconds = time.perf_counter() - started
+        self._count(passes=1)
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error('janitor_failed', error=str(e))
+                self._count(errors=1)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='uploads-janitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, files=len(self._files), bytes=self._bytes, max_files=self.max_files,
+                        max_bytes=self.max_bytes, max_age=self.max_age, last_pass_seconds=self.last_pass_seconds)
@@ -0,0 +1,201 @@
+import re
+
+# Every fixed reply the bot speaks. Dialog code in app.py and terminal.py uses
+# these constants so the warm-up can enumerate and pre-synthesize all of them.
+# Constants containing {placeholders} are templates: their fixed parts are
+# pre-synthesized on their own and numbers are spoken from pre-rendered
+# number words, so a templated reply needs no TTS round trip either.
+
+# app.py dialog
+ASK_ID = "Kredit limiti haqida ma'lumot olish uchun ID raqamingizni kiriting (raqamlar yoki so'zlar bilan, masalan, '127' yoki 'bir yuz yigirma yetti')."
+ASK_VALID_ID = "Iltimos, to'g'ri ID raqamini kiriting (raqamlar yoki so'zlar bilan, masalan, '127' yoki 'bir yuz yigirma yetti')."
+STT_FAILED = "Ovozni aniqlashda xatolik yuz berdi. Iltimos, aniq va baland ovozda gapiring."
+NO_SPEECH = "No speech detected in audio"
+STT_UNAVAILABLE = "Ovozni aniqlash xizmati hozir ishlamayapti. Iltimos, savolingizni matn bilan yozing."
+ID_NOT_FOUND = "ID {customer_id} topilmadi."
+CREDIT_LIMIT = "ID {customer_id} uchun taxminiy kredit limiti: {limit:.2f} dollar. Sizga bir yil muddatga ushbu miqdorda kredit berishimiz mumkin."
+
+# terminal.py dialog
+EMPTY_INPUT = "Iltimos, aniq ovozli xabar yuboring yoki matn kiriting."
+GREETING_REPLY = "Vaalaykum assalom! Sizga qanday yordam bera olaman?"
+THANKS_REPLY = "Arzimaydi! Sizga yordam bera olganimdan xursandman."
+BOT_NAME = "Mening ismim Epsilion."
+BOT_DEVELOPER = "Meni ishlab chiqaruvchimning taxallusi Neo."
+BOT_INFO = "Men Epsilion, Neo tomonidan yaratilganman."
+CREDIT_REASON = "Mening kredit scoring modelim buni bashorat qildi."
+TERMINAL_ASK_ID = "Kredit limiti uchun ID raqamingizni kiriting (masalan, '1', 'bir', '127')."
+TERMINAL_ASK_VALID_ID = "To'g'ri ID raqamini kiriting (masalan, '1', 'bir', '127')."
+TERMINAL_ID_NOT_FOUND = "ID {customer_id} topilmadi. Iltimos, boshqa ID kiriting."
+TERMINAL_CREDIT_LIMIT = "Sizga bir yil muddatga {limit:.2f} dollar miqdorida kredit bera olamiz."
+LLM_UNAVAILABLE = "Uzr, hozirda javob bera olmayman."
+
+ONES = ['nol', 'bir', 'ikki', 'uch', "to'rt", 'besh', 'olti', 'yetti', 'sakkiz', "to'qqiz"]
+TENS = ['', "o'n", 'yigirma', "o'ttiz", 'qirq', 'ellik', 'oltmish', 'yetmish', 'sakson', "to'qson"]
+SCALES = [(10**9, 'milliard'), (10**6, 'million'), (1000, 'ming')]
+NUMBER_WORDS = ONES + TENS[1:] + ['yuz'] + [word for _, word in SCALES] + ['minus', 'butun', 'yuzdan']
+
+_PLACEHOLDER = re.compile(r'\{(\w+)(?::[^}]*)?\}')
+
+
+def _constants():
+    return {name: value for name, value in globals().items()
+            if name.isupper() and isinstance(value, str) and name != 'NUMBER_WORDS'}
+
+
+TEMPLATES = {name: value for name, value in _constants().items() if _PLACEHOLDER.search(value)}
+CANNED = {name: value for name, value in _constants().items() if name not in TEMPLATES}
+
+
+# Fixed text between the placeholders of a template
+def template_parts(template):
+    return [part.strip() for part in _PLACEHOLDER.split(template)[::2]]
+
+
+def _template_pattern(template):
+    pattern = ''
+    pieces = _PLACEHOLDER.split(template)
+    for i, piece in enumerate(pieces):
+        pattern += re.escape(piece) if i % 2 == 0 else rf'(?P<{piece}>-?\d+(?:\.\d+)?)'
+    return re.compile(pattern + r'\Z')
+
+
+_TEMPLATE_PATTERNS = [(template, _template_pattern(template)) for template in TEMPLATES.values()]
+
+
+# Uzbek words for a non-negative integer, e.g. 1127 -> "bir ming bir yuz yigirma yetti"
+def number_to_words(number):
+    if number == 0:
+        return ONES[0]
+    words = []
+    for scale, name in SCALES:
+        if number >= scale:
+            words += [number_to_words(number // scale), name]
+            number %= scale
+    if number >= 100:
+        words += [ONES[number // 100], 'yuz']
+        number %= 100
+    if number >= 10:
+        words.append(TENS[number // 10])
+        number %= 10
+    if number:
+        words.append(ONES[number])
+    return ' '.join(words)
+
+
+# Spoken form of a number as printed in a reply ("9038.89", "210")
+def spoken_number(text):
+    words = []
+    if text.startswith('-'):
+        words.append('minus')
+        text = text[1:]
+    whole, _, fraction = text.partition('.')
+    words.append(number_to_words(int(whole)))
+    if fraction and int(fraction):
+        words += ['butun', 'yuzdan' if len(fraction) == 2 else '', number_to_words(int(fraction))]
+    return ' '.join(word for word in words if word)
+
+
+# Every string the warm-up should synthesize: canned replies, the fixed parts
+# of templates and the number words
+def static_texts():
+    texts = list(CANNED.values())
+    for template in TEMPLATES.values():
+        texts += [part for part in template_parts(template) if part]
+    texts += NUMBER_WORDS
+    return list(dict.fromkeys(texts))
+
+
+# Split a reply produced from a template into pre-rendered segments, or
+# return None when the text is not templated (or uses a fraction other than
+# hundredths, which has no pre-rendered word)
+def speech_segments(text):
+    for template, pattern in _TEMPLATE_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        segments = []
+        parts = template_parts(template)
+        names = _PLACEHOLDER.findall(template)
+        for i, part in enumerate(parts):
+            if part:
+                segments.append(part)
+            if i < len(names):
+                value = match.group(names[i])
+                fraction = value.partition('.')[2]
+                if fraction and len(fraction) != 2:
+                    return None
+                segments += spoken_number(value).split()
+        return segments
+    return None
+
+
+# Strip the ID3v2 header from an MP3 segment so segments can be concatenated
+def _strip_id3(data):
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return data[10 + size + footer:]
+    return data
+
+
+# One segment of a joined MP3: only the first keeps its ID3v2 header and
+# only the last its ID3v1 trailer
+def mp3_segment(data, first=False, last=False):
+    if not first:
+        data = _strip_id3(data)
+    if not last and len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+# mp3_segment for audio that arrives in chunks: feed() returns what can be sent
+# so far, end() the rest. The last 128 bytes are held back until the end, since
+# they may turn out to be the ID3v1 trailer.
+class Mp3SegmentStream:
+    def __init__(self, first=False, last=False):
+        self.last = last
+        self._header_done = first
+        self._buffer = b''
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if not self._header_done:
+            if len(self._buffer) < 10:
+                return b''
+            if self._buffer[:3] == b'ID3':
+                data = self._buffer
+                header = 10 + ((data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9])
+                header += 10 if data[5] & 0x10 else 0
+                if len(data) < header:
+                    return b''
+                self._buffer = data[header:]
+            self._header_done = True
+        if self.last:
+            out, self._buffer = self._buffer, b''
+        else:
+            out, self._buffer = self._buffer[:-128], self._buffer[-128:]
+        return out
+
+    def end(self):
+        data, self._buffer = self._buffer, b''
+        if not self._header_done:
+            data = _strip_id3(data)
+            self._header_done = True
+        if not self.last and len(data) >= 128 and data[-128:-125] == b'TAG':
+            data = data[:-128]
+        return data
+
+
+# MP3 frames are self-contained, so segments can be played back to back
+def join_mp3(parts):
+    return b''.join(mp3_segment(part, i == 0, i == len(parts) - 1) for i, part in enumerate(parts))
+
+
+# Audio for a templated reply built from cached segments, or None when the
+# text is not templated or a segment is not cached yet
+def assemble_speech(text, cached_audio):
+    segments = speech_segments(text)
+    if not segments:
+        return None
+    parts = [cached_audio(segment) for segment in segments]
+    return join_mp3(parts) if all(parts) else None
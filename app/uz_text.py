@@ -0,0 +1,113 @@
+import re
+
+# Uzbek text normalization shared by app.py and terminal.py: Cyrillic to Latin
+# transliteration, transcript cleanup and number parsing. The tables and the
+# number grammar are built once at import; a call is one str.translate plus at
+# most two regex scans.
+
+KRILL_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'ъ': '', 'ы': 'i',
+    'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'қ': 'q', 'ғ': 'g\'', 'ҳ': 'h',
+    'ў': 'o\'',
+    'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
+    'Ж': 'J', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+    'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+    'Ф': 'F', 'Х': 'X', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Ъ': '', 'Ы': 'I',
+    'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya', 'Қ': 'Q', 'Ғ': 'G\'', 'Ҳ': 'H',
+    'Ў': 'O\'',
+}
+# The other apostrophes STT writes in o‘, g‘ and to‘rt
+APOSTROPHES = {'‘': '\'', '’': '\'', 'ʻ': '\'', 'ʼ': '\'', '`': '\''}
+
+TRANSLITERATE = str.maketrans(KRILL_TO_LATIN)
+NORMALIZE = str.maketrans({**KRILL_TO_LATIN, **APOSTROPHES})
+
+NUMBER_WORDS = {
+    'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
+    'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
+    'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
+    'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
+    'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
+}
+# Multipliers that close a group: "ikki yuz ellik ming" is (2 * 100 + 50) * 1000
+SCALES = {1000, 1000000}
+
+# A whole word, with apostrophes belonging to the word
+_WORD = r"(?<![\w']){}(?![\w'])"
+NUMBER = _WORD.format('(?:' + '|'.join(sorted(map(re.escape, NUMBER_WORDS), key=len, reverse=True)) + ')')
+# The first run of number words, optionally joined by "va" ("yuz va o'n")
+NUMBER_RUN = re.compile(rf"{NUMBER}(?:\s+(?:va\s+)?{NUMBER})*")
+NUMBER_TOKEN = re.compile(NUMBER)
+DIGITS = re.compile(r'\b\d+\b')
+
+NOT_A_TRANSCRIPT = ('appears', 'unclear', 'similar to', 'transcription in')
+TRANSCRIPT = re.compile(r'(mening id raqamim\s+)?([\w\s\'’]+)')
+
+
+# Cyrillic letters to their Latin spelling; everything else is kept
+def krill_to_latin(text):
+    return text.translate(TRANSLITERATE)
+
+
+# Lowercased, trimmed Latin text with a single kind of apostrophe
+def normalize(text):
+    text = text.lower()
+    # Plain ASCII has nothing to transliterate; only the backtick is replaced
+    if text.isascii():
+        return (text.replace('`', '\'') if '`' in text else text).strip()
+    return text.translate(NORMALIZE).strip()
+
+
+# normalize over a list of transcripts; repeated transcripts are normalized once
+def normalize_batch(texts):
+    done = {}
+    result = []
+    for text in texts:
+        normalized = done.get(text)
+        if normalized is None:
+            normalized = done[text] = normalize(text)
+        result.append(normalized)
+    return result
+
+
+# Transcript from the model without commentary; None when it describes the audio instead
+def clean_transcription(text):
+    text = normalize(text)
+    if any(keyword in text for keyword in NOT_A_TRANSCRIPT):
+        return None
+    match = TRANSCRIPT.search(text)
+    if match:
+        return match.group(2).strip()
+    return text if text else None
+
+
+# Value of a run of number words, e.g. "bir million ikki yuz ming" -> 1200000
+def words_to_number(words):
+    total = 0
+    current = 0
+    for word in words:
+        value = NUMBER_WORDS[word]
+        if value == 100:
+            current = max(current, 1) * 100
+        elif value in SCALES:
+            total += max(current, 1) * value
+            current = 0
+        else:
+            current += value
+    return total + current
+
+
+# First number in a sentence, in digits or in words; None if there is none or it is zero
+def uzbek_text_to_number(text):
+    text = normalize(text)
+    match = DIGITS.search(text)
+    if match:
+        return int(match.group())
+    match = NUMBER_RUN.search(text)
+    if not match:
+        return None
+    number = words_to_number(NUMBER_TOKEN.findall(match.group()))
+    return number if number > 0 else None
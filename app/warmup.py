@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import structured_log
+
+log = structured_log.get_logger('warmup')
+
+# Pre-synthesizes a fixed set of texts into the TTS cache. Texts that fail are
+# retried until every one of them is cached; only then is the set ready.
+
+
+class Warmup:
+    def __init__(self, texts, synthesize, workers=8, retry_interval=30.0):
+        self.texts = list(dict.fromkeys(texts))
+        self.synthesize = synthesize
+        self.workers = workers
+        self.retry_interval = retry_interval
+        self.ready = threading.Event()
+        self.pending = list(self.texts)
+        self.attempts = 0
+        self.seconds = None
+        self.enabled = True
+        self._thread = None
+
+    def _attempt(self, text):
+        try:
+            return bool(self.synthesize(text))
+        except Exception as e:
+            log.warning('warmup_failed', text=text[:40], error=str(e))
+            return False
+
+    # Synthesize everything, retrying failures; blocks until warm or max_rounds
+    def run(self, max_rounds=None):
+        start = time.perf_counter()
+        while self.pending:
+            self.attempts += 1
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._attempt, self.pending))
+            self.pending = [text for text, ok in zip(self.pending, results) if not ok]
+            if not self.pending:
+                break
+            log.warning('warmup_retrying', failed=len(self.pending), total=len(self.texts))
+            if max_rounds is not None and self.attempts >= max_rounds:
+                return False
+            time.sleep(self.retry_interval)
+        self.seconds = time.perf_counter() - start
+        log.info('warmup_ready', utterances=len(self.texts), seconds=round(self.seconds, 1))
+        self.ready.set()
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='tts-warmup', daemon=True)
+        self._thread.start()
+        return self
+
+    # Warm-up turned off: nothing is pre-synthesized and readiness does not wait on it
+    def skip(self):
+        self.enabled = False
+        self.ready.set()
+        return self
+
+    def status(self):
+        return {
+            'ready': self.ready.is_set(),
+            'enabled': self.enabled,
+            'total': len(self.texts),
+            'warm': len(self.texts) - len(self.pending),
+            'attempts': self.attempts,
+            'seconds': self.seconds,
+        }
+
+
+if __name__ == '__main__':
+    # Build-time warm-up: fills uploads/tts_cache so workers start warm
+    import os
+    import sys
+
+    os.environ['TTS_WARMUP'] = '0'
+    import app
+
+    warmup = Warmup(app.static_texts(), lambda text: app.text_to_speech(text) is not None, retry_interval=1.0)
+    sys.exit(0 if warmup.run(max_rounds=3) else 1)
@@ -0,0 +1,152 @@
+"""Answer cache for FAQ-style questions. First replays a stream of paraphrased
+questions through the cache at several similarity thresholds and reports the
+hit rate against wrong answers (a hit whose cached answer was for a different
+question). Then runs the Flask app in-process against the local stand-in
+upstreams with the cache off and on, reports /process_text latency and the
+LLM time saved, and checks that changing the knowledge file drops the cache.
+
+    python benchmarks/bench_answer_cache.py --requests 300 --llm-latency 0.3
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+
+# Ways customers ask each question; the pairs marked "near" differ in one word
+# and must not share an answer
+FAQ = {
+    'hours': ["Bank soat nechida ishlaydi?", "bank soat nechida ishlaydi", "Iltimos, bank soat nechida ishlaydi?",
+              "Банк соат нечида ишлайди?", "Bank soat nechida ishlaydi ayting"],
+    'weekend': ["Bank shanba kuni ishlaydimi?", "bank shanba kuni ishlaydimi", "Shanba kuni bank ishlaydimi?",
+                "Банк шанба куни ишлайдими?"],
+    'branches_tashkent': ["Toshkentda nechta filial bor?", "toshkentda nechta filial bor", "Toshkentda filial nechta?",
+                          "Тошкентда нечта филиал бор?"],
+    'branches_regions': ["Viloyatlarda nechta filial bor?", "viloyatlarda nechta filial bor?"],  # near
+    'atm': ["Eng yaqin bankomat qayerda?", "eng yaqin bankomat qayerda", "Eng yaqin bankomat qayerda joylashgan?",
+            "Menga eng yaqin bankomat qayerda?"],
+    'card_types': ["Qanday karta turlari bor?", "qanday karta turlari bor", "Bankda qanday karta turlari bor?",
+                   "Қандай карта турлари бор?"],
+    'visa_card': ["Visa karta qanday ochiladi?", "visa karta qanday ochiladi", "Visa kartani qanday ochsa bo'ladi?"],
+    'humo_card': ["Humo karta qanday ochiladi?", "humo karta qanday ochiladi?"],  # near
+    'deposit': ["Omonat foizi qancha?", "omonat foizi qancha", "Omonat foizlari qancha?", "Омонат фоизи қанча?"],
+    'app': ["Mobil ilovani qayerdan yuklab olaman?", "mobil ilovani qayerdan yuklab olaman",
+            "Mobil ilovani qayerdan yuklab olsam bo'ladi?"],
+    'transfer': ["Xalqaro pul o'tkazmasi qanday qilinadi?", "xalqaro pul o‘tkazmasi qanday qilinadi",
+                 "Xalqaro pul o'tkazmasini qanday qilsam bo'ladi?"],
+}
+
+
+def question_stream(n, rng):
+    topics = list(FAQ)
+    # A few questions make up most of the traffic
+    weights = [1.0 / (rank + 1) for rank in range(len(topics))]
+    stream = []
+    for topic in rng.choices(topics, weights=weights, k=n):
+        stream.append((topic, rng.choice(FAQ[topic])))
+    return stream
+
+
+def sweep(stream, thresholds):
+    print(f"{'threshold':>10} {'hit rate':>9} {'exact':>6} {'similar':>8} {'wrong':>6}")
+    for threshold in thresholds:
+        cache = AnswerCache(threshold=threshold)
+        wrong = 0
+        for topic, question in stream:
+            answer = cache.get(question, 'v1')
+            if answer is None:
+                cache.put(question, 'v1', topic, 1.0)
+            elif answer != topic:
+                wrong += 1
+        stats = cache.stats()
+        print(f"{threshold:>10.2f} {stats['hit_rate']:>9.1%} {stats['exact_hits']:>6} {stats['similar_hits']:>8} "
+              f"{wrong:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer cache hit rate and LLM time saved.')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--thresholds', default='0.5,0.6,0.75,0.9,1.0')
+    args = parser.parse_args()
+    rng = random.Random(20)
+    stream = question_stream(args.requests, rng)
+    sweep(stream * 3, [float(t) for t in args.thresholds.split(',')])
+
+    knowledge_dir = tempfile.mkdtemp()
+    knowledge_file = os.path.join(knowledge_dir, 'general_info.txt')
+    shutil.copy(os.path.join(APP_DIR, 'uploads', 'general_info.txt'), knowledge_file)
+    server = fake_upstreams.start_server(latency={'llm': args.llm_latency}, unique_replies=True)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench',
+                      KNOWLEDGE_PATHS=knowledge_file)
+    os.chdir(APP_DIR)
+    import app
+    from answer_cache import AnswerCache as AppAnswerCache
+    app.app.logger.disabled = True
+
+    def run(cache):
+        app.answer_cache = cache
+        latencies = []
+        for _, question in stream:
+            client = app.app.test_client()
+            start = time.perf_counter()
+            response = client.post('/process_text', json={'text': question})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.data
+        return sorted(latencies)
+
+    print(f"\n{args.requests} questions, LLM latency {args.llm_latency * 1000:.0f} ms")
+    print(f"{'answer cache':14} {'p50':>8} {'p90':>8} {'mean':>8} {'LLM calls':>10} {'saved':>8}")
+    for name, cache in (('off', AppAnswerCache(max_entries=0)), ('on', AppAnswerCache())):
+        before = server.stats.snapshot()['requests'].get('llm', 0)
+        # The app logs every upstream call; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = run(cache)
+        calls = server.stats.snapshot()['requests']['llm'] - before
+        print(f"{name:14} {statistics.median(latencies) * 1000:>5.0f} ms "
+              f"{latencies[int(len(latencies) * 0.9)] * 1000:>5.0f} ms {statistics.mean(latencies) * 1000:>5.0f} ms "
+              f"{calls:>10} {cache.stats()['saved_seconds']:>6.1f} s")
+    print(app.answer_cache.stats())
+
+    # An answer generated after earlier turns is never shared: here the session has just heard a credit limit
+    question = "Valyuta ayirboshlash kursi bugun qanday belgilangan?"
+    assert app.answer_cache.get(question, app.knowledge.version) is None
+    client = app.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in ("Kredit olmoqchiman", "bir yuz yigirma yetti", question):
+            assert client.post('/process_text', json={'text': text}).status_code == 200
+    assert app.answer_cache.get(question, app.knowledge.version) is None
+    print("sessions: an answer given after a credit limit was not cached for other callers")
+
+    # A changed knowledge file is a new version: the next request must not get a cached answer
+    question = stream[0][1]
+    assert app.answer_cache.get(question, app.knowledge.version) is not None
+    with open(knowledge_file, 'a', encoding='utf-8') as f:
+        f.write("\n\nYangi filial Samarqand shahrida ochildi.\n")
+    app.knowledge._checked_at = 0.0  # the file check interval has passed
+    before = server.stats.snapshot()['requests']['llm']
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert app.app.test_client().post('/process_text', json={'text': question}).status_code == 200
+    assert server.stats.snapshot()['requests']['llm'] == before + 1
+    assert app.answer_cache.stats()['invalidations'] == 1 and app.answer_cache.stats()['entries'] == 1
+    print("invalidation: a knowledge file change dropped every cached answer before the next lookup")
+    server.shutdown()
+    shutil.rmtree(knowledge_dir)
+
+
+if __name__ == '__main__':
+    main()
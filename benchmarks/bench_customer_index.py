@@ -0,0 +1,89 @@
+"""Compare the old per-call predict_limit_by_id path with the precomputed
+customer index.
+
+Run from the repository root:
+
+    python benchmarks/bench_customer_index.py --sizes 80 100000 10000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+from customer_index import build_limit_table, find_position  # noqa: E402
+
+features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
+
+
+# Tile the sample customers up to n rows with fresh, shuffled IDs
+def make_dataset(base, n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = base.iloc[rng.integers(0, len(base), size=n)].reset_index(drop=True)
+    rows['ID'] = rng.permutation(n) + 1
+    return rows
+
+
+# The lookup as it was done before the index existed
+def legacy_lookup(model, data, input_id):
+    if input_id not in data['ID'].values:
+        return None
+    input_data = data[data['ID'] == input_id][features]
+    return model.predict(input_data)[0]
+
+
+def time_calls(fn, ids):
+    start = time.perf_counter()
+    for customer_id in ids:
+        fn(customer_id)
+    return (time.perf_counter() - start) / len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(APP_DIR, 'uploads', 'linear_regression_model.pkl'))
+    parser.add_argument('--data', default=os.path.join(APP_DIR, 'uploads', 'test_data2.csv'))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[80, 100_000, 10_000_000])
+    parser.add_argument('--lookups', type=int, default=10_000, help='lookups per size for the index')
+    parser.add_argument('--legacy-budget', type=float, default=5.0,
+                        help='seconds to spend timing the legacy path per size')
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    base = pd.read_csv(args.data)
+    print(f"{'rows':>10} {'build s':>9} {'legacy us/call':>15} {'index us/call':>14} {'speedup':>9}")
+    for n in args.sizes:
+        data = make_dataset(base, n)
+        rng = np.random.default_rng(1)
+        ids = rng.integers(1, n + 1, size=args.lookups).tolist()
+
+        start = time.perf_counter()
+        positions, limits = build_limit_table(model, data, features)
+        build_seconds = time.perf_counter() - start
+
+        index_per_call = time_calls(lambda i: limits[find_position(positions, i)], ids)
+
+        # Estimate how many legacy calls fit in the budget from one warm-up call
+        start = time.perf_counter()
+        legacy_lookup(model, data, ids[0])
+        one_call = time.perf_counter() - start
+        legacy_ids = ids[:max(1, min(len(ids), int(args.legacy_budget / max(one_call, 1e-9))))]
+        legacy_per_call = time_calls(lambda i: legacy_lookup(model, data, i), legacy_ids)
+
+        for customer_id in legacy_ids[:20]:
+            expected = legacy_lookup(model, data, customer_id)
+            assert np.isclose(limits[find_position(positions, customer_id)], expected), customer_id
+
+        print(f"{n:>10} {build_seconds:>9.3f} {legacy_per_call * 1e6:>15.1f} "
+              f"{index_per_call * 1e6:>14.3f} {legacy_per_call / index_per_call:>8.0f}x")
+        del data, positions, limits
+
+
+if __name__ == '__main__':
+    main()
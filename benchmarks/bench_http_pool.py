@@ -0,0 +1,60 @@
+"""Count TCP connections (handshakes) per 1000 upstream requests with bare
+requests.post/get calls versus the shared pooled session in http_client.
+
+Uses the local stand-in server, so no real API is called:
+
+    python benchmarks/bench_http_pool.py --calls 500 --threads 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import requests  # noqa: E402
+
+import fake_upstreams  # noqa: E402
+import http_client  # noqa: E402
+
+
+# One TTS turn as the app does it: POST for the audio_path, then GET the audio
+def tts_turn(post, get, base_url):
+    response = post(f"{base_url}{fake_upstreams.TTS_PATH}", data={'transcript': 'salom', 'model': 'gulnoza'})
+    audio = get(response.json()['audio_path'])
+    return len(audio.content)
+
+
+def measure(server, post, get, calls, threads):
+    server.stats.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: tts_turn(post, get, server.url), range(calls)))
+    seconds = time.perf_counter() - start
+    stats = server.stats.snapshot()
+    return stats['connections'], stats['total_requests'], seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Handshakes per 1000 requests, bare vs pooled.')
+    parser.add_argument('--calls', type=int, default=500, help='TTS turns (two requests each)')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    server = fake_upstreams.start_server()
+    clients = {
+        'bare requests': (requests.post, requests.get),
+        'pooled session': (http_client.post, http_client.get),
+    }
+    print(f"{'client':16} {'requests':>9} {'connections':>12} {'per 1000 req':>13} {'req/s':>8}")
+    for name, (post, get) in clients.items():
+        connections, total, seconds = measure(server, post, get, args.calls, args.threads)
+        print(f"{name:16} {total:>9} {connections:>12} {connections * 1000 / total:>13.1f} {total / seconds:>8.0f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Disk writes and latency per /process_audio request with every upload saved
+and read back (UPLOAD_MODE=disk, the old path) versus forwarding the upload
+from memory, with and without sampled debug copies.
+
+Runs the Flask app in-process against the local stand-in upstreams and reads
+the process's block-device write counter, so run it on a real disk rather
+than tmpfs.
+
+    python benchmarks/bench_inbound_audio.py --requests 300 --audio-kb 96
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+import psutil
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Disk I/O and latency per upload, save-then-read vs in-memory.')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--audio-kb', type=int, default=96)
+    parser.add_argument('--sample', type=float, default=0.05, help='UPLOAD_SAVE_SAMPLE for the sampled run')
+    args = parser.parse_args()
+
+    # The reply is canned and cached, so the request cost is the upload and STT path
+    server = fake_upstreams.start_server(latency={'stt': 0.005}, transcript='kredit olmoqchiman')
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench')
+    os.chdir(APP_DIR)
+    import app
+    import inbound_audio
+    app.app.logger.disabled = True
+    client = app.app.test_client()
+    audio = os.urandom(args.audio_kb * 1024)
+    process = psutil.Process()
+
+    def run(mode, sample):
+        inbound_audio.MODE, inbound_audio.SAVE_SAMPLE = mode, sample
+        before_files = set(glob.glob('uploads/recording_*.mp3'))
+        os.sync()
+        before = process.io_counters().write_bytes
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.post('/process_audio', data={'audio': (BytesIO(audio), 'recording.mp3')})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200 and response.get_json()['transcript']
+        os.sync()
+        written = process.io_counters().write_bytes - before
+        created = set(glob.glob('uploads/recording_*.mp3')) - before_files
+        for path in created:
+            os.remove(path)
+        return written / args.requests, len(created), statistics.median(latencies), percentile(latencies, 0.99)
+
+    run('memory', 0)  # warm up connections and the TTS cache
+    print(f"{args.requests} uploads of {args.audio_kb} KB")
+    print(f"{'mode':24} {'disk writes/req':>16} {'files':>6} {'p50':>8} {'p99':>8}")
+    for name, mode, sample in (('disk (save, reopen)', 'disk', 0), ('memory', 'memory', 0),
+                               (f"memory, {args.sample:.0%} sampled", 'memory', args.sample)):
+        written, files, p50, p99 = run(mode, sample)
+        print(f"{name:24} {written / 1024:>13.1f} KB {files:>6} {p50 * 1000:>5.2f} ms {p99 * 1000:>5.2f} ms")
+    print(inbound_audio.stats())
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Intent routing throughput: the per-intent substring scans terminal.py ran
+on every turn (plus its re-scan of the last four history messages) against
+the single-pass intent scanner and the incremental dialog context. Also
+checks that both give the same answers on every message.
+
+    python benchmarks/bench_intents.py --messages 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import intents  # noqa: E402
+
+WORDS = ['bank', 'qachon', 'ishlaydi', 'filial', 'qayerda', 'karta', 'omonat', 'foiz', 'mobil', 'ilova',
+         'menga', 'kerak', 'bugun', 'ertaga', 'iltimos', 'yordam', 'bering', 'bir', 'ikki', 'uch', 'yuz']
+PHRASES = ['kredit', 'qarz', 'limit', 'pul olish', 'kredit limiti', 'salom', 'assalomu alaykum', 'rahmat',
+           'tashakkur', 'nima uchun', 'qanday qilib', 'how', 'isming', 'kim', 'nomi', 'ishlab chiqaruvchi',
+           'developer', 'topilmadi', 'KREDIT', 'Salom']
+
+
+# The checks this replaces, as terminal.py had them
+def old_flags(message):
+    def has(keywords):
+        return any(keyword.lower() in message.lower() for keyword in keywords)
+    flags = 0
+    if has(['kredit', 'qarz', 'limit', 'pul olish', 'kredit olish', 'kredit limiti']):
+        flags |= intents.CREDIT
+    if has(['salom', 'assalom', 'assalomu alaykum', 'assalomu aleykum']):
+        flags |= intents.GREETING
+    if has(['rahmat', 'tashakkur']):
+        flags |= intents.THANKS
+    if has(['nima uchun', 'negadir', 'nima sababdan', 'qanday qilib', 'why', 'how']):
+        flags |= intents.REASON
+    if 'kredit' in message.lower():
+        flags |= intents.KREDIT
+    if has(['isming', 'kim', 'nomi', 'quruvchi', 'ishlab chiqaruvchi', 'developer']):
+        flags |= intents.BOT_INFO
+    if 'ism' in message.lower() or 'nomi' in message.lower():
+        flags |= intents.BOT_NAME
+    if has(['quruvchi', 'ishlab chiqaruvchi', 'developer']):
+        flags |= intents.BOT_DEVELOPER
+    if 'topilmadi' in message.lower():
+        flags |= intents.NOT_FOUND
+    return flags
+
+
+def old_context(history):
+    credit = ['kredit', 'qarz', 'limit', 'pul olish', 'kredit olish', 'kredit limiti']
+    return any(any(k in msg.lower() for k in credit) or 'topilmadi' in msg.lower() for msg in history[-4:])
+
+
+def corpus(n, seed=3):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        words = rng.choices(WORDS, k=rng.randint(2, 12))
+        for _ in range(rng.choice((0, 0, 1, 1, 2))):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(PHRASES))
+        messages.append(' '.join(words))
+    return messages
+
+
+def check(messages):
+    history, context = [], intents.DialogContext(window=4)
+    for message in messages:
+        flags = intents.scan(message)
+        assert flags == old_flags(message), message
+        history.append(message)
+        context.add(flags)
+        assert context.active == old_context(history), history[-4:]
+    print(f"checks: {len(messages)} messages, same intents and dialog context as the per-intent scans")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Intent routing throughput, per-intent scans vs single pass.')
+    parser.add_argument('--messages', type=int, default=1000000)
+    args = parser.parse_args()
+    messages = corpus(args.messages)
+    check(messages[:20000])
+
+    def per_intent():
+        history = []
+        for message in messages:
+            old_flags(message)
+            history.append(message)
+            old_context(history)
+            if len(history) > 20:
+                history = history[-20:]
+
+    def single_pass():
+        context = intents.DialogContext(window=4)
+        for message in messages:
+            context.add(intents.scan(message))
+            context.active
+
+    print(f"{'router':28} {'seconds':>8} {'messages/s':>12}")
+    for name, run in (('per-intent scans + re-scan', per_intent), ('single pass + context', single_pass)):
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        print(f"{name:28} {seconds:>8.2f} {len(messages) / seconds:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
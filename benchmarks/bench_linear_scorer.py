@@ -0,0 +1,111 @@
+"""Compare the joblib/scikit-learn pickle with the compiled NumPy scorer:
+import + load time, first-prediction latency and steady-state throughput.
+
+Run from the repository root after compiling the artifact:
+
+    (cd app && python linear_scorer.py)
+    python benchmarks/bench_linear_scorer.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+MODEL = os.path.join(APP_DIR, 'uploads', 'linear_regression_model.pkl')
+ARTIFACT = os.path.join(APP_DIR, 'uploads', 'linear_regression_model.npz')
+DATA = os.path.join(APP_DIR, 'uploads', 'test_data2.csv')
+
+ROW = {'Income': 151.947, 'Rating': 642, 'Cards': 2, 'Age': 91, 'Education': 11, 'Gender': 'Female',
+       'Student': 'No', 'Married': 'Yes', 'Ethnicity': 'African American', 'Balance': 732}
+
+# Each snippet runs in a fresh interpreter and prints the two timestamps
+COLD_START = {
+    'pickle': f'''
+import time
+t0 = time.perf_counter()
+import joblib, pandas as pd
+model = joblib.load({MODEL!r})
+t1 = time.perf_counter()
+model.predict(pd.DataFrame([{ROW!r}]))
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t0)
+''',
+    'numpy': f'''
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {APP_DIR!r})
+from linear_scorer import LinearScorer
+model = LinearScorer.load({ARTIFACT!r})
+t1 = time.perf_counter()
+model.predict_row({ROW!r})
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t0)
+''',
+}
+
+
+def cold_start(name, repeats):
+    loads, firsts = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', COLD_START[name]], capture_output=True, text=True, check=True)
+        load, first = map(float, output.stdout.split())
+        loads.append(load)
+        firsts.append(first)
+    return statistics.median(loads), statistics.median(firsts)
+
+
+def throughput(predict, frame, seconds):
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        predict(frame)
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the compiled NumPy scorer against the pickle.')
+    parser.add_argument('--repeats', type=int, default=5, help='fresh interpreters per cold-start measurement')
+    parser.add_argument('--seconds', type=float, default=2.0, help='time per throughput measurement')
+    parser.add_argument('--batch', type=int, default=10_000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from linear_scorer import LinearScorer
+
+    pipeline = joblib.load(MODEL)
+    scorer = LinearScorer.load(ARTIFACT)
+    data = pd.read_csv(DATA)
+    batch = data.iloc[np.resize(np.arange(len(data)), args.batch)].reset_index(drop=True)
+    single = data.iloc[:1]
+    single_columns = {name: [ROW[name]] for name in scorer.features}
+    batch_columns = {name: batch[name].to_numpy() for name in scorer.features}
+
+    for frame in (data, batch, single):
+        assert np.array_equal(pipeline.predict(frame[scorer.features]), scorer.predict(frame)), 'predictions differ'
+
+    results = {}
+    for name in ('pickle', 'numpy'):
+        load, first = cold_start(name, args.repeats)
+        results[name] = {'import_load_s': load, 'first_prediction_s': first}
+    results['pickle']['single_calls_per_s'] = throughput(lambda f: pipeline.predict(f), pd.DataFrame([ROW]), args.seconds)
+    results['numpy']['single_calls_per_s'] = throughput(scorer.predict, single_columns, args.seconds)
+    results['pickle']['batch_rows_per_s'] = args.batch * throughput(lambda f: pipeline.predict(f[scorer.features]), batch, args.seconds)
+    results['numpy']['batch_rows_per_s'] = args.batch * throughput(scorer.predict, batch_columns, args.seconds)
+
+    print(f"{'':8} {'import+load ms':>15} {'first pred ms':>14} {'1-row calls/s':>14} {'batch rows/s':>14}")
+    for name, r in results.items():
+        print(f"{name:8} {r['import_load_s'] * 1e3:>15.1f} {r['first_prediction_s'] * 1e3:>14.1f} "
+              f"{r['single_calls_per_s']:>14,.0f} {r['batch_rows_per_s']:>14,.0f}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Request throughput with structured logging off and on, and what a log call costs.
+
+First times one log call from the request path: the old print() of an
+upstream body, logging off, a queued info event, and a payload event with its
+body sampled out and sampled in (bounded to LOG_FIELD_CHARS). Then writes to a
+sink that takes a millisecond per line: the queued logger keeps the caller in
+microseconds and drops what the writer cannot keep up with, where a plain
+synchronous handler makes every call wait. Last, runs /process_audio through
+the Flask app against the local stand-in upstreams with logging off, at info,
+and at debug with every payload logged, compares requests per second, and
+checks each turn's lines carry the request id sent back in X-Request-ID.
+
+    python benchmarks/bench_logging.py --requests 400 --concurrency 16
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+import structured_log  # noqa: E402
+
+BODY = json.dumps({'transcript': 'Bank soat nechida ishlaydi? ' * 400})
+
+
+class SlowSink(io.StringIO):
+    def write(self, text):
+        time.sleep(0.001)
+        return super().write(text)
+
+
+def per_call_us(function, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        function()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+# Each row gets a fresh writer and fewer calls than the queue holds, so none are dropped
+def micro(n, sink):
+    log = structured_log.get_logger('bench')
+    rows = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        rows.append(('print() status and body', per_call_us(
+            lambda: (print("STT Response Status: 200"), print(f"STT Response Content: {BODY}")), n)))
+    for name, level, sample, call in (
+            ('logging off', 'OFF', 1.0, lambda: log.payload('stt_response', BODY, status=200)),
+            ('info event, queued', 'INFO', 1.0, lambda: log.info('stt_won', provider='aisha')),
+            ('payload at info (skipped)', 'INFO', 1.0, lambda: log.payload('stt_response', BODY, status=200)),
+            ('payload, 1% sampled', 'DEBUG', 0.01, lambda: log.payload('stt_response', BODY, status=200)),
+            ('payload, every body', 'DEBUG', 1.0, lambda: log.payload('stt_response', BODY, status=200))):
+        structured_log.PAYLOAD_SAMPLE = sample
+        structured_log.configure(level, stream=sink)
+        rows.append((name, per_call_us(call, n)))
+        structured_log.stop()
+    assert structured_log.stats()['dropped'] == 0
+    return rows
+
+
+def slow_sink(n):
+    log = structured_log.get_logger('bench')
+    structured_log.QUEUE_SIZE = 200
+    structured_log.configure('INFO', stream=SlowSink())
+    before = structured_log.stats()['dropped']
+    queued = per_call_us(lambda: log.info('tts_response', status=201), n)
+    dropped = structured_log.stats()['dropped'] - before
+    structured_log.stop()
+
+    blocking = logging.getLogger('bench.blocking')
+    blocking.propagate = False
+    blocking.addHandler(logging.StreamHandler(SlowSink()))
+    direct = per_call_us(lambda: blocking.warning('tts_response'), n // 10)
+    return queued, dropped, direct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput with structured logging off and on.')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=5000, help='Log calls per micro-benchmark row')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'micro.log'), 'w') as sink:
+            rows = micro(args.calls, sink)
+    print(f"{'one log call':30} {'us':>8}")
+    for name, cost in rows:
+        print(f"{name:30} {cost:>8.2f}")
+
+    queued, dropped, direct = slow_sink(args.calls // 10)
+    print(f"1 ms per line sink: queued call {queued:.1f} us ({dropped} of {args.calls // 10} dropped), "
+          f"synchronous handler {direct:.0f} us")
+    assert queued < direct / 10, (queued, direct)
+    assert dropped > 0
+    structured_log.QUEUE_SIZE = 10000
+
+    server = fake_upstreams.start_server(latency={'stt': 0.005, 'llm': 0.005, 'tts': 0.005, 'tts_audio': 0.002},
+                                         transcript='Bank soat nechida ishlaydi?', unique_replies=True, seed=25)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench',
+                      ANSWER_CACHE_SIZE='0')
+    os.chdir(APP_DIR)
+    import app
+    app.app.logger.disabled = True
+    client = app.app.test_client()
+    audio = os.urandom(8 * 1024)
+
+    def turn(i):
+        response = client.post('/process_audio', data={'audio': (io.BytesIO(audio), 'recording.mp3')},
+                               headers={'X-Request-ID': f"bench-{i}"})
+        assert response.status_code == 200 and response.json.get('audio_url'), response.json
+        assert response.headers['X-Request-ID'] == f"bench-{i}"
+
+    def run(n):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(turn, range(n)))
+        return n / (time.perf_counter() - start)
+
+    print(f"\n/process_audio, {args.requests} requests, {args.concurrency} threads, best of {args.rounds} rounds")
+    modes = (('logging off', 'OFF', 0.0), ('info', 'INFO', 0.01),
+             ('debug, 1% payloads', 'DEBUG', 0.01), ('debug, every payload', 'DEBUG', 1.0))
+    best = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        run(30)  # warm up connections
+        # Modes take turns so a slow moment on the machine does not land on one of them
+        for i in range(args.rounds):
+            for mode, level, sample in modes[i % len(modes):] + modes[:i % len(modes)]:
+                path = os.path.join(tmp, f"{level}-{sample}.log")
+                with open(path, 'w') as sink:
+                    structured_log.PAYLOAD_SAMPLE = sample
+                    structured_log.configure(level, stream=sink)
+                    rps = run(args.requests)
+                    structured_log.stop()
+                with open(path) as sink:
+                    lines = [json.loads(line) for line in sink]
+                if rps > best.get(mode, (0,))[0]:
+                    best[mode] = (rps, lines)
+        baseline = best['logging off'][0]
+        for mode, _, _ in modes:
+            rps, mode_lines = best[mode]
+            longest = max([len(json.dumps(line)) for line in mode_lines], default=0)
+            print(f"{mode:22} {rps:>7.1f} req/s ({rps / baseline - 1:+.1%})  "
+                  f"{len(mode_lines) / args.requests:.1f} lines/request, longest {longest} chars")
+        # At debug, every turn logged its STT and TTS calls under its own id
+        by_request = {}
+        for line in best['debug, every payload'][1]:
+            by_request.setdefault(line.get('request_id'), set()).add(line['event'])
+        ids = [f"bench-{i}" for i in range(args.requests)]
+        for request_id in ids:
+            assert {'stt_request', 'stt_response', 'tts_response'} <= by_request.get(request_id, set()), \
+                (request_id, by_request.get(request_id))
+        print(f"Each of the {len(ids)} turns has its stt_request, stt_response and tts_response lines under its id")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
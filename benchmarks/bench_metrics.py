@@ -0,0 +1,190 @@
+"""Cost of the per-stage latency instrumentation, and what it exposes.
+
+Times `with metrics.stage(...)` against an empty block, inside and outside a
+request's timings, the @metrics.timed wrapper, a counter increment, and stages
+recorded from several threads at once, and fails when a stage costs more than
+the budget. Then runs a voice turn through the Flask and the asyncio app
+against the local stand-in upstreams and checks the Server-Timing header
+lists its stages, that /metrics is valid Prometheus text with cumulative
+histogram buckets, and how long a scrape takes.
+
+    python benchmarks/bench_metrics.py --iterations 200000 --budget-us 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+import metrics  # noqa: E402
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*\})? -?[0-9.e+-]+$|'
+                    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{.*\})? \+Inf$')
+
+
+def per_call_us(function, iterations):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        function(iterations)
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+
+def empty_loop(n):
+    for _ in range(n):
+        with contextlib.nullcontext():
+            pass
+
+
+def stage_loop(n):
+    stage = metrics.stage
+    for _ in range(n):
+        with stage('bench'):
+            pass
+
+
+@metrics.timed('bench_timed')
+def noop():
+    pass
+
+
+def timed_loop(n):
+    for _ in range(n):
+        noop()
+
+
+def counter_loop(n):
+    child = metrics.bytes_total.labels('bench')
+    for _ in range(n):
+        child.inc(1)
+
+
+def in_request(loop):
+    def run(n):
+        metrics.start_request()
+        try:
+            loop(n)
+        finally:
+            metrics.end_request()
+    return run
+
+
+def threaded(loop, threads):
+    def run(n):
+        workers = [threading.Thread(target=loop, args=(n // threads,)) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return run
+
+
+# Every sample line parses, and each histogram's buckets only grow up to +Inf == _count
+def check_exposition(text):
+    buckets = {}
+    counts = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            assert line.startswith(('# HELP ', '# TYPE ')), line
+            continue
+        assert SAMPLE.match(line), line
+        name, value = line.rsplit(' ', 1)
+        if '_bucket{' in name:
+            series = re.sub(r',?le="[^"]*"', '', name).replace('_bucket', '')
+            buckets.setdefault(series, []).append(int(value))
+        elif name.split('{')[0].endswith('_count'):
+            counts[name.replace('_count', '')] = int(value)
+    for series, values in buckets.items():
+        assert values == sorted(values), (series, values)
+        assert values[-1] == counts[series.replace('{}', '')], (series, values, counts)
+    return len(buckets)
+
+
+def stage_names(header):
+    return [part.split(';')[0].strip() for part in header.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage instrumentation overhead and /metrics checks.')
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--budget-us', type=float, default=5.0, help='Most a stage may cost, in microseconds')
+    args = parser.parse_args()
+
+    baseline = per_call_us(empty_loop, args.iterations)
+    print(f"{'operation':36} {'us/call':>8}")
+    print(f"{'empty with-block':36} {baseline:>8.3f}")
+    costs = {}
+    for name, loop in (('stage, no request', stage_loop), ('stage, in a request', in_request(stage_loop)),
+                       ('@timed function, in a request', in_request(timed_loop)),
+                       ('counter inc', counter_loop),
+                       (f'stage, {args.threads} threads', threaded(in_request(stage_loop), args.threads))):
+        costs[name] = per_call_us(loop, args.iterations)
+        print(f"{name:36} {costs[name]:>8.3f}  (+{costs[name] - baseline:.3f} over an empty block)")
+    worst = max(cost - baseline for name, cost in costs.items() if 'threads' not in name)
+    assert worst < args.budget_us, f"a stage costs {worst:.2f} us, budget {args.budget_us} us"
+    print(f"Worst single-thread overhead {worst:.2f} us per stage, within the {args.budget_us:.0f} us budget")
+
+    server = fake_upstreams.start_server(latency={'stt': 0.03, 'llm': 0.05, 'tts': 0.02, 'tts_audio': 0.01},
+                                         transcript='Bank soat nechida ishlaydi?', unique_replies=True, seed=24)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench',
+                      ANSWER_CACHE_SIZE='0')
+    os.chdir(APP_DIR)
+    import app
+    import async_app
+    app.app.logger.disabled = True
+    audio = os.urandom(8 * 1024)
+
+    client = app.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post('/process_audio', data={'audio': (io.BytesIO(audio), 'recording.mp3')})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    stages = stage_names(response.headers['Server-Timing'])
+    assert stages[-1] == 'total' and {'stt', 'intent', 'llm', 'tts_wait'} <= set(stages), stages
+    print(f"Flask   Server-Timing: {response.headers['Server-Timing']}")
+
+    async def async_turn():
+        from aiohttp.test_utils import TestClient, TestServer
+
+        async with TestClient(TestServer(async_app.create_app())) as http:
+            with contextlib.redirect_stdout(io.StringIO()):
+                form = {'audio': io.BytesIO(audio)}
+                response = await http.post('/process_audio', data=form)
+                await response.read()
+            assert response.status == 200, await response.text()
+            scrape = await http.get('/metrics')
+            assert scrape.headers['Content-Type'].startswith('text/plain; version=0.0.4'), scrape.headers
+            return response.headers['Server-Timing'], await scrape.text()
+
+    header, text = asyncio.run(async_turn())
+    stages = stage_names(header)
+    assert stages[-1] == 'total' and {'stt', 'intent', 'llm', 'tts_wait'} <= set(stages), stages
+    print(f"asyncio Server-Timing: {header}")
+
+    histograms = check_exposition(text)
+    for name in ('voice_bytes_total{direction="stt_sent"}', 'voice_upstream_failures_total{upstream="llm"}',
+                 'voice_tts_cache_misses_total', 'voice_answer_cache_exact_hits_total',
+                 'voice_stage_seconds_count{stage="tts_download"}'):
+        assert name in text, name
+    start = time.perf_counter()
+    for _ in range(100):
+        metrics.render()
+    print(f"/metrics: {len(text.splitlines())} lines, {histograms} histogram series, valid; "
+          f"render {(time.perf_counter() - start) * 10:.2f} ms per scrape")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
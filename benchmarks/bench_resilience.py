@@ -0,0 +1,250 @@
+"""Deadlines, retries, hedging and circuit breakers on the upstream calls.
+
+First checks the policy on its own: a stalled attempt is cut at the request
+deadline, a hedged duplicate beats a stalled first attempt, and a breaker
+opens after repeated failures and closes again through its half-open probe.
+Then runs the Flask app in-process against the local stand-in upstreams with
+faults injected (a share of STT, LLM and TTS requests answered 503, another
+share stalled) and compares /process_audio latency and failures with the
+policy off (one attempt, no deadline, the old behaviour) and on. Last, takes
+the LLM down: the circuit opens, replies fall back to the canned answer in
+milliseconds, and real answers return once the LLM is back.
+
+    python benchmarks/bench_resilience.py --requests 200 --error-rate 0.05 --stall-rate 0.03
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+import resilience  # noqa: E402
+from resilience import CircuitOpen, DeadlineExceeded, Upstream  # noqa: E402
+
+QUESTION = "Bank soat nechida ishlaydi?"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def check_policy():
+    # A stalled attempt ends at the request deadline, not at its own timeout
+    upstream = Upstream('check', timeout=5.0, retries=2)
+    resilience.start_deadline(0.3)
+    started = time.monotonic()
+    try:
+        upstream.call(lambda seconds: time.sleep(2))
+        raise AssertionError("the deadline did not stop the call")
+    except DeadlineExceeded:
+        pass
+    finally:
+        resilience.end_deadline()
+    assert time.monotonic() - started < 0.45
+    print(f"deadline: a 2 s stall ended after {(time.monotonic() - started) * 1000:.0f} ms of a 300 ms budget")
+
+    # The first attempt stalls; the duplicate sent after hedge_after answers
+    upstream = Upstream('check', timeout=5.0, hedge=True, hedge_after=0.1)
+    calls = []
+
+    def stalled_once(seconds):
+        calls.append(seconds)
+        time.sleep(2 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    started = time.monotonic()
+    assert upstream.call(stalled_once) == 2
+    assert time.monotonic() - started < 0.3 and upstream.hedge_wins == 1
+    print(f"hedging: answered by the hedge after {(time.monotonic() - started) * 1000:.0f} ms")
+
+    # Three failing calls open the breaker; after reset_timeout one probe closes it
+    upstream = Upstream('check', timeout=1.0, retries=0, failure_threshold=3, reset_timeout=0.2)
+
+    def failing(seconds):
+        raise resilience.UpstreamError('check', 503)
+
+    for _ in range(3):
+        try:
+            upstream.call(failing)
+        except resilience.UpstreamError:
+            pass
+    assert upstream.breaker.state == 'open'
+    try:
+        upstream.call(lambda seconds: 'ok')
+        raise AssertionError("an open circuit let a call through")
+    except CircuitOpen:
+        pass
+    time.sleep(0.25)
+    assert upstream.call(lambda seconds: 'ok') == 'ok' and upstream.breaker.state == 'closed'
+    print("breaker: opened after 3 failures, short-circuited, closed after the half-open probe")
+
+    # A probe that ends without an outcome must not hold the half-open circuit for good:
+    # one refused for lack of deadline, and one cancelled by a client disconnect
+    upstream = Upstream('check', timeout=1.0, retries=0, failure_threshold=1, reset_timeout=0.05)
+    try:
+        upstream.call(failing)
+    except resilience.UpstreamError:
+        pass
+    time.sleep(0.1)
+    resilience.start_deadline(0.01)
+    try:
+        upstream.call(lambda seconds: 'ok')
+        raise AssertionError("a call past the deadline was let through")
+    except DeadlineExceeded:
+        pass
+    finally:
+        resilience.end_deadline()
+    assert upstream.call(lambda seconds: 'ok') == 'ok' and upstream.breaker.state == 'closed'
+
+    async def cancelled_probe():
+        try:
+            await upstream.async_call(failing_async)
+        except resilience.UpstreamError:
+            pass
+        await asyncio.sleep(0.1)
+        probe = asyncio.ensure_future(upstream.async_call(stalled_async))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+        return await upstream.async_call(ok_async)
+
+    async def failing_async(seconds):
+        raise resilience.UpstreamError('check', 503)
+
+    async def stalled_async(seconds):
+        await asyncio.sleep(10)
+
+    async def ok_async(seconds):
+        return 'ok'
+
+    assert asyncio.run(cancelled_probe()) == 'ok' and upstream.breaker.state == 'closed'
+    print("breaker: a probe cut by the deadline or cancelled frees the half-open circuit for the next call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency and failures under injected upstream faults.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.1, help='normal seconds per upstream call')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='share of calls per route answered 503')
+    parser.add_argument('--stall-rate', type=float, default=0.03, help='share of calls per route that stall')
+    parser.add_argument('--stall-seconds', type=float, default=4.0)
+    parser.add_argument('--deadline', type=float, default=3.0, help='request deadline with the policy on')
+    args = parser.parse_args()
+    check_policy()
+
+    routes = ('stt', 'tts', 'llm')
+    server = fake_upstreams.start_server(latency={route: args.latency for route in routes}, unique_replies=True,
+                                         error_rate={route: args.error_rate for route in routes},
+                                         stall_rate={route: args.stall_rate for route in routes},
+                                         stall_seconds=args.stall_seconds, transcript=QUESTION, seed=21)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench')
+    os.chdir(APP_DIR)
+    import app
+    from answer_cache import AnswerCache
+    from utterances import LLM_UNAVAILABLE, STT_UNAVAILABLE
+    app.app.logger.disabled = True
+    # Every request must reach the upstreams
+    app.answer_cache = AnswerCache(max_entries=0)
+    audio = os.urandom(16 * 1024)
+
+    def configure(on):
+        if on:
+            resilience.REQUEST_DEADLINE = args.deadline
+            hedge_after = args.latency * 3
+            resilience.stt = Upstream('stt', timeout=args.deadline / 2, hedge=True, hedge_after=hedge_after)
+            resilience.llm = Upstream('llm', timeout=args.deadline / 2)
+            resilience.tts = Upstream('tts', timeout=args.deadline / 2, hedge=True, hedge_after=hedge_after)
+        else:
+            # One attempt each, no breaker and a deadline no call reaches
+            resilience.REQUEST_DEADLINE = 3600
+            resilience.stt, resilience.llm, resilience.tts = (
+                Upstream(name, timeout=3600, retries=0, failure_threshold=10 ** 9) for name in routes)
+        resilience.UPSTREAMS = (resilience.stt, resilience.llm, resilience.tts)
+
+    def one(path):
+        client = app.app.test_client()
+        start = time.perf_counter()
+        if path == '/process_audio':
+            response = client.post(path, data={'audio': (BytesIO(audio), 'recording.mp3')})
+        else:
+            response = client.post(path, json={'text': QUESTION})
+        seconds = time.perf_counter() - start
+        body = response.get_json() if response.status_code == 200 else {}
+        if response.status_code != 200 or body.get('error') or not body.get('audio_url'):
+            outcome = 'failed'
+        elif body['response'] in (LLM_UNAVAILABLE, STT_UNAVAILABLE):
+            outcome = 'canned'
+        elif body.get('transcript') == QUESTION or path != '/process_audio':
+            outcome = 'answered'
+        else:
+            # The STT error text was spoken back
+            outcome = 'failed'
+        return seconds, outcome
+
+    def run(path, n, concurrency):
+        # The app logs every upstream call; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(concurrency) as pool:
+                return list(pool.map(lambda _: one(path), range(n)))
+
+    print(f"\n{args.requests} /process_audio requests, {args.concurrency} at a time, "
+          f"{args.latency * 1000:.0f} ms per call, {args.error_rate:.0%} 503s and "
+          f"{args.stall_rate:.0%} {args.stall_seconds:.0f} s stalls on each of STT, LLM and TTS")
+    print(f"{'policy':8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'answered':>9} {'canned':>7} {'failed':>7}")
+    for name, on in (('off', False), ('on', True)):
+        configure(on)
+        results = run('/process_audio', args.requests, args.concurrency)
+        latencies = [seconds for seconds, _ in results]
+        outcomes = [outcome for _, outcome in results]
+        print(f"{name:8} {statistics.median(latencies) * 1000:>5.0f} ms "
+              f"{percentile(latencies, 0.9) * 1000:>5.0f} ms {percentile(latencies, 0.99) * 1000:>5.0f} ms "
+              f"{max(latencies) * 1000:>5.0f} ms {outcomes.count('answered'):>9} {outcomes.count('canned'):>7} "
+              f"{outcomes.count('failed'):>7}")
+        # Every turn went through the policies configured for this row, STT included
+        assert resilience.stt.calls >= args.requests, resilience.stt.stats()
+        if on:
+            assert max(latencies) < args.deadline + 1.0, "a request outlived its deadline"
+    for name, stats in resilience.stats().items():
+        print(f"  {name}: {stats}")
+
+    # Outage: every LLM call fails until the LLM comes back
+    server.error_rate, server.stall_rate = {}, {}
+    configure(True)
+    resilience.llm = Upstream('llm', timeout=args.deadline / 2, failure_threshold=5, reset_timeout=1.0)
+    resilience.UPSTREAMS = (resilience.stt, resilience.llm, resilience.tts)
+    server.down.add('llm')
+    results = run('/process_text', 40, 1)
+    short_circuited = [seconds for seconds, _ in results[10:]]
+    assert all(outcome == 'canned' for _, outcome in results)
+    assert resilience.llm.breaker.state == 'open' and resilience.llm.short_circuits >= 30
+    print(f"\nLLM down: circuit open after {resilience.llm.failures} failed attempts, "
+          f"then canned replies in {statistics.median(short_circuited) * 1000:.1f} ms p50 "
+          f"({resilience.llm.short_circuits} short-circuited)")
+    server.down.discard('llm')
+    time.sleep(1.1)
+    results = run('/process_text', 10, 1)
+    assert all(outcome == 'answered' for _, outcome in results)
+    assert resilience.llm.breaker.state == 'closed'
+    print(f"LLM back: the half-open probe closed the circuit, {len(results)}/10 answered")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Load/save cost per turn and memory held per session for the in-process and
+SQLite session stores, plus checks that the byte budget and the idle TTL
+hold while many sessions come and go.
+
+    python benchmarks/bench_session_store.py --sessions 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from session_store import MemorySessionStore, SQLiteSessionStore, new_session_id  # noqa: E402
+
+QUESTION = "Ipak Yo'li banki shanba kuni soat nechagacha ishlaydi?"
+ANSWER = ("Shanba kuni filiallarimiz soat o'n ikkigacha ochiq bo'ladi, "
+          "mobil ilova orqali esa xizmatlar kun bo'yi ishlaydi.")
+
+
+# One dialog turn the way BankChatbot does it: load, add both turns, save
+def turn(store, sid):
+    session = store.load(sid)
+    session.add('user', QUESTION)
+    session.add('assistant', ANSWER)
+    store.save(session)
+
+
+def run(store, sids, turns):
+    start = time.perf_counter()
+    for _ in range(turns):
+        for sid in sids:
+            turn(store, sid)
+    return (time.perf_counter() - start) / (turns * len(sids))
+
+
+def check_budget(max_bytes):
+    store = MemorySessionStore(max_bytes=max_bytes)
+    for _ in range(5000):
+        turn(store, new_session_id())
+        assert store.stats()['bytes'] <= max_bytes
+    stats = store.stats()
+    assert stats['evicted'] and stats['sessions'] < 5000
+    # The most recent session always survives eviction
+    sid = new_session_id()
+    turn(store, sid)
+    assert store.load(sid).turns
+    # Idle sessions expire and come back empty
+    store = MemorySessionStore(ttl=0.05)
+    turn(store, sid)
+    time.sleep(0.1)
+    assert not store.load(sid).turns and store.stats()['expired'] == 1
+    print(f"budget: {stats['sessions']} sessions in {stats['bytes']} of {max_bytes} bytes, "
+          f"{stats['evicted']} evicted; idle TTL expires sessions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Session store cost per turn and memory per session.')
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--turns', type=int, default=6, help='turns per session (history keeps the last 10 messages)')
+    args = parser.parse_args()
+    check_budget(256 * 1024)
+
+    sids = [new_session_id() for _ in range(args.sessions)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = MemorySessionStore(max_bytes=2**40)
+    per_turn = run(store, sids, args.turns)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    stats = store.stats()
+    print(f"{'store':8} {'per turn':>10} {'per session':>12}")
+    print(f"{'memory':8} {per_turn * 1e6:>7.1f} us {held / args.sessions:>8.0f} B  "
+          f"(accounted {stats['bytes'] / stats['sessions']:.0f} B)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteSessionStore(os.path.join(directory, 'sessions.db'), max_bytes=2**40)
+        sample = sids[:max(1, args.sessions // 10)]
+        per_turn = run(store, sample, args.turns)
+        stats = store.stats()
+        print(f"{'sqlite':8} {per_turn * 1e6:>7.1f} us {stats['bytes'] / stats['sessions']:>8.0f} B  "
+              f"({len(sample)} sessions, on disk)")
+
+
+if __name__ == '__main__':
+    main()
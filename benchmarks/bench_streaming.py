@@ -0,0 +1,79 @@
+"""Time to first visible token versus total latency: blocking /process_text
+against the SSE endpoint /process_text_stream.
+
+Runs the Flask app in-process against the local stand-in upstreams. The LLM
+starts answering after --llm-latency and then sends one word every
+--token-interval seconds; every reply is unique, so TTS is never cached.
+
+    python benchmarks/bench_streaming.py --turns 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+
+REPLY = ("Ipak Yo'li banki dushanbadan jumagacha soat to'qqizdan olti gacha ishlaydi, shanba kuni esa "
+         "filiallarimiz soat o'n ikkigacha ochiq bo'ladi, mobil ilova orqali esa xizmatlar kun bo'yi ishlaydi.")
+QUESTION = "Bank qaysi kunlari ishlaydi?"
+
+
+def blocking_turn(client):
+    start = time.perf_counter()
+    response = client.post('/process_text', json={'text': QUESTION})
+    assert response.get_json()['audio_url']
+    total = time.perf_counter() - start
+    # Nothing is visible until the whole JSON arrives
+    return total, total
+
+
+def streamed_turn(client):
+    start = time.perf_counter()
+    response = client.post('/process_text_stream', json={'text': QUESTION}, buffered=False)
+    first_token = None
+    body = []
+    for chunk in response.response:
+        chunk = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        if first_token is None and chunk.startswith('event: token'):
+            first_token = time.perf_counter() - start
+        body.append(chunk)
+    total = time.perf_counter() - start
+    assert 'event: done' in body[-1] and '"audio_url": "/tts/' in body[-1]
+    return first_token, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='First visible token vs total latency, blocking vs SSE.')
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--llm-latency', type=float, default=0.4, help='seconds to the first LLM token')
+    parser.add_argument('--token-interval', type=float, default=0.03)
+    parser.add_argument('--tts-latency', type=float, default=0.3)
+    args = parser.parse_args()
+
+    server = fake_upstreams.start_server(latency={'llm': args.llm_latency, 'tts': args.tts_latency},
+                                         reply=REPLY, unique_replies=True, token_interval=args.token_interval)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench')
+    os.chdir(APP_DIR)
+    import app
+    app.app.logger.disabled = True
+    client = app.app.test_client()
+
+    print(f"{'endpoint':22} {'first token p50':>16} {'total p50':>10}")
+    for name, turn in (('/process_text', blocking_turn), ('/process_text_stream', streamed_turn)):
+        results = [turn(client) for _ in range(args.turns)]
+        first = statistics.median(r[0] for r in results)
+        total = statistics.median(r[1] for r in results)
+        print(f"{name:22} {first * 1000:>13.0f} ms {total * 1000:>7.0f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""STT latency with one provider against racing Aisha and Gemini.
+
+Runs the STT router against the local stand-in upstreams, where Aisha is fast
+but stalls on a share of requests and Gemini is slower but steady. Compares
+each provider alone, a race that starts both at once, and the default race
+that starts the second provider only after the leader's recent p90. Reports
+latency percentiles and upstream requests per recording (what racing costs).
+Then slows Aisha down for good and checks that the router makes Gemini the
+leader, and checks the asyncio router cancels the losing request.
+
+    python benchmarks/bench_stt_race.py --recordings 300 --aisha-stall-rate 0.1
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STT tail latency, single provider vs racing.')
+    parser.add_argument('--recordings', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--aisha-latency', type=float, default=0.15)
+    parser.add_argument('--aisha-stall-rate', type=float, default=0.1)
+    parser.add_argument('--stall-seconds', type=float, default=3.0)
+    parser.add_argument('--gemini-latency', type=float, default=0.4)
+    args = parser.parse_args()
+
+    server = fake_upstreams.start_server(latency={'stt': args.aisha_latency, 'gemini': args.gemini_latency},
+                                         stall_rate={'stt': args.aisha_stall_rate},
+                                         stall_seconds=args.stall_seconds, transcript='Kredit olmoqchiman', seed=22)
+    os.environ.update(AISHA_BASE_URL=server.url, GEMINI_BASE_URL=server.url)
+    import resilience
+    from stt_providers import AishaSTT, GeminiSTT, STTRouter
+    audio = os.urandom(16 * 1024)
+
+    def providers():
+        # Fresh upstreams: no retries or hedging of their own, so the router is what is measured
+        return (AishaSTT('bench', resilience.Upstream('stt', timeout=10.0, retries=0)),
+                GeminiSTT('bench', upstream=resilience.Upstream('gemini', timeout=10.0, retries=0)))
+
+    def run(router, n):
+        def one(_):
+            start = time.perf_counter()
+            transcript, error = router.transcribe(audio, 'recording.mp3')
+            assert transcript.lower() == 'kredit olmoqchiman', (transcript, error)
+            return time.perf_counter() - start
+
+        before = server.stats.snapshot()['total_requests']
+        # The providers log every response; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = list(pool.map(one, range(n)))
+        return latencies, (server.stats.snapshot()['total_requests'] - before) / n
+
+    aisha, gemini = providers()
+    print(f"{args.recordings} recordings; Aisha {args.aisha_latency * 1000:.0f} ms with "
+          f"{args.aisha_stall_rate:.0%} {args.stall_seconds:.0f} s stalls, Gemini {args.gemini_latency * 1000:.0f} ms")
+    print(f"{'routing':22} {'p50':>8} {'p90':>8} {'p99':>8} {'requests/rec':>13}  wins")
+    for name, router in (('aisha only', STTRouter([aisha])), ('gemini only', STTRouter([gemini])),
+                         ('race at once', STTRouter(providers(), race_after=0)),
+                         ('race after p90', STTRouter(providers()))):
+        run(router, 30)  # warm up connections and the histograms
+        latencies, requests = run(router, args.recordings)
+        stats = router.stats()
+        wins = ', '.join(f"{p}={stats[p]['wins']}" for p in stats if p != 'order')
+        print(f"{name:22} {statistics.median(latencies) * 1000:>5.0f} ms {percentile(latencies, 0.9) * 1000:>5.0f} ms "
+              f"{percentile(latencies, 0.99) * 1000:>5.0f} ms {requests:>13.2f}  {wins}")
+    print(router.stats())
+
+    # Aisha slows down for good: Gemini must become the leader
+    server.latency['stt'] = args.gemini_latency * 3
+    server.stall_rate = {}
+    assert router.order()[0].name == 'aisha'
+    run(router, 200)
+    assert router.order()[0].name == 'gemini', router.stats()
+    latencies, requests = run(router, 100)
+    print(f"Aisha at {server.latency['stt'] * 1000:.0f} ms: Gemini leads, p50 "
+          f"{statistics.median(latencies) * 1000:.0f} ms, {requests:.2f} requests per recording")
+
+    # asyncio: the request that loses is cancelled, not left running
+    async def race_async():
+        import aiohttp
+
+        router = STTRouter(providers(), race_after=0)
+        async with aiohttp.ClientSession() as http:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(20):
+                    transcript, _ = await router.transcribe_async(http, audio, 'recording.mp3')
+                    assert transcript.lower() == 'kredit olmoqchiman'
+        return router.stats()
+
+    stats = asyncio.run(race_async())
+    assert stats['gemini']['wins'] == 20 and stats['aisha']['cancelled'] == 20, stats
+    print("asyncio: Gemini won all 20 races, all 20 Aisha requests cancelled")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
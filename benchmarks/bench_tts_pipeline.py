@@ -0,0 +1,135 @@
+"""Time to first audio for a long reply: one TTS call on the whole text versus
+the sentence pipeline, plus the same through /process_text and its audio
+stream. Also checks that splitting never loses or reorders text.
+
+Runs against the local stand-in upstreams; synthesis time grows with the
+text length (--tts-char-latency), like the real API.
+
+    python benchmarks/bench_tts_pipeline.py --turns 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+from tts_cache import TTSCache  # noqa: E402
+from tts_pipeline import last_sentence_end, split_segments  # noqa: E402
+
+# About 50 words, four sentences
+REPLY = ("Ipak Yo'li banki dushanbadan jumagacha soat to'qqizdan oltigacha ishlaydi. "
+         "Shanba kuni filiallarimiz soat o'n ikkigacha ochiq bo'ladi, yakshanba esa dam olish kuni. "
+         "Mobil ilova orqali to'lovlar, o'tkazmalar va omonatlarni kun bo'yi boshqarishingiz mumkin. "
+         "Qo'shimcha savollar bo'lsa, bizning aloqa markazimizga qo'ng'iroq qiling yoki filialga tashrif buyuring.")
+
+
+# A fresh variant of the reply, so no sentence is already in the TTS cache
+def variant(n):
+    return REPLY.replace('. ', f' ({n}). ').replace(' buyuring.', f' buyuring ({n}).')
+
+
+def check_splitting():
+    texts = [REPLY, "Salom!", "Bir. Ikki. Uch.", "1.5 foiz, ya'ni yillik. Rahmat!", "a" * 400, "", "Nima? Qachon?!  Ha."]
+    for text in texts:
+        segments = split_segments(text)
+        assert ' '.join(segments).split() == text.split(), text
+        assert all(segments), text
+    # Feeding token by token queues the same words in the same order
+    for text in texts:
+        buffer, fed = '', []
+        for word in text.split(' '):
+            buffer += word + ' '
+            end = last_sentence_end(buffer)
+            if end:
+                fed += split_segments(buffer[:end])
+                buffer = buffer[end:]
+        fed += split_segments(buffer)
+        assert ' '.join(fed).split() == text.split(), text
+    print(f"splitting: {len(texts)} texts, words and order preserved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first audio, whole-text TTS vs sentence pipeline.')
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--tts-latency', type=float, default=0.2)
+    parser.add_argument('--tts-char-latency', type=float, default=0.004)
+    args = parser.parse_args()
+    check_splitting()
+
+    server = fake_upstreams.start_server(latency={'tts': args.tts_latency, 'tts_audio': 0.05},
+                                         tts_char_latency=args.tts_char_latency)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench',
+                      ANSWER_CACHE_SIZE='0')
+    os.chdir(APP_DIR)
+    import app
+    app.app.logger.disabled = True
+    client = app.app.test_client()
+
+    def whole(n):
+        start = time.perf_counter()
+        assert app.synthesize_speech(variant(n))
+        total = time.perf_counter() - start
+        return total, total
+
+    def pipelined(n):
+        start = time.perf_counter()
+        job = app.tts_pipeline.submit(variant(n))
+        assert job.first()
+        first = time.perf_counter() - start
+        assert all(result for _, result in job.results())
+        return first, time.perf_counter() - start
+
+    def endpoint(n):
+        server.reply = variant(-1 - n)
+        start = time.perf_counter()
+        payload = client.post('/process_text', json={'text': 'Bank qachon ishlaydi?'}).get_json()
+        audio = client.get(payload['audio_url'], buffered=False)
+        chunks = iter(audio.response)
+        next(chunks)
+        first = time.perf_counter() - start
+        size = sum(len(chunk) for chunk in chunks)
+        assert size and len(payload['audio_segments']) > 1
+        return first, time.perf_counter() - start
+
+    print(f"{len(split_segments(REPLY))} segments, {len(REPLY)} characters")
+    print(f"{'path':28} {'first audio p50':>16} {'all audio p50':>14}")
+    for name, turn in (('whole text, one TTS call', whole), ('sentence pipeline', pipelined),
+                       ('/process_text + stream', endpoint)):
+        results = [turn(n) for n in range(args.turns)]
+        first = statistics.median(r[0] for r in results)
+        total = statistics.median(r[1] for r in results)
+        print(f"{name:28} {first * 1000:>13.0f} ms {total * 1000:>11.0f} ms")
+
+    # Another worker on the same cache directory: it has none of this one's jobs or cache index,
+    # yet serves the reply's audio_url, waiting for a segment still being stored elsewhere
+    server.reply = variant(-100)
+    payload = client.post('/process_text', json={'text': 'Bank qachon ishlaydi?'}).get_json()
+    assert payload['audio_url'].startswith('/tts/speech/'), payload['audio_url']
+    expected = client.get(payload['audio_url']).data
+    job_url = f"/tts/stream/{app.tts_pipeline.start().id}.mp3"
+    app.tts_cache = TTSCache(app.tts_cache.directory)
+    app.tts_pipeline = app.TTSPipeline(app.text_to_speech, app.tts_pipeline.key_for)
+    assert client.get(job_url).status_code == 404
+    last = payload['audio_segments'][-1][len('/tts/'):-len('.mp3')]
+    audio = app.tts_cache.get(last)
+    os.remove(app.tts_cache.path(last))
+    app.tts_cache = TTSCache(app.tts_cache.directory)
+    writer = threading.Timer(0.3, app.tts_cache.put, (last, audio))
+    writer.start()
+    start = time.perf_counter()
+    assert client.get(payload['audio_url']).data == expected
+    print(f"Another worker served the reply's {len(payload['audio_segments'])} segments by their keys, "
+          f"waiting {(time.perf_counter() - start) * 1000:.0f} ms for the one still being stored")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Time to the first audio byte of a segment that is still downloading from the
+TTS API: waiting for the complete file (the old /tts/<key>.mp3) versus passing
+the download through as it arrives. Also reports what a repeat fetch costs
+with the ETag, and checks that streamed MP3 trimming and byte ranges behave
+like their whole-file counterparts.
+
+Runs the Flask app in-process against the local stand-in upstreams, which
+send the audio in 4 KB chunks every --chunk-interval seconds.
+
+    python benchmarks/bench_tts_proxy.py --turns 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'loadtest'))
+
+import fake_upstreams  # noqa: E402
+from audio_http import parse_range  # noqa: E402
+from utterances import Mp3SegmentStream, mp3_segment  # noqa: E402
+
+
+def id3_tagged(body, header_bytes, trailer):
+    size = bytes((header_bytes >> shift) & 0x7f for shift in (21, 14, 7, 0))
+    return b'ID3\x04\x00\x00' + size + b'h' * header_bytes + body + (b'TAG' + b't' * 125 if trailer else b'')
+
+
+def check_trimming(rounds=200):
+    rng = random.Random(7)
+    samples = [b'', b'\xff\xfb', id3_tagged(b'\xff' * 900, 300, True), id3_tagged(b'\xff' * 40, 5, False),
+               b'\xff' * 500 + b'TAG' + b'y' * 125, b'TAG' + b'z' * 125]
+    for data in samples:
+        for first in (False, True):
+            for last in (False, True):
+                for _ in range(rounds):
+                    segment, out, i = Mp3SegmentStream(first, last), b'', 0
+                    while i < len(data):
+                        n = rng.randint(1, 64)
+                        out += segment.feed(data[i:i + n])
+                        i += n
+                    assert out + segment.end() == mp3_segment(data, first, last)
+    ranges = {'bytes=0-9': (0, 10), 'bytes=5-': (5, 100), 'bytes=-10': (90, 100), 'bytes=95-200': (95, 100),
+              'bytes=100-': False, 'bytes=-0': False, 'bytes=0-1,3-4': None, 'bytes=5-3': None, 'items=0-1': None}
+    for header, expected in ranges.items():
+        assert parse_range(header, 100) == expected, header
+    print(f"trimming: {len(samples)} files x {4 * rounds} chunkings match mp3_segment; {len(ranges)} range headers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='First audio byte, complete download vs pass-through.')
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--tts-latency', type=float, default=0.2)
+    parser.add_argument('--audio-kb', type=int, default=48)
+    parser.add_argument('--chunk-interval', type=float, default=0.05, help='seconds between 4 KB audio chunks')
+    args = parser.parse_args()
+    check_trimming()
+
+    server = fake_upstreams.start_server(latency={'tts': args.tts_latency}, audio_bytes=args.audio_kb * 1024,
+                                         audio_chunk_interval=args.chunk_interval)
+    os.environ.update(AISHA_BASE_URL=server.url, TOGETHER_BASE_URL=f"{server.url}/v1", TTS_WARMUP='0',
+                      UPLOADS_JANITOR='0', STT_API_KEY='bench', TTS_API_KEY='bench', TOGETHER_API_KEY='bench')
+    os.chdir(APP_DIR)
+    import app
+    app.app.logger.disabled = True
+    client = app.app.test_client()
+    run = os.urandom(3).hex()
+
+    def queue(n, name):
+        text = f"Bugungi valyuta kurslari haqida ma'lumot ({run}-{name}-{n})."
+        key = app.make_key(text, **app.TTS_VOICE)
+        app.tts_pipeline.submit(text)
+        return key
+
+    # The old handler: wait until the segment is synthesized and stored, then send it
+    def complete(n):
+        start = time.perf_counter()
+        key = queue(n, 'complete')
+        app.tts_pipeline.wait(key)
+        audio = app.tts_cache.get(key)
+        first = time.perf_counter() - start
+        assert audio
+        return first, first
+
+    def passthrough(n):
+        start = time.perf_counter()
+        key = queue(n, 'passthrough')
+        response = client.get(f"/tts/{key}.mp3", buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        first = time.perf_counter() - start
+        for _ in chunks:
+            pass
+        return first, time.perf_counter() - start
+
+    print(f"{args.audio_kb} KB per segment, one 4 KB chunk every {args.chunk_interval * 1000:.0f} ms")
+    print(f"{'path':22} {'first byte p50':>15} {'all bytes p50':>14}")
+    for name, turn in (('complete file', complete), ('pass-through', passthrough)):
+        results = [turn(n) for n in range(args.turns)]
+        first = statistics.median(r[0] for r in results)
+        total = statistics.median(r[1] for r in results)
+        print(f"{name:22} {first * 1000:>12.0f} ms {total * 1000:>11.0f} ms")
+
+    key = queue(0, 'repeat')
+    app.tts_pipeline.wait(key)
+    full = client.get(f"/tts/{key}.mp3")
+    repeat = client.get(f"/tts/{key}.mp3", headers={'If-None-Match': full.headers['ETag']})
+    seek = client.get(f"/tts/{key}.mp3", headers={'Range': 'bytes=-4096'})
+    print(f"repeat fetch: {full.status_code} {len(full.data)} B -> {repeat.status_code} {len(repeat.data)} B; "
+          f"seek: {seek.status_code} {len(seek.data)} B; Cache-Control: {full.headers['Cache-Control']}")
+    assert repeat.status_code == 304 and seek.status_code == 206
+
+    # The same key stored as other bytes (e.g. synthesized whole instead of assembled) is a new
+    # representation: the old ETag no longer matches, and a range conditioned on it gets the full file
+    app.tts_cache.put(key, full.data[:-1024])
+    changed = client.get(f"/tts/{key}.mp3", headers={'If-None-Match': full.headers['ETag']})
+    resumed = client.get(f"/tts/{key}.mp3", headers={'Range': 'bytes=0-99', 'If-Range': full.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != full.headers['ETag']
+    assert resumed.status_code == 200 and len(resumed.data) == len(full.data) - 1024
+    print(f"changed bytes under the same key: {changed.status_code} with a new ETag, "
+          f"stale If-Range -> {resumed.status_code} {len(resumed.data)} B")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
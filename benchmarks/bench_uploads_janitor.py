@@ -0,0 +1,89 @@
+"""Cost of one uploads janitor pass over a large directory: the incremental
+index versus re-listing the directory every pass. Also checks that the age,
+count and byte limits hold and that nothing but recordings and TTS outputs is
+ever removed.
+
+    python benchmarks/bench_uploads_janitor.py --files 50000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from uploads_janitor import UploadsJanitor  # noqa: E402
+
+# Files that share the directory with the recordings and must survive every pass
+PROTECTED = ['linear_regression_model.pkl', 'customers.db', 'general_info.txt', 'test_data2.csv',
+             'recording_notes.txt', 'output_final.mp3', f"recording_{uuid.uuid4()}.mp3.tmp"]
+
+
+def make_file(directory, name, size, mtime):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def fill(directory, files, size, now):
+    for i in range(files):
+        prefix = 'recording' if i % 2 else 'output'
+        make_file(directory, f"{prefix}_{uuid.uuid4()}.mp3", size, now - (files - i))
+    for name in PROTECTED:
+        make_file(directory, name, 64, now - 10 * 365 * 86400)
+    # A symlink with a recording's name must not lead the janitor to its target
+    os.symlink(os.path.join(directory, 'customers.db'), os.path.join(directory, f"recording_{uuid.uuid4()}.mp3"))
+
+
+def check_limits():
+    now = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        fill(directory, 300, 1000, now)
+        janitor = UploadsJanitor(directory, max_age=250, max_files=200, max_bytes=150_000)
+        janitor.sweep(now)
+        stats = janitor.stats()
+        assert stats['files'] == 150 and stats['bytes'] == 150_000, stats
+        janitor.sweep(now + 200)
+        assert janitor.stats()['files'] == 50
+        janitor.sweep(now + 10_000)
+        left = sorted(os.listdir(directory))
+        assert all(name in left for name in PROTECTED) and len(left) == len(PROTECTED) + 1, left
+        assert janitor.stats()['reclaimed_bytes'] == 300_000
+    print("limits: age, count and byte limits hold; models, data, look-alikes and symlinks untouched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Uploads janitor pass cost, incremental index vs re-listing.')
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--passes', type=int, default=20)
+    parser.add_argument('--new-per-pass', type=int, default=5, help='recordings saved between passes')
+    args = parser.parse_args()
+    check_limits()
+
+    now = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        fill(directory, args.files, 256, now)
+        print(f"{args.files} recordings, {args.new_per_pass} new per pass, as many removed by the count limit")
+        print(f"{'janitor':22} {'pass p50':>10} {'pass max':>10}")
+        for name, rescan_interval in (('re-list every pass', 0), ('incremental index', 3600)):
+            janitor = UploadsJanitor(directory, max_age=30 * 86400, max_files=args.files, max_bytes=2**40,
+                                     rescan_interval=rescan_interval)
+            janitor.scan()
+            seconds = []
+            for _ in range(args.passes):
+                for _ in range(args.new_per_pass):
+                    janitor.track(make_file(directory, f"recording_{uuid.uuid4()}.mp3", 256, time.time()))
+                start = time.perf_counter()
+                janitor.sweep()
+                seconds.append(time.perf_counter() - start)
+            assert janitor.stats()['files'] == args.files
+            print(f"{name:22} {statistics.median(seconds) * 1000:>7.2f} ms {max(seconds) * 1000:>7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Uzbek text normalization and number parsing: the per-call versions that
+app.py and terminal.py carried (a 66-entry dict rebuilt and joined character
+by character, the number map rebuilt and every "va" stripped) against the
+precompiled tables and number grammar in uz_text. Checks first that random
+numbers up to 10^9 spelled out in words parse back, that the new parser
+agrees with the old one wherever the old one was right, and that batch
+normalization matches normalizing one text at a time.
+
+    python benchmarks/bench_uz_text.py --texts 100000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import uz_text  # noqa: E402
+
+ONES = ['', 'bir', 'ikki', 'uch', 'to\'rt', 'besh', 'olti', 'yetti', 'sakkiz', 'to\'qqiz']
+TENS = ['', 'o\'n', 'yigirma', 'o\'ttiz', 'qirq', 'ellik', 'oltmish', 'yetmish', 'sakson', 'to\'qson']
+FILLER = ['mening', 'id', 'raqamim', 'iltimos', 'javob', 'bering', 'valyuta', 'kurslari', 'menga', 'kerak']
+CYRILLIC = {'ўн бир': 11, 'икки юз эллик минг': 250000, 'менинг ид рақамим қирқ беш': 45, 'тўрт минг': 4000}
+
+
+# The versions this replaces, as terminal.py and app.py had them; terminal.py's
+# parser also transliterated, app.py's did not
+def old_krill_to_latin(text):
+    krill_to_latin_map = {
+        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+        'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+        'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'ъ': '', 'ы': 'i',
+        'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'қ': 'q', 'ғ': 'g\'', 'ҳ': 'h',
+        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
+        'Ж': 'J', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+        'Ф': 'F', 'Х': 'X', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Ъ': '', 'Ы': 'I',
+        'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya', 'Қ': 'Q', 'Ғ': 'G\'', 'Ҳ': 'H'
+    }
+    return ''.join(krill_to_latin_map.get(char, char) for char in text)
+
+
+def old_text_to_number(text, transliterate=False):
+    number_map = {
+        'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
+        'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
+        'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
+        'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
+        'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
+    }
+    text = text.lower().replace('va', '').strip()
+    if transliterate:
+        text = old_krill_to_latin(text)
+    numeric_match = re.search(r'\b\d+\b', text)
+    if numeric_match:
+        return int(numeric_match.group())
+    number_words = []
+    for word in text.split():
+        if word in number_map:
+            number_words.append(word)
+        elif re.match(r'[\d]', word):
+            continue
+        elif number_words:
+            break
+    if not number_words:
+        return None
+    total = 0
+    current = 0
+    for word in number_words:
+        num = number_map[word]
+        if num in [100, 1000, 1000000]:
+            if current == 0:
+                current = 1
+            total += current * num
+            current = 0
+        else:
+            current += num
+    total += current
+    return total if total > 0 else None
+
+
+# n in words, the way a caller might say it: "bir" before yuz/ming optional, "va" between groups
+def spell(n, rng):
+    def group(n):
+        hundreds, rest = divmod(n, 100)
+        words = []
+        if hundreds:
+            words += ([ONES[hundreds]] if hundreds > 1 or rng.random() < 0.5 else []) + ['yuz']
+        words += [TENS[rest // 10], ONES[rest % 10]]
+        return [w for w in words if w]
+    words = []
+    for scale, name in ((1000000, 'million'), (1000, 'ming'), (1, '')):
+        count, n = divmod(n, scale)
+        if not count:
+            continue
+        if words and rng.random() < 0.2:
+            words.append('va')
+        spoken = group(count)
+        if name:
+            words += ([] if spoken == ['bir'] and name == 'ming' and rng.random() < 0.5 else spoken) + [name]
+        else:
+            words += spoken
+    return ' '.join(words)
+
+
+def sentence(n, rng):
+    text = ' '.join(rng.sample(FILLER, rng.randint(0, 3)) + [spell(n, rng)] + rng.sample(FILLER, rng.randint(0, 2)))
+    return text.replace('\'', rng.choice(['\'', '‘', '’', 'ʻ']))
+
+
+def check(rounds):
+    rng = random.Random(11)
+    wrong_before = 0
+    for _ in range(rounds):
+        n = rng.choice((rng.randint(1, 999), rng.randint(1, 99999), rng.randint(1, 10**9)))
+        text = sentence(n, rng)
+        assert uz_text.uzbek_text_to_number(text) == n, (text, n)
+        ascii_text = text.replace('‘', '\'').replace('’', '\'').replace('ʻ', '\'')
+        if n < 100000 and not any(w in text for w in ('javob', 'valyuta')):
+            assert old_text_to_number(ascii_text) == n, (text, n)
+        elif old_text_to_number(ascii_text) != n:
+            wrong_before += 1
+    for text, n in CYRILLIC.items():
+        assert uz_text.uzbek_text_to_number(text) == n, text
+    assert uz_text.uzbek_text_to_number('ID 1042 ga qarang') == 1042
+    assert uz_text.uzbek_text_to_number('javob bering') is None and uz_text.uzbek_text_to_number('nol') is None
+
+    alphabet = ''.join(k for k in uz_text.KRILL_TO_LATIN if k not in 'ўЎ') + 'abc xyz\'`’.,\n '
+    texts = [''.join(rng.choices(alphabet, k=rng.randint(0, 40))) for _ in range(rounds)]
+    for text in texts:
+        assert uz_text.krill_to_latin(text) == old_krill_to_latin(text)
+    for size in (0, 1, 2, 50):
+        batch = rng.sample(texts, size)
+        assert uz_text.normalize_batch(batch) == [uz_text.normalize(t) for t in batch]
+        batch += batch[:size // 2]
+        assert uz_text.normalize_batch(batch) == [uz_text.normalize(t) for t in batch]
+    print(f"checks: {rounds} spelled numbers up to 10^9 parse back ({wrong_before} of them misparsed before); "
+          f"transliteration and batch normalization match")
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Uzbek normalization and number parsing, per-call vs precompiled.')
+    parser.add_argument('--texts', type=int, default=100000)
+    args = parser.parse_args()
+    check(20000)
+
+    rng = random.Random(5)
+    numbers = [sentence(rng.randint(1, 99999), rng) for _ in range(args.texts)]
+    # Transcripts repeat in practice: draw them from a pool of distinct phrasings
+    pool = [f"{rng.choice(['Менинг ид рақамим', 'mening id raqamim', 'Кредит лимитим'])} {sentence(n, rng)}"
+            for n in range(1, 2001)]
+    transcripts = [rng.choice(pool) for _ in range(args.texts)]
+
+    print(f"{args.texts} texts, transcripts drawn from {len(pool)} distinct ones")
+    print(f"{'step':36} {'seconds':>8} {'texts/s':>12}")
+    rows = (('numbers, app copy (no Cyrillic)', lambda: timed(old_text_to_number, numbers)),
+            ('numbers, terminal copy', lambda: timed(lambda t: old_text_to_number(t, True), numbers)),
+            ('numbers, uz_text', lambda: timed(uz_text.uzbek_text_to_number, numbers)),
+            ('transliteration, per call', lambda: timed(lambda t: old_krill_to_latin(t.lower().strip()), transcripts)),
+            ('normalize, translate table', lambda: timed(uz_text.normalize, transcripts)),
+            ('normalize_batch', lambda: timed(uz_text.normalize_batch, [transcripts])))
+    for name, run in rows:
+        seconds = run()
+        print(f"{name:36} {seconds:>8.3f} {args.texts / seconds:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
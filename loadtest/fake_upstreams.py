@@ -0,0 +1,385 @@
+"""Local stand-ins for the upstream APIs the voice bot calls.
+
+Serves the Aisha STT and TTS endpoints (including the second-step audio
+download from the returned audio_path), the Gemini generateContent endpoint
+used for STT and the Together chat-completions endpoint on one port, and
+counts TCP connections and requests so client behaviour can be measured
+without spending real quota. Each route's latency is fixed or drawn from a
+distribution, faults can be injected per route (a share of requests answered
+503, a share that stall before answering, or a route that is down
+altogether), and the audio and reply sizes are set per run. GET /__stats returns request counts, errors and service-time
+percentiles per route; POST /__reset clears them.
+
+Point the app at it with:
+
+    python loadtest/fake_upstreams.py --port 8900
+    AISHA_BASE_URL=http://127.0.0.1:8900 TOGETHER_BASE_URL=http://127.0.0.1:8900/v1 \
+        GEMINI_BASE_URL=http://127.0.0.1:8900 python app.py
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+STT_PATH = '/api/v1/stt/post/'
+TTS_PATH = '/api/v1/tts/post/'
+CHAT_PATH = '/v1/chat/completions'
+GEMINI_PATH = re.compile(r'^/v1beta/models/[^/:]+:generateContent$')
+
+
+# A latency spec is seconds ("0.4") or a distribution: "uniform:LOW,HIGH",
+# "normal:MEAN,SD", "lognormal:MEDIAN,SIGMA" or "exp:MEAN". Returns a function
+# of a random.Random that draws one latency.
+def latency_sampler(spec):
+    if isinstance(spec, (int, float)):
+        return lambda rng: spec
+    name, _, params = str(spec).partition(':')
+    if not params:
+        seconds = float(name)
+        return lambda rng: seconds
+    values = [float(value) for value in params.split(',')]
+    if name == 'uniform':
+        return lambda rng: rng.uniform(*values)
+    if name == 'normal':
+        return lambda rng: max(0.0, rng.gauss(*values))
+    if name == 'lognormal':
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if name == 'exp':
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class UpstreamStats:
+    def __init__(self, window=100000):
+        self._lock = threading.Lock()
+        # Service times kept per route for the percentiles
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = {}
+            self.errors = {}
+            self.durations = {}
+
+    def connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def request(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    # A request finished after `seconds`, injected latency included; no status means the client hung up
+    def served(self, route, seconds, status):
+        with self._lock:
+            self.durations.setdefault(route, deque(maxlen=self.window)).append(seconds)
+            if status is None or status >= 500:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            durations = {route: sorted(values) for route, values in self.durations.items()}
+            result = {'connections': self.connections, 'requests': dict(self.requests),
+                      'total_requests': sum(self.requests.values()), 'errors': dict(self.errors)}
+        result['latency_ms'] = {route: {f"p{round(q * 100)}": round(values[min(len(values) - 1, int(q * len(values)))]
+                                                                   * 1000, 1)
+                                        for q in (0.5, 0.95, 0.99)}
+                                for route, values in durations.items() if values}
+        return result
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, keep-alive
+    # connections stall on Nagle plus delayed ACK
+    disable_nagle_algorithm = True
+
+    # One handler instance serves one TCP connection and all its keep-alive requests
+    def setup(self):
+        super().setup()
+        self.server.stats.connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _base_url(self):
+        return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+
+    def _unavailable(self):
+        self._send(503, {'error': 'Service temporarily unavailable'})
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    # Audio sent in 4 KB chunks, like a download that is still being produced
+    def _trickle_audio(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        audio = self.server.audio
+        for start in range(0, len(audio), 4096):
+            if start:
+                time.sleep(self.server.audio_chunk_interval)
+            self._write_chunk(audio[start:start + 4096])
+        self.wfile.write(b'0\r\n\r\n')
+
+    # OpenAI-style SSE stream, one word per chunk; the route latency is the time to first token
+    def _stream_chat(self, request):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        completion_id = str(uuid.uuid4())
+        for i, word in enumerate(re.findall(r'\S+\s*', self.server.next_reply())):
+            if i:
+                time.sleep(self.server.token_interval)
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': word}, 'finish_reason': None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    # Count the request, inject the route's faults and latency, then serve it
+    def _route(self, route, serve, *args):
+        started = time.monotonic()
+        self._status = None
+        self.server.stats.request(route)
+        try:
+            if self.server.fault(route):
+                return self._unavailable()
+            self.server.delay(route)
+            serve(*args)
+        finally:
+            self.server.stats.served(route, time.monotonic() - started, self._status)
+
+    def _audio(self):
+        if self.server.audio_chunk_interval:
+            return self._trickle_audio()
+        self._send(200, self.server.audio, 'audio/mpeg')
+
+    def _stt(self):
+        self._send(200, {'transcript': self.server.next_transcript()})
+
+    def _tts(self, body):
+        transcript = parse_qs(body.decode('utf-8')).get('transcript', [''])[0]
+        time.sleep(self.server.tts_char_latency * len(transcript))
+        self._send(201, {'audio_path': f"{self._base_url()}/audio/{uuid.uuid4()}.mp3"})
+
+    def _gemini(self):
+        self._send(200, {'candidates': [{'content': {'role': 'model',
+                                                     'parts': [{'text': self.server.next_transcript()}]}}]})
+
+    def _chat(self, body):
+        request = json.loads(body or b'{}')
+        if request.get('stream'):
+            return self._stream_chat(request)
+        reply = self.server.next_reply()
+        # A complete answer takes as long as streaming all of it
+        time.sleep(self.server.token_interval * (len(reply.split()) - 1))
+        self._send(200, {
+            'id': str(uuid.uuid4()),
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': reply}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        })
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            return self._send(200, self.server.stats.snapshot())
+        if self.path.startswith('/audio/'):
+            return self._route('tts_audio', self._audio)
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path == '/__reset':
+            self.server.stats.reset()
+            return self._send(200, {'ok': True})
+        if self.path == STT_PATH:
+            return self._route('stt', self._stt)
+        if self.path == TTS_PATH:
+            return self._route('tts', self._tts, body)
+        if GEMINI_PATH.match(self.path):
+            return self._route('gemini', self._gemini)
+        if self.path == CHAT_PATH:
+            return self._route('llm', self._chat, body)
+        self._send(404, {'error': 'not found'})
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=None, audio_bytes=16000,
+                 transcript='kredit olmoqchiman', reply="Ipak Yo'li banki sizga yordam beradi.",
+                 unique_replies=False, token_interval=0.0, tts_char_latency=0.0, audio_chunk_interval=0.0,
+                 error_rate=None, stall_rate=None, stall_seconds=5.0, seed=None, reply_words=0):
+        super().__init__(address, FakeUpstreamHandler)
+        self.stats = UpstreamStats()
+        # Latency spec per route (see latency_sampler): stt, gemini, tts, tts_audio, llm
+        self.latency = dict(latency or {})
+        self._samplers = {}
+        # Size of the synthesized audio download
+        self.audio = b'ID3\x04\x00\x00\x00\x00\x00\x00' + b'\xff\xfb\x90\x64' + b'\x00' * max(0, audio_bytes - 14)
+        # STT result: one transcript, or a list returned in turn
+        self.transcript = transcript
+        self._transcript_numbers = itertools.count()
+        # A reply of reply_words words when set, like a longer LLM answer
+        if reply_words:
+            words = reply.split()
+            reply = ' '.join(words[i % len(words)] for i in range(reply_words))
+        self.reply = reply
+        # Numbered replies never hit the app's TTS cache, like real LLM answers; the run
+        # token keeps them unique across restarts of the fake
+        self.unique_replies = unique_replies
+        self._reply_numbers = itertools.count(1)
+        self._run = uuid.uuid4().hex[:6]
+        # Seconds between streamed chat chunks
+        self.token_interval = token_interval
+        # Extra TTS seconds per character, synthesis time grows with the text
+        self.tts_char_latency = tts_char_latency
+        # Seconds between 4 KB chunks of the audio download; 0 sends it in one piece
+        self.audio_chunk_interval = audio_chunk_interval
+        # Share of requests per route answered 503, and share that stall stall_seconds first
+        self.error_rate = dict(error_rate or {})
+        self.stall_rate = dict(stall_rate or {})
+        self.stall_seconds = stall_seconds
+        # Routes answering 503 to everything; change it while running to take a route down
+        self.down = set()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    # Clients that gave up on a stalled request have closed their end
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def next_transcript(self):
+        if isinstance(self.transcript, str):
+            return self.transcript
+        return self.transcript[next(self._transcript_numbers) % len(self.transcript)]
+
+    def next_reply(self):
+        if self.unique_replies:
+            return f"{self.reply} ({self._run}-{next(self._reply_numbers)})"
+        return self.reply
+
+    # True when the request should be answered 503; may stall first
+    def fault(self, route):
+        with self._random_lock:
+            error, stall = self._random.random(), self._random.random()
+        if route in self.down or error < self.error_rate.get(route, 0):
+            return True
+        if stall < self.stall_rate.get(route, 0):
+            time.sleep(self.stall_seconds)
+        return False
+
+    def delay(self, route):
+        spec = self.latency.get(route, 0)
+        if not spec:
+            return
+        sampler = self._samplers.get(spec)
+        if sampler is None:
+            sampler = self._samplers[spec] = latency_sampler(spec)
+        with self._random_lock:
+            seconds = sampler(self._random)
+        time.sleep(seconds)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+# Start a server on a background thread; port 0 picks a free port
+def start_server(host='127.0.0.1', port=0, **options):
+    server = FakeUpstreamServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-upstreams', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve fake Aisha STT/TTS and Together APIs.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    for route in ('stt', 'gemini', 'tts', 'tts_audio', 'llm'):
+        parser.add_argument(f"--{route.replace('_', '-')}-latency", default='0',
+                            help=f'latency of {route}: seconds, or uniform:LOW,HIGH, normal:MEAN,SD, '
+                                 f'lognormal:MEDIAN,SIGMA, exp:MEAN')
+        parser.add_argument(f"--{route.replace('_', '-')}-error-rate", type=float, default=0.0,
+                            help=f'share of {route} requests answered 503')
+        parser.add_argument(f"--{route.replace('_', '-')}-stall-rate", type=float, default=0.0,
+                            help=f'share of {route} requests that stall for --stall-seconds')
+    parser.add_argument('--stall-seconds', type=float, default=5.0)
+    parser.add_argument('--token-interval', type=float, default=0.0, help='seconds between streamed chat chunks')
+    parser.add_argument('--tts-char-latency', type=float, default=0.0, help='extra TTS seconds per character')
+    parser.add_argument('--audio-chunk-interval', type=float, default=0.0,
+                        help='seconds between 4 KB chunks of the audio download')
+    parser.add_argument('--transcript', default='kredit olmoqchiman', help='what STT returns for every upload')
+    parser.add_argument('--transcripts', help='file of transcripts, one per line, returned in turn')
+    parser.add_argument('--unique-replies', action='store_true', help='number every chat reply')
+    parser.add_argument('--reply-words', type=int, default=0, help='words per chat reply')
+    parser.add_argument('--audio-bytes', type=int, default=16000, help='size of the synthesized audio')
+    parser.add_argument('--seed', type=int, help='seed for latencies and faults')
+    args = parser.parse_args()
+    routes = ('stt', 'gemini', 'tts', 'tts_audio', 'llm')
+    latency = {route: getattr(args, f'{route}_latency') for route in routes}
+    for spec in latency.values():
+        latency_sampler(spec)
+    transcript = args.transcript
+    if args.transcripts:
+        with open(args.transcripts, encoding='utf-8') as f:
+            transcript = [line.strip() for line in f if line.strip()]
+    server = FakeUpstreamServer((args.host, args.port), latency=latency, transcript=transcript,
+                                unique_replies=args.unique_replies, token_interval=args.token_interval,
+                                tts_char_latency=args.tts_char_latency,
+                                audio_chunk_interval=args.audio_chunk_interval,
+                                error_rate={route: getattr(args, f'{route}_error_rate') for route in routes},
+                                stall_rate={route: getattr(args, f'{route}_stall_rate') for route in routes},
+                                stall_seconds=args.stall_seconds, seed=args.seed, reply_words=args.reply_words,
+                                audio_bytes=args.audio_bytes)
+    print(f"Fake upstreams on {server.url}")
+    print(f"  AISHA_BASE_URL={server.url} TOGETHER_BASE_URL={server.url}/v1 GEMINI_BASE_URL={server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
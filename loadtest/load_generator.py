@@ -0,0 +1,336 @@
+"""End-to-end load test of the voice bot.
+
+Replays a corpus of recorded uploads and typed questions against
+/process_audio and /process_text at a target request rate. Arrivals are open
+loop: a slow server builds a queue instead of slowing the load down. Reports
+throughput and p50/p95/p99 latency per stage:
+
+- each endpoint end to end, as the client sees it
+- each upstream call, as the fake upstreams served it (GET /__stats)
+- the server's own stages, when it sends a Server-Timing header
+
+Results are written as JSON so runs can be compared.
+
+By default it starts the fake upstreams and the server itself:
+
+    python loadtest/load_generator.py --server async --rps 20 --duration 30 --out results/async.json
+    python loadtest/load_generator.py --server sync --rps 20 --duration 30 --out results/sync.json \\
+        --fake-args="--llm-latency lognormal:0.8,0.5 --llm-error-rate 0.02" --env ANSWER_CACHE_SIZE=0
+    python loadtest/load_generator.py --compare results/sync.json results/async.json
+
+or drives a server that is already running, and the fakes behind it if any:
+
+    python loadtest/load_generator.py --url http://127.0.0.1:5000 --upstreams-url http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import json
+import os
+import random
+import shlex
+import sys
+import tempfile
+
+import aiohttp
+
+import serving_capacity
+from serving_capacity import free_port, start_process, wait_until_up
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+# Sample recordings replayed by default; kept out of app/uploads, where the janitor prunes audio
+AUDIO_DIR = os.path.join(LOADTEST_DIR, 'audio')
+
+# Typed questions and, through the fake STT, the transcripts of the uploads
+TEXTS = [
+    "Bank soat nechida ishlaydi?",
+    "Shanba kuni bank ishlaydimi?",
+    "Toshkentda nechta filial bor?",
+    "Eng yaqin bankomat qayerda?",
+    "Qanday karta turlari bor?",
+    "Visa karta qanday ochiladi?",
+    "Omonat foizi qancha?",
+    "Mobil ilovani qayerdan yuklab olaman?",
+    "Xalqaro pul o'tkazmasi qanday qilinadi?",
+    "Kredit olmoqchiman",
+    "Salom",
+    "Rahmat",
+]
+# Default upstream latencies: typical times of the real services, with a long tail
+FAKE_LATENCY = {'stt': 'lognormal:0.4,0.3', 'tts': 'lognormal:0.3,0.3', 'tts_audio': 'lognormal:0.05,0.3',
+                'llm': 'lognormal:0.8,0.4'}
+AUDIO_TYPES = {'.mp3': 'audio/mpeg', '.ogg': 'audio/ogg', '.wav': 'audio/wav'}
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(seconds):
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    return {'count': len(values), 'p50_ms': round(percentile(values, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 1), 'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            'mean_ms': round(sum(values) / len(values) * 1000, 1)}
+
+
+# Server-Timing: "stt;dur=412.3, llm;dur=803.0" -> {'stt': 0.4123, 'llm': 0.803}
+def parse_server_timing(headers):
+    timings = {}
+    for header in headers:
+        for metric in header.split(','):
+            name, *params = [part.strip() for part in metric.split(';')]
+            for param in params:
+                key, _, value = param.partition('=')
+                if name and key == 'dur':
+                    timings[name] = timings.get(name, 0.0) + float(value) / 1000
+    return timings
+
+
+class Corpus:
+    def __init__(self, texts, recordings, audio_share):
+        self.texts = texts
+        # (filename, content type, bytes)
+        self.recordings = recordings
+        self.audio_share = audio_share if recordings else 0.0
+
+    @classmethod
+    def load(cls, texts_path, audio_glob, audio_share):
+        texts = TEXTS
+        if texts_path:
+            with open(texts_path, encoding='utf-8') as f:
+                texts = [line.strip() for line in f if line.strip()]
+        recordings = []
+        for path in sorted(glob.glob(audio_glob)):
+            with open(path, 'rb') as f:
+                recordings.append((os.path.basename(path),
+                                   AUDIO_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream'), f.read()))
+        return cls(texts, recordings, audio_share)
+
+    def pick(self, rng):
+        if rng.random() < self.audio_share:
+            return 'process_audio', rng.choice(self.recordings)
+        return 'process_text', rng.choice(self.texts)
+
+
+async def one_request(http, base_url, endpoint, item):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = {'endpoint': endpoint, 'ok': False}
+    try:
+        if endpoint == 'process_audio':
+            filename, content_type, audio = item
+            form = aiohttp.FormData()
+            form.add_field('audio', audio, filename=filename, content_type=content_type)
+            request = http.post(f"{base_url}/process_audio", data=form)
+        else:
+            request = http.post(f"{base_url}/process_text", json={'text': item})
+        async with request as response:
+            body = await response.read()
+            result['status'] = response.status
+            result['server_timing'] = parse_server_timing(response.headers.getall('Server-Timing', []))
+        reply = json.loads(body) if response.status == 200 else {}
+        result['ok'] = bool(reply.get('audio_url')) and not reply.get('error')
+        if not result['ok']:
+            result['error'] = f"http {response.status}" if response.status != 200 else 'no audio'
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        result['error'] = type(e).__name__
+    result['seconds'] = loop.time() - started
+    return result
+
+
+async def fake_stats(upstreams_url, reset=False):
+    if not upstreams_url:
+        return None
+    async with aiohttp.ClientSession() as http:
+        if reset:
+            async with http.post(f"{upstreams_url}/__reset") as response:
+                return await response.json()
+        async with http.get(f"{upstreams_url}/__stats") as response:
+            return await response.json()
+
+
+# Send requests at `rps` for warmup + duration seconds; only those sent after the warmup count
+async def run_load(args, corpus, base_url, upstreams_url):
+    rng = random.Random(args.seed)
+    loop = asyncio.get_running_loop()
+    results, tasks = [], set()
+    dropped = 0
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # No cookies: every turn is its own session, so no chat history piles up
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout,
+                                     cookie_jar=aiohttp.DummyCookieJar()) as http:
+        started = loop.time()
+        measure_from = started + args.warmup
+        stop_at = measure_from + args.duration
+        next_at = started
+        measuring = False
+        while next_at < stop_at:
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            if not measuring and next_at >= measure_from:
+                measuring = True
+                await fake_stats(upstreams_url, reset=True)
+            if len(tasks) >= args.max_inflight:
+                if measuring:
+                    dropped += 1
+            else:
+                endpoint, item = corpus.pick(rng)
+                task = asyncio.ensure_future(one_request(http, base_url, endpoint, item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if measuring:
+                    task.add_done_callback(lambda t: results.append(t.result()))
+            next_at += rng.expovariate(args.rps) if args.arrivals == 'poisson' else 1 / args.rps
+        if tasks:
+            await asyncio.wait(tasks)
+        elapsed = loop.time() - measure_from
+    return results, dropped, elapsed
+
+
+def report(args, results, dropped, elapsed, upstreams):
+    ok = [r for r in results if r['ok']]
+    errors = {}
+    for r in results:
+        if not r['ok']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    stages = {}
+    for endpoint in ('process_text', 'process_audio'):
+        seconds = [r['seconds'] for r in ok if r['endpoint'] == endpoint]
+        if seconds:
+            stages[endpoint] = summarize(seconds)
+    server_stages = sorted({name for r in ok for name in r.get('server_timing', {})})
+    for name in server_stages:
+        stages[f"server.{name}"] = summarize([r['server_timing'][name] for r in ok if name in r['server_timing']])
+    if upstreams:
+        for route, latency in sorted(upstreams.get('latency_ms', {}).items()):
+            stages[f"upstream.{route}"] = {'count': upstreams['requests'].get(route, 0),
+                                           **{f"{q}_ms": value for q, value in latency.items()},
+                                           'errors': upstreams.get('errors', {}).get(route, 0)}
+    return {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'out')},
+        'target_rps': args.rps,
+        'sent': len(results) + dropped,
+        'completed': len(results),
+        'ok': len(ok),
+        'dropped': dropped,
+        'errors': errors,
+        'error_rate': round(1 - len(ok) / len(results), 4) if results else None,
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed > 0 else None,
+        'stages': stages,
+    }
+
+
+def print_summary(summary):
+    print(f"target {summary['target_rps']} req/s, {summary['sent']} sent, {summary['ok']} ok, "
+          f"{summary['completed'] - summary['ok']} failed, {summary['dropped']} dropped; "
+          f"throughput {summary['throughput_rps']} req/s")
+    if summary['errors']:
+        print(f"errors: {summary['errors']}")
+    print(f"{'stage':24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, values in summary['stages'].items():
+        if values.get('count'):
+            print(f"{stage:24} {values['count']:>7} {values.get('p50_ms', 0):>9.1f} {values.get('p95_ms', 0):>9.1f} "
+                  f"{values.get('p99_ms', 0):>9.1f}")
+
+
+# Per-stage latency and throughput of run B against run A
+def compare(path_a, path_b):
+    with open(path_a, encoding='utf-8') as f:
+        a = json.load(f)
+    with open(path_b, encoding='utf-8') as f:
+        b = json.load(f)
+
+    def change(old, new):
+        if old is None or new is None:
+            return ''
+        return f"{(new - old) / old:+.0%}" if old else ''
+
+    print(f"A: {path_a} ({a['started_at']})\nB: {path_b} ({b['started_at']})")
+    print(f"{'':24} {'A':>10} {'B':>10} {'change':>8}")
+    for key in ('throughput_rps', 'error_rate'):
+        print(f"{key:24} {a[key]!s:>10} {b[key]!s:>10} {change(a[key], b[key]):>8}")
+    for stage in list(dict.fromkeys(list(a['stages']) + list(b['stages']))):
+        for q in ('p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = a['stages'].get(stage, {}).get(q), b['stages'].get(stage, {}).get(q)
+            print(f"{stage + ' ' + q[:3]:24} {old!s:>10} {new!s:>10} {change(old, new):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a corpus at a target rate, latency per stage.')
+    parser.add_argument('--server', choices=('sync', 'async'), default='async',
+                        help='server to start against fresh fake upstreams (ignored with --url)')
+    parser.add_argument('--url', help='base URL of a server that is already running')
+    parser.add_argument('--upstreams-url', help='fake upstreams behind --url, for per-upstream stages')
+    parser.add_argument('--threads', type=int, default=16, help='request threads of the sync server')
+    parser.add_argument('--fake-args', default='', help='extra fake_upstreams.py arguments, e.g. latencies')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='environment of the started server, e.g. ANSWER_CACHE_SIZE=0')
+    parser.add_argument('--rps', type=float, default=10.0)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds sent before measuring')
+    parser.add_argument('--arrivals', choices=('poisson', 'constant'), default='poisson')
+    parser.add_argument('--max-inflight', type=int, default=1000, help='requests open at once before dropping')
+    parser.add_argument('--timeout', type=float, default=60.0, help='client timeout per request')
+    parser.add_argument('--audio-share', type=float, default=0.5, help='share of requests that upload audio')
+    parser.add_argument('--audio-glob', default=os.path.join(AUDIO_DIR, 'recording_*.*'))
+    parser.add_argument('--texts', help='file of questions, one per line')
+    parser.add_argument('--seed', type=int, default=23)
+    parser.add_argument('--out', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('A', 'B'), help='compare two results files and exit')
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare)
+
+    corpus = Corpus.load(args.texts, args.audio_glob, args.audio_share)
+    print(f"corpus: {len(corpus.texts)} texts, {len(corpus.recordings)} recordings, "
+          f"{corpus.audio_share:.0%} audio")
+    processes = []
+    transcripts = None
+    try:
+        base_url, upstreams_url = args.url, args.upstreams_url
+        if not base_url:
+            upstream_port, port = free_port(), free_port()
+            upstreams_url = f"http://127.0.0.1:{upstream_port}"
+            transcripts = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8')
+            transcripts.write('\n'.join(corpus.texts))
+            transcripts.close()
+            fake_args = [os.path.join(LOADTEST_DIR, 'fake_upstreams.py'), '--port', str(upstream_port),
+                         '--unique-replies', '--transcripts', transcripts.name, '--seed', str(args.seed)]
+            for route, spec in FAKE_LATENCY.items():
+                fake_args += [f"--{route.replace('_', '-')}-latency", spec]
+            env = dict(os.environ, AISHA_BASE_URL=upstreams_url, TOGETHER_BASE_URL=f"{upstreams_url}/v1",
+                       STT_API_KEY='load', TTS_API_KEY='load', TOGETHER_API_KEY='load', TTS_WARMUP='0',
+                       UPLOADS_JANITOR='0')
+            env.pop('GEMINI_API_KEY', None)
+            processes.append(start_process(fake_args + shlex.split(args.fake_args), env))
+            env.update(setting.split('=', 1) for setting in args.env)
+            if args.server == 'sync':
+                server_args = [os.path.abspath(serving_capacity.__file__), '--serve-sync', str(port),
+                               '--threads', str(args.threads)]
+            else:
+                server_args = ['async_app.py', '--host', '127.0.0.1', '--port', str(port)]
+            processes.append(start_process(server_args, env))
+            base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(wait_until_up(f"{base_url}/tts/stats"))
+        results, dropped, elapsed = asyncio.run(run_load(args, corpus, base_url, upstreams_url))
+        upstreams = asyncio.run(fake_stats(upstreams_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        if transcripts:
+            os.remove(transcripts.name)
+
+    summary = report(args, results, dropped, elapsed, upstreams)
+    print_summary(summary)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"results written to {args.out}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
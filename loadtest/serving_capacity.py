@@ -0,0 +1,202 @@
+"""Concurrent-session capacity of one server process: threaded Flask (app.py)
+versus asyncio (async_app.py), both against the fake upstreams with injected
+latency.
+
+Every virtual session sends /process_text (or /process_audio) requests back to
+back. The concurrency is stepped up, and each server's capacity is the highest
+level whose p95 latency stays within --slo times the unloaded latency, with
+no errors. The sync server runs with a fixed worker thread pool, like a
+gunicorn gthread worker.
+
+    python loadtest/serving_capacity.py --threads 16 --levels 8,16,32,64,128,256
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(LOADTEST_DIR, '..', 'app')
+
+ROUTES = ('stt', 'tts', 'tts_audio', 'llm')
+# Not a credit query, so every turn goes through the LLM
+QUESTION = "Bank qaysi kunlari ishlaydi?"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Sync app in this process, one fixed pool of request threads (run with cwd=app/)
+def serve_sync(port, threads):
+    from werkzeug.serving import BaseWSGIServer
+
+    sys.path.insert(0, APP_DIR)
+    import app as sync_app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 1024
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle_pooled, request, client_address)
+
+        def handle_pooled(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer('127.0.0.1', port, sync_app.app).serve_forever()
+
+
+def start_process(args, env, cwd=APP_DIR):
+    return subprocess.Popen([sys.executable] + args, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def one_request(http, base_url, endpoint, audio):
+    if endpoint == 'audio':
+        form = aiohttp.FormData()
+        form.add_field('audio', audio, filename='recording.mp3', content_type='audio/mpeg')
+        request = http.post(f"{base_url}/process_audio", data=form)
+    else:
+        request = http.post(f"{base_url}/process_text", json={'text': QUESTION})
+    async with request as response:
+        body = await response.json()
+        return response.status == 200 and bool(body.get('audio_url'))
+
+
+# Run `sessions` clients back to back for `duration` seconds
+async def run_level(base_url, endpoint, sessions, duration, audio):
+    latencies = []
+    errors = 0
+    stop_at = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async def session_loop(http):
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            start = time.monotonic()
+            try:
+                ok = await one_request(http, base_url, endpoint, audio)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                ok = False
+            if ok:
+                latencies.append(time.monotonic() - start)
+            else:
+                errors += 1
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        started = time.monotonic()
+        await asyncio.gather(*(session_loop(http) for _ in range(sessions)))
+        elapsed = time.monotonic() - started
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float('nan')
+
+    return {'sessions': sessions, 'requests': len(latencies), 'errors': errors,
+            'rps': len(latencies) / elapsed, 'p50': pct(0.50), 'p95': pct(0.95)}
+
+
+async def measure_server(name, base_url, args, audio, baseline):
+    await wait_until_up(f"{base_url}/tts/stats")
+    print(f"\n{name}")
+    print(f"{'sessions':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 s':>7} {'p95 s':>7}")
+    capacity = 0
+    for sessions in args.levels:
+        result = await run_level(base_url, args.endpoint, sessions, args.duration, audio)
+        print(f"{result['sessions']:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>8.1f} "
+              f"{result['p50']:>7.2f} {result['p95']:>7.2f}")
+        if result['errors'] or not result['p95'] <= args.slo * baseline:
+            break
+        capacity = sessions
+    return capacity
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent-session capacity, sync vs async server.')
+    parser.add_argument('--endpoint', choices=('text', 'audio'), default='text')
+    parser.add_argument('--threads', type=int, default=16, help='request threads of the sync server')
+    parser.add_argument('--levels', type=lambda s: [int(x) for x in s.split(',')],
+                        default=[8, 16, 32, 64, 128, 256])
+    parser.add_argument('--duration', type=float, default=8.0, help='seconds per concurrency level')
+    parser.add_argument('--slo', type=float, default=1.5, help='allowed p95 as a multiple of unloaded latency')
+    for route, default in zip(ROUTES, (0.4, 0.3, 0.05, 0.8)):
+        parser.add_argument(f"--{route.replace('_', '-')}-latency", type=float, default=default)
+    parser.add_argument('--serve-sync', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_sync:
+        return serve_sync(args.serve_sync, args.threads)
+
+    latency = {route: getattr(args, f'{route}_latency') for route in ROUTES}
+    baseline = latency['llm'] + latency['tts'] + latency['tts_audio']
+    if args.endpoint == 'audio':
+        baseline += latency['stt']
+    upstream_port = free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    env = dict(os.environ, AISHA_BASE_URL=upstream_url, TOGETHER_BASE_URL=f"{upstream_url}/v1",
+               STT_API_KEY='load', TTS_API_KEY='load', TOGETHER_API_KEY='load', TTS_WARMUP='0',
+               UPLOADS_JANITOR='0')
+    audio = b'\xff\xfb\x90\x64' + b'\x00' * 8000
+
+    fake_args = [os.path.join(LOADTEST_DIR, 'fake_upstreams.py'), '--port', str(upstream_port),
+                 '--transcript', QUESTION, '--unique-replies']
+    for route in ROUTES:
+        fake_args += [f"--{route.replace('_', '-')}-latency", str(latency[route])]
+    processes = [start_process(fake_args, env)]
+    capacities = {}
+    try:
+        sync_port, async_port = free_port(), free_port()
+        servers = [
+            (f"sync Flask, {args.threads} threads", sync_port,
+             [os.path.abspath(__file__), '--serve-sync', str(sync_port), '--threads', str(args.threads)]),
+            ('async aiohttp', async_port, ['async_app.py', '--host', '127.0.0.1', '--port', str(async_port)]),
+        ]
+        print(f"Upstream latency {latency}, unloaded {args.endpoint} turn ~{baseline:.2f} s, "
+              f"capacity = p95 <= {args.slo:g}x with no errors")
+        for name, port, server_args in servers:
+            server = start_process(server_args, env)
+            processes.append(server)
+            capacities[name] = asyncio.run(measure_server(name, f"http://127.0.0.1:{port}", args, audio, baseline))
+            server.terminate()
+            server.wait()
+    finally:
+        for process in processes:
+            process.terminate()
+    print('\nConcurrent sessions per process:')
+    for name, capacity in capacities.items():
+        print(f"  {name:24} {capacity}")
+
+
+if __name__ == '__main__':
+    main()
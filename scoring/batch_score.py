@@ -0,0 +1,180 @@
+"""Score a customer file of any size in chunks with the saved model.
+
+Reads CSV, Parquet or columnar (.cols) input chunk by chunk, scores the
+chunks in a process pool and appends the predictions to a CSV or Parquet
+output as they finish, so memory use depends on the chunk size and not on
+the input size.
+
+Usage:
+    python batch_score.py test_data2.csv predictions.parquet --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Define features
+features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
+
+_model = None
+
+
+def _load_model(model_path):
+    global _model
+    _model = joblib.load(model_path)
+
+
+def score_chunk(chunk):
+    """
+    Predict credit limits for one chunk of customers.
+
+    Parameters:
+    chunk (DataFrame): rows with the feature columns and an optional ID column
+
+    Returns:
+    DataFrame: ID (when present) and Predicted_Limit columns
+    """
+    result = pd.DataFrame(index=chunk.index)
+    if 'ID' in chunk.columns:
+        result['ID'] = chunk['ID']
+    result['Predicted_Limit'] = _model.predict(chunk[features])
+    return result
+
+
+def iter_chunks(path, chunk_size):
+    """Yield DataFrame chunks from a CSV, Parquet or columnar (.cols) file."""
+    if path.endswith('.cols'):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+        from feature_store import FeatureStore
+        store = FeatureStore(path)
+        columns = [name for name in features + ['ID'] if name in store]
+        for start in range(0, len(store), chunk_size):
+            yield store.to_frame(start, start + chunk_size, columns)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        columns = [name for name in features + ['ID'] if name in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Append scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its workers, in MB."""
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        return own / 2**20, children / 2**20
+    if psutil is not None:
+        process = psutil.Process()
+        own = getattr(process.memory_info(), 'peak_wset', process.memory_info().rss)
+        children = max((getattr(child.memory_info(), 'peak_wset', child.memory_info().rss)
+                        for child in process.children()), default=0)
+        return own / 2**20, children / 2**20
+    return float('nan'), float('nan')
+
+
+def run(input_path, output_path, model_path, chunk_size=100_000, workers=None, report_every=10):
+    """Score input_path into output_path and return (rows, seconds)."""
+    workers = os.cpu_count() if workers is None else workers
+    writer = ChunkWriter(output_path)
+    rows = 0
+    chunks_done = 0
+    peak_children = 0.0
+    start = time.perf_counter()
+
+    def finish(result):
+        nonlocal rows, chunks_done, peak_children
+        writer.write(result)
+        rows += len(result)
+        chunks_done += 1
+        if psutil is not None and resource is None:
+            peak_children = max(peak_children, peak_rss_mb()[1])
+        if report_every and chunks_done % report_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{rows} rows, {rows / elapsed:,.0f} rows/sec", file=sys.stderr)
+
+    try:
+        if workers <= 0:
+            _load_model(model_path)
+            for chunk in iter_chunks(input_path, chunk_size):
+                finish(score_chunk(chunk))
+        else:
+            # At most two chunks per worker are in flight, so memory stays flat
+            with ProcessPoolExecutor(max_workers=workers, initializer=_load_model, initargs=(model_path,)) as pool:
+                pending = deque()
+                for chunk in iter_chunks(input_path, chunk_size):
+                    pending.append(pool.submit(score_chunk, chunk))
+                    while len(pending) >= 2 * workers:
+                        finish(pending.popleft().result())
+                while pending:
+                    finish(pending.popleft().result())
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - start
+    own_mb, children_mb = peak_rss_mb()
+    children_mb = max(children_mb, peak_children)
+    print(f"Scored {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)")
+    print(f"Peak RSS: main {own_mb:.1f} MB, largest worker {children_mb:.1f} MB")
+    return rows, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a CSV/Parquet customer file in chunks.')
+    parser.add_argument('input', help='CSV, .parquet or .cols file with the feature columns')
+    parser.add_argument('output', help='CSV or .parquet file to write predictions to')
+    parser.add_argument('--model', default='linear_regression_model.pkl')
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: CPU count, 0 scores in-process)')
+    args = parser.parse_args()
+    run(args.input, args.output, args.model, args.chunk_size, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,13 +29,14 @@ model = joblib.load('linear_regression_model.pkl')
 test_data = pd.read_csv('test_data2.csv')
 features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
 
+# Predict every customer's limit in one call; reversed so the first row wins for duplicated IDs
+predicted_limits = dict(zip(test_data['ID'].tolist()[::-1], model.predict(test_data[features])[::-1]))
+
 # Function to predict credit limit for a given ID
 def predict_limit_by_id(input_id):
-    if input_id not in test_data['ID'].values:
+    if input_id not in predicted_limits:
         return f"ID {input_id} topilmadi."
-    input_data = test_data[test_data['ID'] == input_id][features]
-    predicted_limit = model.predict(input_data)[0]
-    return predicted_limit
+    return predicted_limits[input_id]
 
 # Function to detect query type
 def is_credit_query(message):
@@ -51,16 +52,19 @@ def generate_response(prompt, chat_history):
     )
     return response.choices[0].message.content
 
+# Uzbek number words; built once rather than on every call
+number_map = {
+    'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
+    'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
+    'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
+    'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
+    'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
+}
+
 # Function to parse Uzbek number words or digits from a sentence
 def uzbek_text_to_number(text):
-    number_map = {
-        'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
-        'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
-        'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
-        'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
-        'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
-    }
-    text = text.lower().replace('va', '').strip()
+    # Drop "va" only as a word, not inside words like "javob"
+    text = re.sub(r'\bva\b', ' ', text.lower()).strip()
     numeric_match = re.search(r'\b\d+\b', text)
     if numeric_match:
         try:
@@ -1,10 +1,5 @@
-import pandas as pd
-import joblib
-import requests
-import re
 import os
-import google.generativeai as genai
-import base64
+import sys
 import tempfile
 import sounddevice as sd
 from scipy.io.wavfile import write
@@ -12,7 +7,24 @@ from dotenv import load_dotenv
 import pygame
 import time
 from io import BytesIO
-from together import Together
+
+# Shared helpers live next to the Flask app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+import http_client
+import intents
+import resilience
+from customer_index import CustomerIndex
+from customer_store import CustomerStore
+from knowledge_index import knowledge_index_from_env
+from stt_providers import stt_router_from_env
+from tts_cache import TTSCache, make_key
+from utterances import (BOT_DEVELOPER, BOT_INFO, BOT_NAME, CREDIT_REASON, EMPTY_INPUT, GREETING_REPLY,
+                        ID_NOT_FOUND, LLM_UNAVAILABLE, TERMINAL_ASK_ID, TERMINAL_ASK_VALID_ID,
+                        TERMINAL_CREDIT_LIMIT, TERMINAL_ID_NOT_FOUND, THANKS_REPLY, assemble_speech,
+                        speech_segments, static_texts)
+from tts_pipeline import TTSPipeline
+from uz_text import clean_transcription, normalize, uzbek_text_to_number
+from warmup import Warmup
 
 # Load environment variables
 load_dotenv()
@@ -20,142 +32,51 @@ gemini_api_key = os.getenv('GEMINI_API_KEY')
 tts_api_key = os.getenv('TTS_API_KEY')
 together_api_key = os.getenv('TOGETHER_API_KEY')
 
-# Initialize Together client
-client = Together(api_key=together_api_key)
+# Initialize Together client on the shared connection pool
+client = http_client.together_client(together_api_key)
+
+# Gemini transcribes alone; with STT_API_KEY set, Aisha leads and Gemini races it, as in
+# the app (STT_PROVIDERS sets the starting order, measured latency reorders them)
+stt_router = stt_router_from_env(os.getenv('STT_API_KEY'), gemini_api_key)
 
 # Initialize pygame for audio playback
 pygame.mixer.init()
 
-# Load bank information from text file
-def load_bank_info(file_path='uploads/general_info.txt'):
-    if not os.path.exists(file_path):
-        return "Bank haqida ma'lumot fayli topilmadi."
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+# Bank knowledge; a prompt gets the passages relevant to the question, not the whole file
+knowledge = knowledge_index_from_env('uploads/general_info.txt')
 
-bank_info = load_bank_info()
-
-# Load the saved model and test data
-model = joblib.load('uploads/linear_regression_model.pkl')
-test_data = pd.read_csv('uploads/test_data2.csv')
+# Load the saved model and test data; limits for every ID are precomputed once,
+# rows upserted into the customer store override the CSV
 features = ['Income', 'Rating', 'Cards', 'Age', 'Education', 'Gender', 'Student', 'Married', 'Ethnicity', 'Balance']
+customer_store = CustomerStore('uploads/customers.db', features)
+customer_index = CustomerIndex('uploads/linear_regression_model.pkl', 'uploads/test_data2.csv', features, store=customer_store)
 
 # Function to predict credit limit for a given ID
 def predict_limit_by_id(input_id):
-    if input_id not in test_data['ID'].values:
-        return f"ID {input_id} topilmadi."
-    input_data = test_data[test_data['ID'] == input_id][features]
-    predicted_limit = model.predict(input_data)[0]
+    predicted_limit = customer_index.lookup(input_id)
+    if predicted_limit is None:
+        return ID_NOT_FOUND.format(customer_id=input_id)
     return predicted_limit
 
-# Function to detect query type
-def is_credit_query(message):
-    credit_keywords = ['kredit', 'qarz', 'limit', 'pul olish', 'kredit olish', 'kredit limiti']
-    return any(keyword.lower() in message.lower() for keyword in credit_keywords)
-
-# Function to detect greetings
-def is_greeting(message):
-    greeting_keywords = ['salom', 'assalom', 'assalomu alaykum', 'assalomu aleykum']
-    return any(keyword.lower() in message.lower() for keyword in greeting_keywords)
-
-# Function to detect thanks
-def is_thanks(message):
-    thanks_keywords = ['rahmat', 'tashakkur']
-    return any(keyword.lower() in message.lower() for keyword in thanks_keywords)
-
-# Function to detect queries about credit amount reason
-def is_credit_reason_query(message):
-    reason_keywords = ['nima uchun', 'negadir', 'nima sababdan', 'qanday qilib', 'why', 'how']
-    return any(keyword.lower() in message.lower() for keyword in reason_keywords) and 'kredit' in message.lower()
-
-# Function to detect queries about bot's name or developer
-def is_bot_info_query(message):
-    bot_keywords = ['isming', 'kim', 'nomi', 'quruvchi', 'ishlab chiqaruvchi', 'developer']
-    return any(keyword.lower() in message.lower() for keyword in bot_keywords)
-
 # Function to generate response using Together API
 def generate_response(prompt, chat_history):
     messages = chat_history + [{"role": "user", "content": f"Answer concisely (max 50 words) in Uzbek, using natural and polite language: {prompt}"}]
-    try:
-        response = client.chat.completions.create(
+
+    def attempt(seconds):
+        response = http_client.chat_completion(
+            client, seconds,
             model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
             messages=messages,
             temperature=0.7,
             max_tokens=50
         )
         return response.choices[0].message.content.strip()
+
+    try:
+        return resilience.llm.call(attempt)
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "Uzr, hozirda javob bera olmayman."
-
-# Function to transliterate Krill to Latin Uzbek
-def krill_to_latin(text):
-    krill_to_latin_map = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-        'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'ъ': '', 'ы': 'i',
-        'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'қ': 'q', 'ғ': 'g\'', 'ҳ': 'h',
-        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
-        'Ж': 'J', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
-        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
-        'Ф': 'F', 'Х': 'X', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Ъ': '', 'Ы': 'I',
-        'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya', 'Қ': 'Q', 'Ғ': 'G\'', 'Ҳ': 'H'
-    }
-    return ''.join(krill_to_latin_map.get(char, char) for char in text)
-
-# Function to clean transcription output
-def clean_transcription(text):
-    text = krill_to_latin(text.lower().strip())
-    if any(keyword in text for keyword in ['appears', 'unclear', 'similar to', 'transcription in']):
-        return None
-    match = re.search(r'(mening id raqamim\s+)?([\w\s\'’]+)', text)
-    if match:
-        return match.group(2).strip()
-    return text if text else None
-
-# Function to parse Uzbek number words or digits from a sentence
-def uzbek_text_to_number(text):
-    number_map = {
-        'nol': 0, 'bir': 1, 'ikki': 2, 'uch': 3, 'to\'rt': 4, 'besh': 5,
-        'olti': 6, 'yetti': 7, 'sakkiz': 8, 'to\'qqiz': 9,
-        'o\'n': 10, 'yigirma': 20, 'o\'ttiz': 30, 'qirq': 40, 'ellik': 50,
-        'oltmish': 60, 'yetmish': 70, 'sakson': 80, 'to\'qson': 90,
-        'yuz': 100, 'yuzi': 100, 'ming': 1000, 'million': 1000000
-    }
-    text = krill_to_latin(text.lower().replace('va', '').strip())
-    numeric_match = re.search(r'\b\d+\b', text)
-    if numeric_match:
-        try:
-            return int(numeric_match.group())
-        except ValueError:
-            pass
-    words = text.split()
-    number_words = []
-    for word in words:
-        if word in number_map:
-            number_words.append(word)
-        elif re.match(r'[\d]', word):
-            continue
-        else:
-            break
-    if not number_words:
-        return None
-    if len(number_words) == 1:
-        return number_map[number_words[0]]
-    total = 0
-    current = 0
-    for word in number_words:
-        num = number_map[word]
-        if num in [100, 1000, 1000000]:
-            if current == 0:
-                current = 1
-            total += current * num
-            current = 0
-        else:
-            current += num
-    total += current
-    return total if total > 0 else None
+        return LLM_UNAVAILABLE
 
 # Audio recording function
 def record_audio(duration=7, fs=44100):
@@ -167,28 +88,32 @@ def record_audio(duration=7, fs=44100):
     write(wav_temp.name, fs, audio)
     return wav_temp.name
 
-# TTS function using the provided API
-def text_to_speech(text):
-    url = "https://back.aisha.group/api/v1/tts/post/"
+# TTS voice settings; every one of them is part of the audio cache key
+TTS_VOICE = {'model': 'gulnoza', 'fmt': 'mp3', 'rate': '16000', 'quality': '64k', 'channels': 'stereo', 'language': 'uz'}
+tts_cache = TTSCache(os.path.join('uploads', 'tts_cache'))
+
+# Call the TTS API and download the generated audio
+def synthesize_speech(text):
+    url = http_client.aisha_url("/api/v1/tts/post/")
     headers = {
         "x-api-key": tts_api_key,
-        "X-Channels": "stereo",
-        "X-Quality": "64k",
-        "X-Rate": "16000",
-        "X-Format": "mp3"
+        "X-Channels": TTS_VOICE['channels'],
+        "X-Quality": TTS_VOICE['quality'],
+        "X-Rate": TTS_VOICE['rate'],
+        "X-Format": TTS_VOICE['fmt']
     }
     data = {
         "transcript": text,
-        "language": "uz",
-        "model": "gulnoza"
+        "language": TTS_VOICE['language'],
+        "model": TTS_VOICE['model']
     }
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = http_client.post(url, headers=headers, data=data)
         if response.status_code in (200, 201):
             response_data = response.json()
             audio_url = response_data.get("audio_path")
             if audio_url:
-                audio_response = requests.get(audio_url)
+                audio_response = http_client.get(audio_url)
                 if audio_response.status_code == 200:
                     return audio_response.content
                 else:
@@ -204,6 +129,19 @@ def text_to_speech(text):
         print(f"TTS error: {e}")
         return None
 
+# Templated replies are assembled from pre-rendered segments when they are all cached
+def render_speech(text):
+    audio = assemble_speech(text, lambda segment: tts_cache.get(make_key(segment, **TTS_VOICE)))
+    return audio or synthesize_speech(text)
+
+# TTS function using the provided API, shares the audio cache with the web app
+def text_to_speech(text):
+    return tts_cache.get_or_create(make_key(text, **TTS_VOICE), lambda: render_speech(text))
+
+# Replies are synthesized sentence by sentence; cached and templated replies are played whole
+tts_pipeline = TTSPipeline(text_to_speech, lambda text: make_key(text, **TTS_VOICE),
+                           keep_whole=lambda text: make_key(text, **TTS_VOICE) in tts_cache or speech_segments(text) is not None)
+
 # Function to play audio
 def play_audio(audio_content):
     try:
@@ -215,90 +153,87 @@ def play_audio(audio_content):
     except Exception as e:
         print(f"Error playing audio: {e}")
 
-# Gemini transcription function
+# Transcribe a recording with whichever STT provider answers first (see stt_providers)
 def generate_transcription(audiofile):
-    try:
-        genai.configure(api_key=gemini_api_key)
-        with open(audiofile, "rb") as audio_file:
-            audio_data = audio_file.read()
-            audio_base64 = base64.b64encode(audio_data).decode("utf-8")
-        audio_part = {
-            "inline_data": {
-                "mime_type": "audio/wav",
-                "data": audio_base64
-            }
-        }
-        prompt = "Transcribe the audio to Uzbek (Latin or Cyrillic) text only. Do not include explanations, metadata, or commentary."
-        response = genai.GenerativeModel('gemini-1.5-flash').generate_content([prompt, audio_part])
-        return clean_transcription(response.text)
-    except Exception as e:
-        return None
+    with open(audiofile, "rb") as audio_file:
+        audio_data = audio_file.read()
+    transcript, error = stt_router.transcribe(audio_data, os.path.basename(audiofile), "audio/wav")
+    return clean_transcription(transcript) if transcript else None
 
 # Chatbot class to manage state and interactions
 class BankChatbot:
     def __init__(self):
         self.chat_history = []
+        # Whether any of the last four messages was about credit
+        self.context = intents.DialogContext(window=4)
         self.waiting_for_id = False
         self.last_credit_amount = None
 
     def process_message(self, user_input):
         if not user_input:
-            return "Iltimos, aniq ovozli xabar yuboring yoki matn kiriting."
-        user_input = krill_to_latin(user_input.lower().strip())
+            return EMPTY_INPUT
+        user_input = normalize(user_input)
         self.chat_history.append({"role": "user", "content": user_input})
+        # Every intent of the message in one scan
+        flags = intents.scan(user_input)
+        self.context.add(flags)
 
         # Handle greetings
-        if is_greeting(user_input):
-            response = "Vaalaykum assalom! Sizga qanday yordam bera olaman?"
+        if flags & intents.GREETING:
+            response = GREETING_REPLY
         # Handle thanks
-        elif is_thanks(user_input):
-            response = "Arzimaydi! Sizga yordam bera olganimdan xursandman."
+        elif flags & intents.THANKS:
+            response = THANKS_REPLY
         # Handle bot info queries
-        elif is_bot_info_query(user_input):
-            if 'ism' in user_input or 'nomi' in user_input:
-                response = "Mening ismim Epsilion."
-            elif 'quruvchi' in user_input or 'ishlab chiqaruvchi' in user_input or 'developer' in user_input:
-                response = "Meni ishlab chiqaruvchimning taxallusi Neo."
+        elif flags & intents.BOT_INFO:
+            if flags & intents.BOT_NAME:
+                response = BOT_NAME
+            elif flags & intents.BOT_DEVELOPER:
+                response = BOT_DEVELOPER
             else:
-                response = "Men Epsilion, Neo tomonidan yaratilganman."
+                response = BOT_INFO
         # Handle credit reason queries
-        elif is_credit_reason_query(user_input) and self.last_credit_amount is not None:
-            response = "Mening kredit scoring modelim buni bashorat qildi."
+        elif flags & intents.REASON and flags & intents.KREDIT and self.last_credit_amount is not None:
+            response = CREDIT_REASON
         # Handle credit context
-        elif self.waiting_for_id or any(is_credit_query(msg["content"]) or "topilmadi" in msg["content"] for msg in self.chat_history[-4:]):
+        elif self.waiting_for_id or self.context.active:
             parsed_id = uzbek_text_to_number(user_input)
             if parsed_id is not None:
                 prediction = predict_limit_by_id(parsed_id)
                 if isinstance(prediction, str):
-                    response = f"ID {parsed_id} topilmadi. Iltimos, boshqa ID kiriting."
+                    response = TERMINAL_ID_NOT_FOUND.format(customer_id=parsed_id)
                     self.waiting_for_id = True
                 else:
                     self.last_credit_amount = prediction
-                    response = f"Sizga bir yil muddatga {prediction:.2f} dollar miqdorida kredit bera olamiz."
+                    response = TERMINAL_CREDIT_LIMIT.format(limit=prediction)
                     self.waiting_for_id = False
             else:
-                response = "To'g'ri ID raqamini kiriting (masalan, '1', 'bir', '127')."
+                response = TERMINAL_ASK_VALID_ID
                 self.waiting_for_id = True
         else:
-            if is_credit_query(user_input):
+            if flags & intents.CREDIT:
                 self.waiting_for_id = True
-                response = "Kredit limiti uchun ID raqamingizni kiriting (masalan, '1', 'bir', '127')."
+                response = TERMINAL_ASK_ID
             else:
-                prompt = f"Quyidagi ma'lumot asosida qisqa (50 so'zdan kam) va muloyim javob bering:\n{bank_info}\n\nSavol: {user_input}"
+                prompt = f"Quyidagi ma'lumot asosida qisqa (50 so'zdan kam) va muloyim javob bering:\n{knowledge.context(user_input)}\n\nSavol: {user_input}"
                 response = generate_response(prompt, self.chat_history)
 
         self.chat_history.append({"role": "assistant", "content": response})
+        self.context.add(intents.scan(response))
         if len(self.chat_history) > 20:
             self.chat_history = self.chat_history[-20:]
         
-        audio_content = text_to_speech(response)
-        if audio_content:
-            play_audio(audio_content)
+        # Each sentence plays as soon as it is ready while the next ones are still synthesizing
+        for _, audio_content in tts_pipeline.submit(response).results():
+            if audio_content:
+                play_audio(audio_content)
         
         return response
 
 # Main function to run the chatbot with voice input
 def main():
+    # Canned replies are synthesized in the background while the user types
+    Warmup(static_texts(), text_to_speech).start()
     chatbot = BankChatbot()
     print("Ipak Yo'li Bank Chatbotiga xush kelibsiz! Ovozli xabar (7 soniya) yoki matn yozing.")
     print("Chiqish uchun 'exit' yozing yoki ayting.")